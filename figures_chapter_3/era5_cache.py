@@ -0,0 +1,365 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    era5_cache.py                                      :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/07/07 10:31:46 by daniloceano       #+#    #+#              #
+#    Updated: 2024/07/07 10:31:46 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Local cache of the ERA5 pressure-level fields of the study cases.
+
+The fields are kept in one netCDF4 store per year (era5_<year>.nc in
+ERA5_CACHE_DIR), on the global 0.25-degree grid, hourly and on all ERA5
+pressure levels, chunked in 10 x 10 degree tiles of one time and level. Only
+the chunks that were written take disk space, and the points never retrieved
+keep the fill value (NaN), which ERA5 pressure-level fields do not have.
+
+era5_fields() is keyed by (variables, levels, area, time range, step): the
+request is sliced from the stores, and only the variables, times, levels and
+box of the points still missing are retrieved and written to the store.
+Overlapping study cases and animations therefore never download the same
+fields twice, and the fields of a request are decoded once per session.
+
+The missing pieces are requested as one request per month and group of
+variables (VARIABLE_GROUPS), which are downloaded concurrently by at most
+max_workers threads, each piece being written to the store as soon as it
+arrives. iter_era5_fields() retrieves the fields of the next study case of a
+batch while the current one is processed.
+
+The retrieval is a function retrieve(request, target) taking a CDS API
+request dictionary, given by era5_sources.data_source() ('cds', 'local' or
+'synthetic'). As netCDF-C/HDF5 is not thread-safe, the sources hold
+NETCDF_LOCK while reading or writing netCDF files, and only wait for the
+downloads concurrently.
+"""
+
+import os
+import math
+import threading
+import logging
+import numpy as np
+import pandas as pd
+import xarray as xr
+import netCDF4
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from xarray.backends.locks import HDF5_LOCK
+
+ERA5_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'presentation', 'data', 'era5_cache')
+DATASET = 'reanalysis-era5-pressure-levels'
+RESOLUTION = 0.25
+N_LAT, N_LON = 721, 1440
+TILE = 40  # grid points of the side of a chunk (10 degrees)
+ERA5_LEVELS = [1, 2, 3, 5, 7, 10, 20, 30, 50, 70, 100, 125, 150, 175, 200, 225, 250, 300, 350,
+               400, 450, 500, 550, 600, 650, 700, 750, 775, 800, 825, 850, 875, 900, 925, 950, 975, 1000]
+# CDS API names of the variables and their short names in the netCDF files
+ERA5_VARIABLES = {
+    'u_component_of_wind': 'u',
+    'v_component_of_wind': 'v',
+    'temperature': 't',
+    'geopotential': 'z',
+    'vertical_velocity': 'w',
+    'specific_humidity': 'q',
+    'relative_humidity': 'r',
+}
+# Variables retrieved together, in one request per month
+VARIABLE_GROUPS = {
+    'wind': ['u_component_of_wind', 'v_component_of_wind', 'vertical_velocity'],
+    'mass': ['temperature', 'geopotential'],
+    'moisture': ['specific_humidity', 'relative_humidity'],
+}
+MAX_DOWNLOADS = 4  # concurrent requests
+# netCDF-C/HDF5 is not thread-safe: every file read or written by the cache and
+# by the sources holds this lock, only the downloads run concurrently
+NETCDF_LOCK = threading.Lock()
+
+_loaded = {}
+
+def snap_area(area):
+    """
+    (north, west, south, east) of a request, expanded to the 0.25-degree grid.
+    """
+    north, west, south, east = area
+    north = min(math.ceil(north / RESOLUTION) * RESOLUTION, 90.)
+    south = max(math.floor(south / RESOLUTION) * RESOLUTION, -90.)
+    west = math.floor(west / RESOLUTION) * RESOLUTION
+    east = math.ceil(east / RESOLUTION) * RESOLUTION
+    if not -180 <= west <= east < 180:
+        raise ValueError(f"Longitudes of {area} must be within [-180, 180) and not cross the antimeridian")
+    return north, west, south, east
+
+def request_times(start, end, step):
+    """
+    Times of the days start..end at 00, step, 2 * step, ... hours, as the
+    '00/to/23/by/<step>' of a CDS request.
+    """
+    times = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize() + pd.Timedelta(hours=23),
+                          freq='h')
+    return times[times.hour % int(step) == 0]
+
+def _grid_slices(area):
+    north, west, south, east = area
+    i0, i1 = int(round((90 - north) / RESOLUTION)), int(round((90 - south) / RESOLUTION)) + 1
+    j0, j1 = int(round((west + 180) / RESOLUTION)), int(round((east + 180) / RESOLUTION)) + 1
+    return slice(i0, i1), slice(j0, j1)
+
+def store_path(year, cache_dir=ERA5_CACHE_DIR):
+    return os.path.join(cache_dir, f'era5_{year}.nc')
+
+def _open_store(year, cache_dir, mode='a'):
+    path = store_path(year, cache_dir)
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        nc = netCDF4.Dataset(path, 'w')
+        hours = pd.date_range(f'{year}-01-01', f'{year}-12-31 23:00', freq='h')
+        nc.createDimension('time', len(hours))
+        nc.createDimension('level', len(ERA5_LEVELS))
+        nc.createDimension('latitude', N_LAT)
+        nc.createDimension('longitude', N_LON)
+        time = nc.createVariable('time', 'i4', ('time',))
+        time.units = f'hours since {year}-01-01 00:00:00'
+        time[:] = np.arange(len(hours))
+        nc.createVariable('level', 'i4', ('level',))[:] = ERA5_LEVELS
+        nc.createVariable('latitude', 'f4', ('latitude',))[:] = 90 - RESOLUTION * np.arange(N_LAT)
+        nc.createVariable('longitude', 'f4', ('longitude',))[:] = -180 + RESOLUTION * np.arange(N_LON)
+        nc.close()
+    nc = netCDF4.Dataset(path, mode)
+    nc.set_auto_mask(False)
+    return nc
+
+def _store_variable(nc, name, attrs=None):
+    if name not in nc.variables:
+        variable = nc.createVariable(name, 'f4', ('time', 'level', 'latitude', 'longitude'),
+                                     chunksizes=(1, 1, TILE, TILE), fill_value=np.float32(np.nan))
+        variable.setncatts({key: value for key, value in (attrs or {}).items() if not key.startswith('_')})
+    return nc.variables[name]
+
+def _time_indices(times, year):
+    return ((times - pd.Timestamp(f'{year}-01-01')) // pd.Timedelta(hours=1)).to_numpy()
+
+def _missing_request(fields, levels):
+    # One CDS request covering all the points missing in the fields read from a store
+    names = [name for name in fields.data_vars if fields[name].isnull().any()]
+    if not names:
+        return None
+    mask = np.logical_or.reduce([fields[name].isnull().values for name in names])
+    times = pd.DatetimeIndex(fields['time'].values)[mask.any(axis=(1, 2, 3))]
+    missing_levels = [level for level, m in zip(levels, mask.any(axis=(0, 2, 3))) if m]
+    lats = fields['latitude'].values[mask.any(axis=(0, 1, 3))]
+    lons = fields['longitude'].values[mask.any(axis=(0, 1, 2))]
+    short_to_cds = {short: cds for cds, short in ERA5_VARIABLES.items()}
+    return {
+        'product_type': 'reanalysis',
+        'format': 'netcdf',
+        'variable': [short_to_cds[name] for name in names],
+        'pressure_level': [str(level) for level in missing_levels],
+        'date': sorted(set(times.strftime('%Y-%m-%d'))),
+        'time': sorted(set(times.strftime('%H:00'))),
+        'area': [float(lats.max()), float(lons.min()), float(lats.min()), float(lons.max())],
+    }
+
+def missing_requests(fields, levels):
+    """
+    Requests of the points missing in the fields read from a store, one per
+    month and group of variables (VARIABLE_GROUPS).
+    """
+    requests = []
+    months = pd.DatetimeIndex(fields['time'].values).month
+    for month in np.unique(months):
+        month_fields = fields.isel(time=np.flatnonzero(months == month))
+        for group in VARIABLE_GROUPS.values():
+            names = [ERA5_VARIABLES[variable] for variable in group if ERA5_VARIABLES[variable] in fields.data_vars]
+            request = _missing_request(month_fields[names], levels) if names else None
+            if request is not None:
+                requests.append(request)
+    return requests
+
+def normalize_fields(ds, levels=None):
+    """
+    ERA5 fields with dimensions (time, level, latitude, longitude), latitudes
+    descending, longitudes in [-180, 180) and levels ascending, from the files
+    of the old and new CDS API (valid_time, pressure_level) or of a single level
+    (no level dimension, levels must be given).
+    """
+    ds = ds.rename({name: new for name, new in {'valid_time': 'time', 'pressure_level': 'level'}.items()
+                    if name in ds.variables})
+    ds = ds.drop_vars([name for name in ('number', 'expver') if name in ds.variables])
+    if 'level' not in ds.dims:
+        if 'level' in ds.coords:
+            ds = ds.expand_dims('level')
+        else:
+            ds = ds.expand_dims(level=[int(level) for level in levels])
+    if float(ds['longitude'].max()) >= 180:
+        ds = ds.assign_coords(longitude=((ds['longitude'] + 180) % 360) - 180)
+    ds = ds.sortby('level').sortby('latitude', ascending=False).sortby('longitude')
+    return ds.transpose('time', 'level', 'latitude', 'longitude')
+
+def _write_fields(nc, fields, year):
+    fields = fields.sel(time=fields['time'].dt.year == year)
+    lat_slice, lon_slice = _grid_slices((float(fields['latitude'][0]), float(fields['longitude'][0]),
+                                         float(fields['latitude'][-1]), float(fields['longitude'][-1])))
+    time_indices = _time_indices(pd.DatetimeIndex(fields['time'].values), year)
+    level_indices = [ERA5_LEVELS.index(int(level)) for level in fields['level'].values]
+    for name in fields.data_vars:
+        variable = _store_variable(nc, name, fields[name].attrs)
+        values = fields[name].values.astype(np.float32)
+        for t, time_index in enumerate(time_indices):
+            for k, level_index in enumerate(level_indices):
+                variable[time_index, level_index, lat_slice, lon_slice] = values[t, k]
+
+def _read_fields(nc, short_names, levels, level_indices, times, year, lat_slice, lon_slice):
+    time_indices = _time_indices(times, year)
+    coords = {'time': times, 'level': levels,
+              'latitude': nc.variables['latitude'][lat_slice], 'longitude': nc.variables['longitude'][lon_slice]}
+    shape = (len(times), len(levels), lat_slice.stop - lat_slice.start, lon_slice.stop - lon_slice.start)
+    data_vars = {}
+    for name in short_names:
+        if name in nc.variables:
+            variable = nc.variables[name]
+            values = variable[time_indices, level_indices, lat_slice, lon_slice]
+            attrs = {key: variable.getncattr(key) for key in variable.ncattrs() if key != '_FillValue'}
+        else:
+            values, attrs = np.full(shape, np.nan, dtype=np.float32), {}
+        data_vars[name] = xr.DataArray(values, dims=('time', 'level', 'latitude', 'longitude'), coords=coords,
+                                       attrs=attrs)
+    return xr.Dataset(data_vars)
+
+def _read_year(short_names, levels, times, year, lat_slice, lon_slice, cache_dir):
+    # Raw netCDF4 calls also hold the lock of xarray, taken after NETCDF_LOCK by the xarray calls
+    with NETCDF_LOCK, HDF5_LOCK:
+        nc = _open_store(year, cache_dir)
+        try:
+            return _read_fields(nc, short_names, levels, [ERA5_LEVELS.index(level) for level in levels],
+                                times, year, lat_slice, lon_slice)
+        finally:
+            nc.close()
+
+def _retrieve_pieces(pieces, retrieve, cache_dir, max_workers):
+    # Downloads the (year, request) pieces concurrently, writing each one to its store when it arrives
+    os.makedirs(cache_dir, exist_ok=True)
+    targets = [os.path.join(cache_dir, f'retrieve_{os.getpid()}_{id(pieces)}_{i}.nc') for i in range(len(pieces))]
+
+    def fetch(request, target):
+        logging.info(f"Retrieving {request['variable']} at {request['pressure_level']} hPa, "
+                     f"{request['date'][0]} to {request['date'][-1]}, area {request['area']}...")
+        retrieve(request, target)
+        if not os.path.exists(target):
+            raise FileNotFoundError("CDS API file not created.")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pieces)))) as executor:
+            futures = {executor.submit(fetch, request, target): (year, request, target)
+                       for (year, request), target in zip(pieces, targets)}
+            try:
+                for future in as_completed(futures):
+                    year, request, target = futures[future]
+                    future.result()
+                    with NETCDF_LOCK:
+                        with xr.open_dataset(target) as fetched:
+                            fields = normalize_fields(fetched, request['pressure_level']).load()
+                    with NETCDF_LOCK, HDF5_LOCK:
+                        nc = _open_store(year, cache_dir)
+                        try:
+                            _write_fields(nc, fields, year)
+                        finally:
+                            nc.close()
+                    os.remove(target)
+            except BaseException:
+                # The pieces not started yet are not downloaded
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        # Files of the pieces that failed or were not written to the store
+        for target in targets:
+            if os.path.exists(target):
+                os.remove(target)
+
+def era5_fields(variables, levels, area, start, end, step, retrieve=None, cache_dir=ERA5_CACHE_DIR,
+                max_workers=MAX_DOWNLOADS):
+    """
+    ERA5 pressure-level fields, from the cache or retrieved and cached.
+
+    Parameters:
+    - variables: CDS API names of the variables (keys of ERA5_VARIABLES).
+    - levels: Pressure levels (hPa). With a single level, the fields have no
+      level dimension, as the files of a single-level CDS request.
+    - area: (north, west, south, east), as the 'area' of a CDS request.
+    - start, end: First and last days.
+    - step: Hours between times (as '00/to/23/by/<step>').
+    - retrieve: Function retrieve(request, target) for the missing pieces
+      (default: era5_sources.cds_retrieve).
+    - max_workers: Number of pieces retrieved concurrently.
+
+    Returns:
+    - xr.Dataset with the short names of the variables (u, v, z, ...) and
+      dimensions time, level, latitude and longitude.
+    """
+    if retrieve is None:
+        from era5_sources import cds_retrieve
+        retrieve = cds_retrieve
+    area = snap_area(area)
+    levels = sorted(int(level) for level in levels)
+    key = (tuple(variables), tuple(levels), area, pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(),
+           int(step), os.path.abspath(cache_dir))
+    if key in _loaded:
+        return _loaded[key]
+
+    short_names = [ERA5_VARIABLES[variable] for variable in variables]
+    lat_slice, lon_slice = _grid_slices(area)
+    times = request_times(start, end, step)
+    years = sorted(set(times.year))
+
+    def read(year):
+        return _read_year(short_names, levels, times[times.year == year], year, lat_slice, lon_slice, cache_dir)
+
+    fields = {year: read(year) for year in years}
+    pieces = [(year, request) for year in years for request in missing_requests(fields[year], levels)]
+    if pieces:
+        _retrieve_pieces(pieces, retrieve, cache_dir, max_workers)
+        fields = {year: read(year) for year in years}
+        for year in years:
+            if missing_requests(fields[year], levels):
+                raise FileNotFoundError(f"Retrieved data do not cover the request of {variables}, {levels} hPa, "
+                                        f"{area}, {year}")
+
+    datasets = [fields[year] for year in years]
+    ds = xr.concat(datasets, dim='time') if len(datasets) > 1 else datasets[0]
+    if len(levels) == 1:
+        ds = ds.squeeze('level')
+    _loaded[key] = ds
+    return ds
+
+def clear_loaded():
+    """
+    Forgets the fields decoded in this session (the stores are kept).
+    """
+    _loaded.clear()
+
+def iter_era5_fields(cases, **kwargs):
+    """
+    Fields of a batch of study cases, the next case being retrieved in the
+    background while the current one is processed.
+
+    Parameters:
+    - cases: (variables, levels, area, start, end, step) of each case.
+    - kwargs: Keyword arguments of era5_fields (retrieve, cache_dir, max_workers).
+
+    Yields:
+    - (case, fields) in the order of cases.
+    """
+    cases = list(cases)
+    if not cases:
+        return
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        future = prefetch.submit(era5_fields, *cases[0], **kwargs)
+        for i, case in enumerate(cases):
+            fields = future.result()
+            if i + 1 < len(cases):
+                future = prefetch.submit(era5_fields, *cases[i + 1], **kwargs)
+            yield case, fields
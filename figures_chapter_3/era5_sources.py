@@ -0,0 +1,207 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    era5_sources.py                                    :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/07/08 09:14:27 by daniloceano       #+#    #+#              #
+#    Updated: 2024/07/08 09:14:27 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Sources of the ERA5 pressure-level fields retrieved by era5_cache.
+
+A source is a function retrieve(request, target) that writes the fields of a
+CDS API request dictionary ('variable', 'pressure_level', 'date', 'time',
+'area') to the netCDF file target. data_source(name, **options) returns the
+source registered in DATA_SOURCES:
+
+- 'cds': downloads from the Climate Data Store with cdsapi.
+- 'local' (directory): slices the request from the netCDF files or Zarr
+  stores of a directory, as a stand-in for the CDS API when working offline.
+- 'synthetic' (latency, seed): analytic fields with plausible magnitudes,
+  optionally waiting latency seconds per request to emulate a download.
+
+The sources are called from the worker threads of era5_cache, so they must
+not share state between calls, and must hold era5_cache.NETCDF_LOCK while
+reading or writing netCDF files (netCDF-C/HDF5 is not thread-safe). Running this module benchmarks the cache and
+the concurrent retrievals offline with the synthetic source.
+"""
+
+import os
+import glob
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from era5_cache import (DATASET, ERA5_VARIABLES, MAX_DOWNLOADS, NETCDF_LOCK, clear_loaded, era5_fields,
+                        iter_era5_fields, normalize_fields)
+
+# Level profile (function of the pressure, hPa) and wave amplitude of the synthetic fields
+SYNTHETIC_FIELDS = {
+    'u': (lambda p: 5 + 25 * (1 - p / 1000), 10),
+    'v': (lambda p: 0 * p, 10),
+    't': (lambda p: 288 * (p / 1013.25) ** 0.19, 5),
+    'z': (lambda p: 9.80665 * 7400 * np.log(1013.25 / p), 600),
+    'w': (lambda p: 0 * p, 0.5),
+    'q': (lambda p: 0.012 * (p / 1000) ** 3, 0.002),
+    'r': (lambda p: 40 + 40 * p / 1000, 20),
+}
+
+def request_coords(request):
+    """
+    Short names, levels, times and (north, west, south, east) of a request.
+    """
+    short_names = [ERA5_VARIABLES[variable] for variable in request['variable']]
+    levels = [int(level) for level in request['pressure_level']]
+    times = pd.DatetimeIndex([pd.Timestamp(f"{date} {time}") for date in request['date']
+                              for time in request['time']])
+    return short_names, levels, times, tuple(request['area'])
+
+def cds_retrieve(request, target):
+    """
+    Downloads a request of DATASET with the CDS API (the file is only
+    written, not decoded, so no lock is needed).
+    """
+    import cdsapi
+
+    cdsapi.Client(timeout=600).retrieve(DATASET, request, target)
+
+def _open_local(path):
+    if path.endswith('.zarr'):
+        return xr.open_zarr(path)
+    return xr.open_dataset(path)
+
+def local_retrieve(directory):
+    """
+    Stand-in for the CDS API: retrieve(request, target) writes the request
+    sliced from the first netCDF file (*.nc) or Zarr store (*.zarr) of
+    directory that covers it.
+    """
+    def retrieve(request, target):
+        short_names, levels, times, (north, west, south, east) = request_coords(request)
+        paths = sorted(glob.glob(os.path.join(directory, '*.nc')) + glob.glob(os.path.join(directory, '*.zarr')))
+        for path in paths:
+            with NETCDF_LOCK, _open_local(path) as ds:
+                ds = normalize_fields(ds, levels)
+                if not (set(short_names) <= set(ds.data_vars) and set(levels) <= set(ds['level'].values.tolist())
+                        and times.isin(ds['time'].values).all()
+                        and float(ds['latitude'].max()) >= north and float(ds['latitude'].min()) <= south
+                        and float(ds['longitude'].min()) <= west and float(ds['longitude'].max()) >= east):
+                    continue
+                subset = ds[short_names].sel(time=times, level=levels, latitude=slice(north, south),
+                                             longitude=slice(west, east))
+                subset.load().to_netcdf(target)
+                return
+        raise FileNotFoundError(f"No file in {directory} covers the request {request}")
+    return retrieve
+
+def synthetic_fields(short_names, levels, times, latitudes, longitudes, seed=0):
+    """
+    Analytic fields: a level profile plus a wave travelling eastward, the same
+    at a given point whatever the request it belongs to.
+    """
+    hours = ((times - pd.Timestamp('1979-01-01')) / pd.Timedelta(hours=1)).to_numpy()
+    pressure = np.asarray(levels, dtype=float)[None, :, None, None]
+    phase = np.deg2rad(4 * longitudes[None, None, None, :] - 2 * hours[:, None, None, None] + 37 * seed)
+    wave = np.sin(phase) * np.cos(np.deg2rad(3 * latitudes[None, None, :, None]))
+    data_vars = {}
+    for name in short_names:
+        profile, amplitude = SYNTHETIC_FIELDS[name]
+        data_vars[name] = (('valid_time', 'pressure_level', 'latitude', 'longitude'),
+                           (profile(pressure) + amplitude * wave).astype(np.float32))
+    # Dimension names of the files of the current CDS API
+    return xr.Dataset(data_vars, coords={'valid_time': times, 'pressure_level': levels,
+                                         'latitude': latitudes, 'longitude': longitudes})
+
+def synthetic_retrieve(latency=0, seed=0):
+    """
+    Source of synthetic fields, waiting latency seconds per request.
+    """
+    def retrieve(request, target):
+        short_names, levels, times, (north, west, south, east) = request_coords(request)
+        latitudes = north - 0.25 * np.arange(int(round((north - south) / 0.25)) + 1)
+        longitudes = west + 0.25 * np.arange(int(round((east - west) / 0.25)) + 1)
+        time.sleep(latency)
+        fields = synthetic_fields(short_names, levels, times, latitudes, longitudes, seed)
+        with NETCDF_LOCK:
+            fields.to_netcdf(target)
+    return retrieve
+
+DATA_SOURCES = {
+    'cds': lambda: cds_retrieve,
+    'local': local_retrieve,
+    'synthetic': synthetic_retrieve,
+}
+
+def data_source(name, **options):
+    """
+    Retrieve function of a source of DATA_SOURCES ('cds', 'local' or
+    'synthetic'), with its options (e.g., directory='../data').
+    """
+    if name not in DATA_SOURCES:
+        raise ValueError(f"Unknown data source {name}, options are {list(DATA_SOURCES)}")
+    return DATA_SOURCES[name](**options)
+
+def _batch_cases(n_cases):
+    # Overlapping cases spanning two months each, drifting eastward
+    variables = ['u_component_of_wind', 'v_component_of_wind', 'temperature', 'geopotential']
+    levels = [500, 850]
+    return [(variables, levels, (-20, -60 + 5 * i, -45, -30 + 5 * i),
+             f'1990-{2 * i + 1:02d}-25', f'1990-{2 * i + 2:02d}-03', 6) for i in range(n_cases)]
+
+def benchmark(n_cases=4, latency=0.5, workers=(1, MAX_DOWNLOADS)):
+    """
+    Times a batch of study cases retrieved from the synthetic source into an
+    empty cache with each number of workers, and read again from the stores.
+    """
+    cases = _batch_cases(n_cases)
+    retrieve = data_source('synthetic', latency=latency)
+    for max_workers in workers:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            start = time.perf_counter()
+            for case, fields in iter_era5_fields(cases, retrieve=retrieve, cache_dir=cache_dir,
+                                                 max_workers=max_workers):
+                float(fields['t'].mean())
+            cold = time.perf_counter() - start
+
+            clear_loaded()
+            start = time.perf_counter()
+            for case in cases:
+                era5_fields(*case, retrieve=retrieve, cache_dir=cache_dir)
+            warm = time.perf_counter() - start
+            clear_loaded()
+        print(f"{n_cases} cases, {max_workers} workers: {cold:.2f} s from the source ({latency} s per request), "
+              f"{warm:.2f} s from the cache")
+
+def check_concurrent_runs(runs=10, n_cases=4, max_workers=MAX_DOWNLOADS):
+    """
+    Retrieves a batch of study cases from the synthetic source into an empty
+    cache runs times, with max_workers concurrent requests and no latency,
+    and checks the fields of every case against the synthetic fields.
+    """
+    cases = _batch_cases(n_cases)
+    retrieve = data_source('synthetic')
+    for run in range(runs):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for (variables, levels, *_), fields in iter_era5_fields(cases, retrieve=retrieve, cache_dir=cache_dir,
+                                                                    max_workers=max_workers):
+                expected = synthetic_fields(list(fields.data_vars), levels, pd.DatetimeIndex(fields['time'].values),
+                                            fields['latitude'].values, fields['longitude'].values)
+                for name in fields.data_vars:
+                    amplitude = SYNTHETIC_FIELDS[name][1]
+                    if not np.allclose(fields[name].values, expected[name].values, rtol=1e-5, atol=1e-3 * amplitude):
+                        raise AssertionError(f"Run {run}: cached {name} differs from the synthetic field")
+            clear_loaded()
+    print(f"{runs} concurrent runs of {n_cases} cases with {max_workers} workers: fields match")
+
+def main():
+    benchmark()
+    check_concurrent_runs()
+
+if __name__ == "__main__":
+    main()
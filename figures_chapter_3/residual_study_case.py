@@ -10,7 +10,6 @@
 #                                                                              #
 # **************************************************************************** #
 
-import cdsapi
 import math
 import xarray as xr
 import os
@@ -36,6 +35,9 @@ from metpy.constants import g
 from cyclophaser import determine_periods
 from cyclophaser.determine_periods import periods_to_dict, process_vorticity
 
+from era5_cache import era5_fields
+from era5_sources import data_source
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -43,6 +45,9 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 TRACKS_DIRECTORY = "/Users/danilocoutodesouza/Documents/Programs_and_scripts/SWSA-cyclones_energetic-analysis/processed_tracks_with_periods/"
 STUDY_CASE = 19820697 #19920876
 CRS = ccrs.PlateCarree() 
+# Source of the ERA5 fields: 'cds', 'local' (directory=...) or 'synthetic', and its options
+ERA5_SOURCE = 'cds'
+ERA5_SOURCE_OPTIONS = {}
 OUTPUT_DIRECTORY = './'
 
 # Define the custom colormap
@@ -55,12 +60,12 @@ custom_cmap = LinearSegmentedColormap.from_list(cmap_name, colors_cmap, N=9)
 color_dots = ['#d62828', '#9aa981', 'gray']
 labels = ["(A)", "(B)", "(C)", "(D)", "(E)"]
 
-def get_cdsapi_data(track, infile) -> xr.Dataset:
+def get_cdsapi_data(track) -> xr.Dataset:
     """
-    Retrieves weather data from the Copernicus Climate Data Store for a given track.
+    Retrieves weather data from the Copernicus Climate Data Store for a given track,
+    through the local ERA5 cache.
     Args:
         track (pd.DataFrame): The track data for the weather event.
-        infile (str): The name of the file to save the downloaded data.
     Returns:
         xr.Dataset: The retrieved dataset.
     """
@@ -74,8 +79,8 @@ def get_cdsapi_data(track, infile) -> xr.Dataset:
     buffered_min_lat = math.floor(min_lat - 15)
     buffered_max_lon = math.ceil(max_lon + 15)
 
-    # Define the area for the request
-    area = f"{buffered_max_lat}/{buffered_min_lon}/{buffered_min_lat}/{buffered_max_lon}"
+    # Define the area for the request (north, west, south, east)
+    area = (buffered_max_lat, buffered_min_lon, buffered_min_lat, buffered_max_lon)
 
     pressure_levels = ['850']
     
@@ -93,33 +98,12 @@ def get_cdsapi_data(track, infile) -> xr.Dataset:
     logging.info(f"Buffered Data Bounds: min_lon: {buffered_min_lon}, max_lon: {buffered_max_lon}, min_lat: {buffered_min_lat}, max_lat: {buffered_max_lat}")
     logging.info(f"Requesting data for time range: {time_range}, and time step: {time_step}...")
 
-    # Load ERA5 data
-    logging.info("Retrieving data from CDS API...")
-    c = cdsapi.Client()
-    try:
-        c.retrieve(
-            "reanalysis-era5-pressure-levels",
-            {
-                "product_type": "reanalysis",
-                "format": "netcdf",
-                "pressure_level": pressure_levels,
-                "date": time_range,
-                "area": area,
-                'time': f'00/to/23/by/{time_step}',
-                "variable": variables,
-            }, infile
-        )
-    except Exception as e:
-        logging.error(f"Error retrieving data from CDS API: {e}")
-        raise
-
-    if not os.path.exists(infile):
-        raise FileNotFoundError("CDS API file not created.")
-    
+    # Load ERA5 data, retrieving only what is not in the local cache
+    retrieve = data_source(ERA5_SOURCE, **ERA5_SOURCE_OPTIONS)
     try:
-        ds = xr.open_dataset(infile)
+        ds = era5_fields(variables, pressure_levels, area, start_date, end_date, time_step, retrieve)
     except Exception as e:
-        logging.error(f"Error opening dataset: {e}")
+        logging.error(f"Error retrieving ERA5 data: {e}")
         raise
 
     return ds
@@ -247,16 +231,12 @@ def main():
         return
 
     track = tracks[tracks['track_id'] == STUDY_CASE]
-    infile = f"{STUDY_CASE}.nc"
-
-    if not os.path.exists(infile):
-        try:
-            ds = get_cdsapi_data(track, infile)
-        except FileNotFoundError as e:
-            logging.error(e)
-            return
-    else:
-        ds = xr.open_dataset(infile)
+
+    try:
+        ds = get_cdsapi_data(track)
+    except FileNotFoundError as e:
+        logging.error(e)
+        return
 
     # Data processing and visualization
     ds = ds.sel(time=slice(track['date'].min(), track['date'].max()))
@@ -2,6 +2,10 @@ import os
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+import sys
+
+sys.path.append('../src_chapter_5')
+from energetics_eofs import load_pcs
 
 def get_season(month):
     if month in [12, 1, 2]:
@@ -25,7 +29,7 @@ PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
 suffix = "q10"
 
 track_path = f'{PATH}/tracks_SAt_filtered/tracks_SAt_filtered_with_periods.csv'
-pcs_path = f'{PATH}/csv_eofs_energetics_with_track/Total/pcs_with_dominant_eof_{suffix}.csv'
+base_path = f'{PATH}/csv_database_energy_by_periods'
 
 # Criar diretório para salvar as figuras
 output_dir = f'figures/eof_statistics_{suffix}'
@@ -33,7 +37,7 @@ os.makedirs(output_dir, exist_ok=True)
 
 # Carregar os dados
 tracks = pd.read_csv(track_path)
-pcs = pd.read_csv(pcs_path)
+pcs = load_pcs(base_path, suffix)
 
 # Converter a coluna 'date' para datetime
 tracks['date'] = pd.to_datetime(tracks['date'])
@@ -4,6 +4,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from geopy.distance import geodesic
+import sys
+
+sys.path.append('../src_chapter_5')
+from energetics_eofs import load_pcs
 
 # Configurar estilo para publicação científica
 sns.set_context("notebook", font_scale=1.5)
@@ -25,6 +29,7 @@ season_colors = {
 
 # Caminhos para os arquivos
 PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
+base_path = f'{PATH}/csv_database_energy_by_periods'
 
 suffixes = ["q90", "q10"]
 data = {}
@@ -36,11 +41,10 @@ os.makedirs(output_dir, exist_ok=True)
 # Carregar e processar os dados para q90 e q10
 for suffix in suffixes:
     track_path = f'{PATH}/tracks_SAt_filtered/tracks_SAt_filtered_with_periods.csv'
-    pcs_path = f'{PATH}/csv_eofs_energetics_with_track/Total/pcs_with_dominant_eof_{suffix}.csv'
     
     # Carregar os dados
     tracks = pd.read_csv(track_path)
-    pcs = pd.read_csv(pcs_path)
+    pcs = load_pcs(base_path, suffix)
 
     # Converter a coluna 'date' para datetime
     tracks['date'] = pd.to_datetime(tracks['date'])
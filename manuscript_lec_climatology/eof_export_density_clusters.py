@@ -11,34 +11,19 @@
 # **************************************************************************** #
 
 import os
+import sys
 import pandas as pd
 import xarray as xr
 import numpy as np
 
 from glob import glob
-from sklearn.neighbors import KernelDensity
 from tqdm import tqdm
 
-def compute_density(tracks, num_time):
-    k = 64
-    longrd = np.linspace(-180, 180, 2 * k)
-    latgrd = np.linspace(-87.863, 87.863, k)
-    tx, ty = np.meshgrid(longrd, latgrd)
-    mesh = np.vstack((ty.ravel(), tx.ravel())).T
-    mesh *= np.pi / 180.  # Convert to radians
-
-    pos = tracks[['lat vor', 'lon vor']]
-    h = np.vstack([pos['lat vor'].values, pos['lon vor'].values]).T
-    h *= np.pi / 180.  # Convert to radians
-
-    kde = KernelDensity(bandwidth=0.05, metric='haversine', kernel='gaussian', algorithm='ball_tree').fit(h)
-    v = np.exp(kde.score_samples(mesh)).reshape((k, 2 * k))
+sys.path.append('../src_chapter_4')
+from track_density import track_density
 
-    R = 6369345.0 * 1e-3  # Earth radius in km
-    factor = (1 / (R ** 2)) * 1.e6
-    density = v * pos.shape[0] * factor / num_time
-
-    return density, longrd, latgrd
+def compute_density(tracks, num_time):
+    return track_density(tracks['lat vor'].values, tracks['lon vor'].values, num_time)
 
 def export_density_by_cluster(tracks, num_time, output_directory):
     unique_clusters = tracks['cluster'].unique()
@@ -2,6 +2,10 @@ import os
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+import sys
+
+sys.path.append('../src_chapter_5')
+from energetics_eofs import load_pcs
 
 # Configurar estilo dos gráficos
 sns.set_context("notebook", font_scale=1.5)
@@ -25,7 +29,7 @@ region_colors = {
 # Caminhos para os arquivos
 PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
 track_path = f'{PATH}/tracks_SAt_filtered/tracks_SAt_filtered_with_periods.csv'
-pcs_path = f'{PATH}/csv_eofs_energetics_with_track/Total/pcs.csv'
+base_path = f'{PATH}/csv_database_energy_by_periods'
 
 # Criar diretório para salvar as figuras
 output_dir = 'figures/eof_intense_systems'
@@ -33,7 +37,7 @@ os.makedirs(output_dir, exist_ok=True)
 
 # Carregar os dados
 tracks = pd.read_csv(track_path)
-pcs = pd.read_csv(pcs_path)
+pcs = load_pcs(base_path)
 
 # Converter a coluna 'date' para datetime
 tracks['date'] = pd.to_datetime(tracks['date'])
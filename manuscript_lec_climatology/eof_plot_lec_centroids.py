@@ -1,5 +1,10 @@
+import sys
 import pandas as pd
-from plot_LEC_std import plot_lorenzcycletoolkit_with_std, read_life_cycles
+from plot_LEC_std import plot_lorenzcycletoolkit_with_std
+
+sys.path.append('../src_chapter_5')
+from energetics_store import load_energetics
+from energetics_eofs import energetics_eofs, eofs_table
 
 if __name__ == "__main__":
 
@@ -17,25 +22,16 @@ if __name__ == "__main__":
     # Caminhos dos arquivos
     PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
     figures_directory = "./figures/eof_clusters_intense/"
-    eofs_path = f'{PATH}/csv_eofs_energetics_with_track/Total/eofs.csv'
     centroids_path = f'{figures_directory}/cluster_centroids.csv'
     base_path = f'{PATH}/csv_database_energy_by_periods'
     pcs_with_clusters_path = f'{figures_directory}/pcs_with_clusters.csv'
 
-    # Carregar os dados dos tracks
-    systems_energetics = read_life_cycles(base_path)
+    # Carregar os dados dos tracks, mantendo o id do sistema e a fase
+    all_data = load_energetics(base_path).rename(columns={'phase': 'Phase'})
 
     # Carregar os dados das PCs
     pcs_with_clusters = pd.read_csv(pcs_with_clusters_path)
 
-    # Concatenate all systems' dataframes while retaining the system id and phase
-    all_data = pd.concat([df.assign(system_id=system_id) for system_id, df in systems_energetics.items()])
-    all_data.rename(columns={'Unnamed: 0': 'Phase'}, inplace=True)
-    
-    # Convert relevant columns to numeric, forcing errors to NaN
-    relevant_columns = ['system_id'] + [col for col in all_data.columns if col.startswith(tuple(terms_prefix))]
-    all_data[relevant_columns] = all_data[relevant_columns].apply(pd.to_numeric, errors='coerce')
-    
     # Compute mean across all phases for each system
     mean_data = all_data.drop('Phase', axis=1).groupby('system_id').mean().reset_index().mean().drop('system_id')
 
@@ -43,7 +39,7 @@ if __name__ == "__main__":
     mean_data = mean_data.rename(lambda x: x.replace(" (finite diff.)", ""))
 
     # Carregar os dados
-    eofs = pd.read_csv(eofs_path)
+    eofs = eofs_table(energetics_eofs(base_path))
     centroids = pd.read_csv(centroids_path)
 
     # Verificar dimensões
@@ -2,59 +2,99 @@ import os
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from yellowbrick.cluster import KElbowVisualizer
+import sys
+
+sys.path.append('../src_chapter_5')
+from energetics_eofs import load_pcs
+from pc_clusters import (K_RANGE, cluster_centroids, fit_clusters, load_cluster_model, predict_clusters,
+                         save_cluster_model)
+
+# Sistemas clusterizados: 'q99' (sistemas intensos) ou 'all' (todas as PCs)
+SUBSET = 'q99'
+
+# Refazer a escolha de k e o ajuste; senão, o modelo salvo apenas classifica os sistemas
+REFIT = False
 
 # Caminho dos arquivos
 PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
-pcs_path = f'{PATH}/csv_eofs_energetics_with_track/Total/pcs.csv'
-output_dir = 'figures/eof_clusters_intense'
+base_path = f'{PATH}/csv_database_energy_by_periods'
+output_dir = 'figures/eof_clusters_intense' if SUBSET == 'q99' else 'figures/eof_clusters_all'
+model_path = f'{output_dir}/kmeans_model.npz'
+
+def plot_k_selection(selection, output_dir):
+    scores = selection.scores
+
+    # Método do cotovelo, como o KElbowVisualizer
+    fig, ax = plt.subplots(figsize=(8, 5))
+    ax.plot(scores.index, scores['distortion'], marker='D')
+    if selection.elbow is not None:
+        ax.axvline(selection.elbow, color='k', linestyle='--',
+                   label=f"elbow at $k={selection.elbow}$, $score={scores.loc[selection.elbow, 'distortion']:.3f}$")
+        ax.legend(loc='best', fontsize='medium', frameon=True)
+    ax.set_title('Distortion Score Elbow for MiniBatchKMeans Clustering')
+    ax.set_xlabel('k')
+    ax.set_ylabel('distortion score')
+    fig.tight_layout()
+    fig.savefig(f"{output_dir}/elbow_method.png")
+    plt.close(fig)
 
-# Criar diretório de saída se não existir
-os.makedirs(output_dir, exist_ok=True)
+    # Silhueta e Davies-Bouldin
+    fig, axes = plt.subplots(1, 2, figsize=(12, 5))
+    for ax, score, label in zip(axes, ['silhouette', 'davies_bouldin'], ['Silhouette (higher is better)',
+                                                                        'Davies-Bouldin (lower is better)']):
+        ax.plot(scores.index, scores[score], marker='D')
+        if selection.elbow is not None:
+            ax.axvline(selection.elbow, color='k', linestyle='--')
+        ax.set_xlabel('k')
+        ax.set_title(label)
+    fig.tight_layout()
+    fig.savefig(f"{output_dir}/k_selection_scores.png")
+    plt.close(fig)
 
-# Carregar os dados dos tracks
-track_path = f'{PATH}/tracks_SAt_filtered/tracks_SAt_filtered_with_periods.csv'
-tracks = pd.read_csv(track_path)
+def main():
+    # Criar diretório de saída se não existir
+    os.makedirs(output_dir, exist_ok=True)
 
-# Extrair sistemas intensos
-q99 = tracks['vor42'].quantile(0.99)
-tracks_intense = tracks[tracks['vor42'] >= q99]
+    # Carregar os dados das PCs
+    pcs_df = load_pcs(base_path)
 
-# Carregar os dados das PCs
-pcs_df = pd.read_csv(pcs_path)
+    if SUBSET == 'q99':
+        # Carregar os dados dos tracks
+        track_path = f'{PATH}/tracks_SAt_filtered/tracks_SAt_filtered_with_periods.csv'
+        tracks = pd.read_csv(track_path, usecols=['track_id', 'vor42'])
 
-# Filtrar apenas os sistemas intensos
-pcs_df = pcs_df[pcs_df['track_id'].isin(tracks_intense['track_id'])]
+        # Extrair sistemas intensos
+        q99 = tracks['vor42'].quantile(0.99)
+        tracks_intense = tracks[tracks['vor42'] >= q99]
 
-# Remover a coluna track_id, pois não deve ser usada na clusterização
-data = pcs_df.drop(columns=['track_id'])
+        # Filtrar apenas os sistemas intensos
+        pcs_df = pcs_df[pcs_df['track_id'].isin(tracks_intense['track_id'])]
 
-# Normalizar os dados para evitar influência de escalas diferentes
-scaler = StandardScaler()
-data_scaled = scaler.fit_transform(data)
+    # Remover a coluna track_id, pois não deve ser usada na clusterização
+    data = pcs_df.drop(columns=['track_id'])
 
-# Determinar o número ótimo de clusters pelo método Elbow
-fig, ax = plt.subplots(figsize=(8, 5))
-visualizer = KElbowVisualizer(KMeans(), k=(2, 10), metric='distortion', timings=False, ax=ax)
-visualizer.fit(data_scaled)  # Treinar modelo KMeans
-visualizer.show(outpath=f"{output_dir}/elbow_method.png")
+    if REFIT or not os.path.exists(model_path):
+        # Avaliar k em paralelo (MiniBatchKMeans, várias sementes) e ajustar no cotovelo
+        model, selection = fit_clusters(data, k_range=K_RANGE)
+        selection.scores.to_csv(f"{output_dir}/k_selection_scores.csv")
+        plot_k_selection(selection, output_dir)
+        save_cluster_model(model, model_path)
+        print(f"Número ótimo de clusters: {len(model.centers)}")
+    else:
+        # Classificar os sistemas com o modelo salvo
+        model = load_cluster_model(model_path)
 
-# Número ótimo de clusters
-optimal_k = visualizer.elbow_value_
-print(f"Número ótimo de clusters: {optimal_k}")
+    pcs_df['cluster'] = predict_clusters(model, data)
 
-# Aplicar K-means com o número ótimo de clusters
-kmeans = KMeans(n_clusters=optimal_k, random_state=42)
-pcs_df['cluster'] = kmeans.fit_predict(data_scaled)
+    # Salvar os centróides em um arquivo CSV
+    centroids = cluster_centroids(model)
+    centroids.to_csv(f"{output_dir}/cluster_centroids.csv", index=False)
 
-# Salvar os centróides em um arquivo CSV
-centroids = pd.DataFrame(scaler.inverse_transform(kmeans.cluster_centers_), columns=data.columns)
-centroids.to_csv(f"{output_dir}/cluster_centroids.csv", index=False)
+    # Salvar os resultados da clusterização
+    pcs_df.to_csv(f"{output_dir}/pcs_with_clusters.csv", index=False)
 
-# Salvar os resultados da clusterização
-pcs_df.to_csv(f"{output_dir}/pcs_with_clusters.csv", index=False)
+    # Exibir resultados
+    print("Clusterização concluída! Os arquivos foram salvos em:", output_dir)
 
-# Exibir resultados
-print("Clusterização concluída! Os arquivos foram salvos em:", output_dir)
+if __name__ == '__main__':
+    main()
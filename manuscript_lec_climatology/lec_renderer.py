@@ -0,0 +1,253 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    lec_renderer.py                                    :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/09/29 10:15:22 by daniloceano       #+#    #+#              #
+#    Updated: 2024/09/29 10:15:22 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Template-based renderer of the Lorenz Energy Cycle box diagrams.
+
+The figure, axes, boxes, texts and arrows of a diagram are created once
+(build_skeleton) and each frame (a row of means, e.g. one day or phase) only
+updates the box edge widths, the arrow widths and directions, and the value
+texts and colours (update_frame), instead of drawing a new figure per row.
+
+render_lec_diagrams() splits the rows between worker processes, each reusing
+its own skeleton to write one PNG per row, or writes all rows as the pages
+of a single multipage PDF.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import matplotlib.patches as patches
+
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_pdf import PdfPages
+
+ENERGY_TERMS = ["Az", "Ae", "Kz", "Ke"]
+CONVERSION_TERMS = ["Cz", "Ca", "Ck", "Ce"]
+RESIDUAL_TERMS = ["Gz", "RKz", "Ge", "RKe"]
+BOUNDARY_TERMS = ["BAz", "BAe", "BKz", "BKe"]
+ARROW_TERMS = CONVERSION_TERMS + RESIDUAL_TERMS + BOUNDARY_TERMS
+
+# Positions and size of the energy (budget) boxes
+BOX_POSITIONS = {
+    "∂Az/∂t": (-0.5, 0.5),
+    "∂Ae/∂t": (-0.5, -0.5),
+    "∂Kz/∂t": (0.5, 0.5),
+    "∂Ke/∂t": (0.5, -0.5),
+}
+BOX_SIZE = 0.4
+
+POSITIVE_COLOR = "#386641"
+NEGATIVE_COLOR = "#ae2012"
+ARROW_COLOR = "#5C5850"
+MAX_EDGE_WIDTH = 5
+FONT = dict(ha="center", va="center", fontsize=16, fontweight="bold")
+SUBPLOT_DEFAULTS = {key: matplotlib.rcParams[f"figure.subplot.{key}"]
+                    for key in ["left", "right", "bottom", "top", "wspace", "hspace"]}
+
+def _arrow_geometry(term, positions=BOX_POSITIONS, size=BOX_SIZE):
+    """
+    Start and end of the arrow of a term (for positive values) and the offset
+    of its text from the mid point.
+    """
+    az, ae, kz, ke = (positions[box] for box in ["∂Az/∂t", "∂Ae/∂t", "∂Kz/∂t", "∂Ke/∂t"])
+    half = size / 2
+    geometry = {
+        "Cz": ((az[0] + half, az[1]), (kz[0] - half, kz[1]), (0, 0.1)),
+        "Ca": ((az[0], az[1] - half), (ae[0], ae[1] + half), (-0.1, 0)),
+        "Ck": ((kz[0], ke[1] + half), (ke[0], kz[1] - half), (0.1, 0)),
+        "Ce": ((ae[0] + half, ke[1]), (ke[0] - half, ae[1]), (0, -0.1)),
+        "Gz": ((az[0], 1), (az[0], az[1] + half), (0, 0.2)),
+        "Ge": ((ae[0], -1), (ae[0], ae[1] - half), (0, -0.2)),
+        "RKz": ((kz[0], 1), (kz[0], kz[1] + half), (0, 0.2)),
+        "RKe": ((ke[0], -1), (ke[0], ke[1] - half), (0, -0.2)),
+        "BAz": ((-1, az[1]), (az[0] - half, az[1]), (-0.23, 0)),
+        "BAe": ((-1, ae[1]), (ae[0] - half, ae[1]), (-0.23, 0)),
+        "BKz": ((1, kz[1]), (kz[0] + half, kz[1]), (0.23, 0)),
+        "BKe": ((1, ke[1]), (ke[0] + half, ke[1]), (0.23, 0)),
+    }
+    start, end, offset = geometry[term]
+
+    # Labels of some terms are nudged away from the arrows
+    offset_x = -0.05 if term in ["Ca", "BAz", "BAe"] else 0.05 if term in ["Ck", "BKz", "BKe"] else 0
+    offset_y = -0.05 if term == "Ce" else 0.05 if term == "Cz" else 0
+    text_position = ((start[0] + end[0]) / 2 + offset[0] + offset_x,
+                     (start[1] + end[1]) / 2 + offset[1] + offset_y)
+    return start, end, text_position
+
+def arrow_width(term_value):
+    value = np.abs(term_value)
+    return 3 + value if value < 10 else 15 + value * 0.1
+
+def figure_name(name):
+    return name.strftime("%Y-%m-%d") if isinstance(name, pd.Timestamp) else name
+
+def _value_color(value):
+    return NEGATIVE_COLOR if value < 0 else POSITIVE_COLOR
+
+def build_skeleton():
+    """
+    Creates the static part of a diagram: figure, axes, boxes and the (empty)
+    texts and arrows that update_frame fills.
+    """
+    fig, ax = plt.subplots(figsize=(8, 8))
+    ax.set_xlim(-1, 1)
+    ax.set_ylim(-1, 1)
+    ax.axis("off")
+
+    skeleton = {"fig": fig, "ax": ax, "boxes": {}, "box_texts": {}, "texts": {}, "arrows": {}, "geometry": {}}
+    for term, pos in BOX_POSITIONS.items():
+        square = patches.Rectangle(
+            (pos[0] - BOX_SIZE / 2, pos[1] - BOX_SIZE / 2), BOX_SIZE, BOX_SIZE,
+            fill=True, color="skyblue", ec="black", linewidth=0,
+        )
+        ax.add_patch(square)
+        skeleton["boxes"][term] = square
+        skeleton["box_texts"][term] = ax.text(pos[0], pos[1], "", **FONT)
+
+    skeleton["title"] = ax.text(0, 0, "", fontsize=16, ha="center", va="center", fontweight="bold", color="black")
+
+    for term in ARROW_TERMS:
+        start, end, text_position = _arrow_geometry(term)
+        skeleton["geometry"][term] = (start, end)
+        skeleton["texts"][term] = ax.text(*text_position, "", **FONT)
+        skeleton["arrows"][term] = ax.annotate(
+            "", xy=end, xytext=start,
+            arrowprops=dict(facecolor=ARROW_COLOR, edgecolor=ARROW_COLOR, width=3, headwidth=9, headlength=9),
+        )
+    return skeleton
+
+def update_frame(skeleton, data, normalized_data, std_data=None, std_in_boxes=True, plot_example=False):
+    """
+    Fills the skeleton with one row of values.
+
+    Parameters:
+    - skeleton: As returned by build_skeleton.
+    - data: Series with the terms (budget terms named '∂Az/∂t', etc.).
+    - normalized_data: Series with the normalized values of the budget terms,
+      used for the box edge widths.
+    - std_data: Series with the standard deviations to show after the values.
+    - std_in_boxes: If False, standard deviations are only shown for the arrows.
+    - plot_example: Show the term names instead of values (template figure).
+    """
+    for term in BOX_POSITIONS:
+        term_value = data[term]
+        skeleton["boxes"][term].set_linewidth(MAX_EDGE_WIDTH * normalized_data[term] / 10)
+        text = skeleton["box_texts"][term]
+        if plot_example:
+            text.set_text(term)
+            text.set_color("k")
+        else:
+            label = f"{term_value:.2f}"
+            if std_data is not None and std_in_boxes:
+                label += f"\n± {std_data[term]:.2f}"
+            text.set_text(label)
+            text.set_color(_value_color(term_value))
+
+    skeleton["title"].set_text("" if plot_example else str(figure_name(data.name)))
+
+    for term in ARROW_TERMS:
+        term_value = data[term]
+        text = skeleton["texts"][term]
+        if plot_example:
+            text.set_text(term)
+            text.set_color("k")
+        else:
+            label = f"{term_value:.2f}"
+            if std_data is not None:
+                separator = " " if ("R" in term or "G" in term) else "\n"
+                label += f"{separator}± {std_data[term]:.2f}"
+            text.set_text(label)
+            text.set_color(_value_color(term_value))
+
+        # Arrows point backwards for negative values
+        start, end = skeleton["geometry"][term]
+        if term_value < 0:
+            start, end = end, start
+        arrow = skeleton["arrows"][term]
+        arrow.xy = end
+        arrow.xyann = start
+        size = arrow_width(term_value)
+        arrow.arrowprops.update(width=size, headwidth=size * 3, headlength=size * 3)
+
+    # Labels outside the axes depend on the values, so the layout is adjusted per
+    # frame, starting from the default subplot parameters as a new figure would
+    skeleton["fig"].subplots_adjust(**SUBPLOT_DEFAULTS)
+    skeleton["fig"].tight_layout()
+
+def _render_chunk(args):
+    means, normalized, std, figures_subdirectory, std_in_boxes, plot_example = args
+    skeleton = build_skeleton()
+    paths = []
+    for name, data in means.iterrows():
+        update_frame(skeleton, data, normalized.loc[name], None if std is None else std.loc[name],
+                     std_in_boxes=std_in_boxes, plot_example=plot_example)
+        path = os.path.join(figures_subdirectory, f"LEC_{'example' if plot_example else figure_name(name)}.png")
+        skeleton["fig"].savefig(path)
+        paths.append(path)
+    plt.close(skeleton["fig"])
+    return paths
+
+def render_lec_diagrams(means, normalized, figures_subdirectory, std=None, std_in_boxes=True,
+                        pdf_path=None, plot_example=False, processes=None, app_logger=False):
+    """
+    Renders one LEC diagram per row of means.
+
+    Parameters:
+    - means: DataFrame with one row per diagram (index used as title and file name).
+    - normalized: DataFrame with the normalized budget terms, same index as means.
+    - figures_subdirectory: Directory of the PNG files (LEC_<name>.png).
+    - std: Optional DataFrame of standard deviations, same index as means.
+    - std_in_boxes: Whether the standard deviations are also shown in the boxes.
+    - pdf_path: If given, write all diagrams as the pages of this PDF instead.
+    - plot_example: Render a single template figure with the term names.
+    - processes: Number of worker processes for the PNG files (default: CPUs).
+
+    Returns:
+    - List of written files.
+    """
+    if plot_example:
+        means, normalized = means.iloc[:1], normalized.iloc[:1]
+        std = None
+
+    if pdf_path is not None:
+        skeleton = build_skeleton()
+        with PdfPages(pdf_path) as pdf:
+            for name, data in means.iterrows():
+                update_frame(skeleton, data, normalized.loc[name], None if std is None else std.loc[name],
+                             std_in_boxes=std_in_boxes, plot_example=plot_example)
+                pdf.savefig(skeleton["fig"])
+        plt.close(skeleton["fig"])
+        paths = [pdf_path]
+    else:
+        os.makedirs(figures_subdirectory, exist_ok=True)
+        n_workers = min(processes or os.cpu_count() or 1, len(means))
+        chunks = [(means.iloc[i::n_workers], normalized, std, figures_subdirectory, std_in_boxes, plot_example)
+                  for i in range(n_workers)]
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                paths = [path for chunk in executor.map(_render_chunk, chunks) for path in chunk]
+        else:
+            paths = _render_chunk(chunks[0]) if chunks else []
+
+    for path in paths:
+        (
+            app_logger.info(f"Lorenz cycle plot saved to {path}")
+            if app_logger
+            else print(f"Lorenz cycle plot saved to {path}")
+        )
+    return paths
@@ -1,16 +1,17 @@
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-import xarray as xr
 import matplotlib.colors as mcolors
 import numpy as np
 import os
+import sys
 
-# Caminhos dos arquivos
-arg_density_path = '../../Programs_and_scripts/SWSA-cyclones_energetic-analysis/periods_species_statistics/70W-no-continental/track_density/ARG_track_density.nc'
-la_plata_density_path = '../../Programs_and_scripts/SWSA-cyclones_energetic-analysis/periods_species_statistics/70W-no-continental/track_density/LA-PLATA_track_density.nc'
-se_br_density_path = '../../Programs_and_scripts/SWSA-cyclones_energetic-analysis/periods_species_statistics/70W-no-continental/track_density/SE-BR_track_density.nc'
+sys.path.append('../src_chapter_4')
+from basemap import MANUSCRIPT_GRIDLINES, basemap, draw_basemap
+from density_catalog import COMBINED_REGION, density_field
+
+# Diretório dos arquivos de densidade (ARG, LA-PLATA e SE-BR)
+density_directory = '../../Programs_and_scripts/SWSA-cyclones_energetic-analysis/periods_species_statistics/70W-no-continental/track_density'
 
 # Regiões de gênese
 regions = {
@@ -26,17 +27,6 @@ region_labels = {
     "ARG": (-60, -62),  # Coordenadas ajustadas para ARG
 }
 
-# Função para configurar as linhas do grid
-def gridlines(ax):
-    gl = ax.gridlines(draw_labels=True, zorder=100, linestyle='dashed', alpha=0.5,
-                      color='#383838', lw=0.25)
-    gl.xlocator = mpl.ticker.FixedLocator(range(-90, 181, 20))
-    gl.ylocator = mpl.ticker.FixedLocator(range(-90, 91, 10))
-    gl.right_labels = False
-    gl.top_labels = False
-    gl.xlabel_style = {'size': 12, 'color': '#383838'}
-    gl.ylabel_style = {'size': 12, 'color': '#383838', 'rotation': 45}
-
 # Função para adicionar as regiões de gênese ao mapa
 def add_regions(ax):
     for name, bounds in regions.items():
@@ -57,7 +47,9 @@ def add_regions(ax):
 # Função para plotar a densidade combinada
 def plot_combined_density(ax, density):
     datacrs = ccrs.PlateCarree()
-    ax.set_extent([-90, 180, -15, -90], crs=datacrs)
+    draw_basemap(ax, basemap(datacrs, [-90, 180, -15, -90], features=('coastlines', 'land'),
+                             gridlines=MANUSCRIPT_GRIDLINES),
+                 coastlines={'zorder': 1}, land={'color': '#595959', 'alpha': 0.1})
     lon, lat = density.lon, density.lat
 
     levels = [0.1, 1, 2, 5, 8, 10, 15, 20, 30, 40, 50, 70, 100, 130]
@@ -74,26 +66,13 @@ def plot_combined_density(ax, density):
     ticks = np.round(levels, decimals=2)
     plt.colorbar(cf, cax=cbar_axes, ticks=ticks, format='%g', orientation='horizontal')
 
-    ax.coastlines(zorder=1)
-    ax.add_feature(cfeature.LAND, color='#595959', alpha=0.1)
-    gridlines(ax)
     add_regions(ax)  # Adicionar as regiões de gênese
 
-# Carregar os dados de densidade
-arg_density = xr.open_dataset(arg_density_path)
-la_plata_density = xr.open_dataset(la_plata_density_path)
-se_br_density = xr.open_dataset(se_br_density_path)
-
-# Somar as densidades para todas as fases
-phases = ['intensification', 'incipient', 'mature', 'decay', 
-          'residual', 'intensification 2', 'mature 2', 'decay 2']
-
-arg_combined = sum(arg_density[phase] for phase in phases)
-la_plata_combined = sum(la_plata_density[phase] for phase in phases)
-se_br_combined = sum(se_br_density[phase] for phase in phases)
+# Somar as densidades de todas as fases e regiões, lendo cada arquivo uma vez
+phases = ('intensification', 'incipient', 'mature', 'decay',
+          'residual', 'intensification 2', 'mature 2', 'decay 2')
 
-# Somar as densidades para todas as regiões
-combined_density = arg_combined + la_plata_combined + se_br_combined
+combined_density = density_field(density_directory, COMBINED_REGION, None, phases)
 
 # Plotar a densidade combinada
 fig = plt.figure(figsize=(12, 8))
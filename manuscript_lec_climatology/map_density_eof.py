@@ -13,28 +13,26 @@
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import cartopy.crs as ccrs
-import cartopy.feature as cfeature
 import xarray as xr
 import matplotlib.colors as mcolors
 import numpy as np
 import os
+import sys
+import tempfile
 from glob import glob
 
-labels = ['A', 'B', 'C', 'D']
+sys.path.append('../src_chapter_4')
+from basemap import MANUSCRIPT_GRIDLINES, basemap, draw_basemap
+from figure_jobs import FigureJob, open_shared, run_figure_jobs, share_arrays
 
-def gridlines(ax):
-    gl = ax.gridlines(draw_labels=True, zorder=100, linestyle='dashed', alpha=0.5,
-                     color='#383838', lw=0.25)
-    gl.xlocator = mpl.ticker.FixedLocator(range(-90, 181, 20))
-    gl.ylocator = mpl.ticker.FixedLocator(range(-90, 91, 10))
-    gl.right_labels = False
-    gl.top_labels = False
-    gl.xlabel_style = {'size': 12, 'color': '#383838'}
-    gl.ylabel_style = {'size': 12, 'color': '#383838', 'rotation': 45}
+labels = ['A', 'B', 'C', 'D']
+SUFFIXES = ['q10', 'q90']
 
 def plot_density(ax, density, eof, suffix, label):
     datacrs = ccrs.PlateCarree()
-    ax.set_extent([-90, 180, -15, -90], crs=datacrs)
+    draw_basemap(ax, basemap(datacrs, [-90, 180, -15, -90], features=('coastlines', 'land'),
+                             gridlines=MANUSCRIPT_GRIDLINES),
+                 coastlines={'zorder': 1}, land={'color': '#595959', 'alpha': 0.1})
     lon, lat = density.lon, density.lat
     eof = int(eof)
 
@@ -78,24 +76,26 @@ def plot_density(ax, density, eof, suffix, label):
     ax.text(175, -25, f"({label}) EOF {eof}", ha='right', va='bottom', fontsize=14, fontweight='bold',
             bbox=props, zorder=101)
 
-    ax.coastlines(zorder=1)
-    ax.add_feature(cfeature.LAND, color='#595959', alpha=0.1)
-    gridlines(ax)
-
     return cf
 
-def generate_density_panel(eofs_path, output_directory, suffix):
+def load_eofs(eofs_path, share_directory):
+    """Lê as 4 primeiras EOFs uma vez e as compartilha com os jobs, como {eof: SharedArray}"""
     eof_files = sorted(glob(os.path.join(eofs_path, "SAt_track_density_eof_*.nc")))
 
+    eofs = {}
+    for eof_file in eof_files[:4]:  # Apenas as 4 primeiras EOFs
+        eof_number = os.path.basename(eof_file).split('_')[-1].split('.')[0]
+        with xr.open_dataset(eof_file) as ds:
+            eofs[eof_number] = ds[f"EOF_{float(eof_number)}"].load()
+    return share_arrays(eofs, share_directory)
+
+def generate_density_panel(eofs, output_directory, suffix):
     os.makedirs(output_directory, exist_ok=True)
 
     fig, axes = plt.subplots(2, 2, figsize=(14, 10), subplot_kw={"projection": ccrs.PlateCarree()})
 
-    for i, eof_file in enumerate(eof_files[:4]):  # Apenas as 4 primeiras EOFs
-        eof_number = os.path.basename(eof_file).split('_')[-1].split('.')[0]
-        ds = xr.open_dataset(eof_file)
-
-        density = ds[f"EOF_{float(eof_number)}"]
+    for i, (eof_number, shared) in enumerate(eofs.items()):
+        density = open_shared(shared)
 
         row, col = divmod(i, 2)  # Determina a posição no painel
         cf = plot_density(axes[row, col], density, eof=eof_number, suffix=suffix, label=labels[i])
@@ -111,11 +111,17 @@ def generate_density_panel(eofs_path, output_directory, suffix):
     plt.savefig(panel_path, bbox_inches='tight', dpi=300)
     plt.close()
     print(f'Density panel saved in {panel_path}')
+    return panel_path
 
 if __name__ == "__main__":
-    suffix = "q10"
-
-    eofs_path = f"../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic/csv_eofs_energetics_with_track/Total/track_density_{suffix}"
     output_directory = f"figures/eof_density_maps"
 
-    generate_density_panel(eofs_path, output_directory, suffix)
+    # Um job por painel (q10 e q90), renderizados em paralelo
+    with tempfile.TemporaryDirectory() as share_directory:
+        jobs = []
+        for suffix in SUFFIXES:
+            eofs_path = f"../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic/csv_eofs_energetics_with_track/Total/track_density_{suffix}"
+            eofs = load_eofs(eofs_path, os.path.join(share_directory, suffix))
+            jobs.append(FigureJob(f"density_panel_{suffix}", generate_density_panel,
+                                  {'eofs': eofs, 'output_directory': output_directory, 'suffix': suffix}))
+        run_figure_jobs(jobs)
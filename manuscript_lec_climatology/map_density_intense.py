@@ -1,31 +1,25 @@
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import cartopy.crs as ccrs
-import cartopy.feature as cfeature
 import xarray as xr
 import matplotlib.colors as mcolors
 import numpy as np
 import os
+import sys
 from glob import glob
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
-labels = ['A', 'B', 'C', 'D', 'E']  # Agora apenas 5 labels
+sys.path.append('../src_chapter_4')
+from basemap import MANUSCRIPT_GRIDLINES, basemap, draw_basemap
 
-def gridlines(ax):
-    """Configura as linhas de grade nos mapas"""
-    gl = ax.gridlines(draw_labels=True, zorder=100, linestyle='dashed', alpha=0.5,
-                     color='#383838', lw=0.25)
-    gl.xlocator = mpl.ticker.FixedLocator(range(-90, 181, 20))
-    gl.ylocator = mpl.ticker.FixedLocator(range(-90, 91, 10))
-    gl.right_labels = False
-    gl.top_labels = False
-    gl.xlabel_style = {'size': 12, 'color': '#383838'}
-    gl.ylabel_style = {'size': 12, 'color': '#383838', 'rotation': 45}
+labels = ['A', 'B', 'C', 'D', 'E']  # Agora apenas 5 labels
 
 def plot_density(ax, density, cluster, label):
     """Plota a densidade de tracks no mapa"""
     datacrs = ccrs.PlateCarree()
-    ax.set_extent([-90, 180, -15, -90], crs=datacrs)
+    draw_basemap(ax, basemap(datacrs, [-90, 180, -15, -90], features=('coastlines', 'land'),
+                             gridlines=MANUSCRIPT_GRIDLINES),
+                 coastlines={'zorder': 1}, land={'color': '#595959', 'alpha': 0.1})
     lon, lat = density.lon, density.lat
     cluster = int(cluster)
 
@@ -46,10 +40,6 @@ def plot_density(ax, density, cluster, label):
     ax.text(170, -25, f"({label}) cluster {cluster}", ha='right', va='bottom', fontsize=14, fontweight='bold',
             bbox=props, zorder=101)
 
-    ax.coastlines(zorder=1)
-    ax.add_feature(cfeature.LAND, color='#595959', alpha=0.1)
-    gridlines(ax)
-
     return cf
 
 def generate_density_panel(cluster_density_path, output_directory):
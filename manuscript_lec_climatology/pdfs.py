@@ -11,17 +11,22 @@
 # **************************************************************************** #
 
 import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
 from joypy import joyplot
-from tqdm import tqdm
 from scipy.stats import gaussian_kde
 
+sys.path.append('../src_chapter_5')
+from energetics_store import read_life_cycles
+from streaming_stats import frame_chunks, stream_statistics, summarize
+from binned_kde import cached_kde_1d, plot_density
+
 PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
 base_path = f'{PATH}/csv_database_energy_by_periods'
 output_directory = f'./figures/pdfs/'
+kde_cache_directory = f'{base_path}_kde_cache'
 
 COLOR_PHASES = {
     'Total': '#070A2B',
@@ -81,24 +86,6 @@ TICK_FONT_SIZE = 12
 TITLE_FONT_SIZE = 16
 LEGEND_FONT_SIZE = 12
 
-def read_life_cycles(base_path):
-    """
-    Reads all CSV files in the specified directory and collects DataFrame for each system.
-    """
-    systems_energetics = {}
-
-    for filename in tqdm(os.listdir(base_path), desc="Reading CSV files"):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(base_path, filename)
-            system_id = filename.split('_')[0]
-            try:
-                df = pd.read_csv(file_path)
-                systems_energetics[system_id] = df
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-
-    return systems_energetics
-
 def compute_group_caps(systems_energetics, terms_prefix, special_case=None):
     """
     Computes caps for a group of terms based on the 0.2 and 0.8 quantiles across all systems.
@@ -111,20 +98,16 @@ def compute_group_caps(systems_energetics, terms_prefix, special_case=None):
     Returns:
     - A tuple (min_cap, max_cap) representing the computed value caps for the group.
     """
-    all_values = []
-
-    for df in systems_energetics.values():
-        relevant_cols = [col for col in df.columns if col.startswith(tuple(terms_prefix))]
-        all_values.extend(df[relevant_cols].values.flatten())
-
-    all_values = pd.Series(all_values).dropna()
+    # Values of all terms of the group pooled in a single streaming sketch
+    first = next(iter(systems_energetics.values()))
+    relevant_cols = [col for col in first.columns if col.startswith(tuple(terms_prefix))]
+    stats = stream_statistics(frame_chunks(systems_energetics.values()), {col: 'group' for col in relevant_cols})
+    q2, q8 = summarize(stats, quantiles=(0.2, 0.8)).loc['group', ['q0.2', 'q0.8']]
 
     if special_case == 'Energy Terms':
         min_cap = 0  # Special case for Energy Terms
-        max_cap = all_values.quantile(0.8)
+        max_cap = q8
     else:
-        q2 = all_values.quantile(0.2)
-        q8 = all_values.quantile(0.8)
         highest_cap = np.amax(np.abs([q2, q8]))
         min_cap, max_cap = -highest_cap, highest_cap
 
@@ -181,9 +164,10 @@ def plot_group_panel(systems_energetics, groups, output_directory):
                 # Set the label based on the term name
                 label = term if '∂' not in term else term.split('(finite diff.)')[0]
                 label = label+'*' if 'Kz' in label else label
-                sns.kdeplot(data=term_data, x='Value', label=label,
-                            ax=ax, bw_adjust=0.5, fill=False,
-                            color=COLOR_TERMS[idy], linewidth=2, alpha=0.8)
+                support, density = cached_kde_1d(kde_cache_directory, (term, 'system mean', 'all'),
+                                                 term_data['Value'].values, bw_adjust=0.5)
+                plot_density(ax, support, density, label=label, fill=False,
+                             color=COLOR_TERMS[idy], linewidth=2, alpha=0.8)
 
         # Set axis limits based on the group
         ax.set_xlim(AXIS_LIMITS[group_name])
@@ -11,11 +11,14 @@
 # **************************************************************************** #
 
 import os
-import matplotlib.patches as patches
-import matplotlib.pyplot as plt
+import sys
 import numpy as np
 import pandas as pd
-from pdfs import read_life_cycles
+
+from lec_renderer import render_lec_diagrams
+
+sys.path.append('../src_chapter_5')
+from energetics_store import load_energetics
 
 TERM_DETAILS = {
     "energy": {"terms": ["Az", "Ae", "Kz", "Ke"], "label": "Energy", "unit": "J·m⁻²"},
@@ -51,271 +54,6 @@ TERM_DETAILS = {
     },
 }
 
-def plot_boxes(ax, data, normalized_data, positions, size, plot_example=False):
-    # Define edge width range
-    min_edge_width = 0
-    max_edge_width = 5
-
-    # Create energy boxes and text labels with updated terms
-    for term, pos in positions.items():
-        term_value = data[term]
-
-        # Get normalized value for the term to determine edge width
-        normalized_value = normalized_data[term]
-        # Scale edge width based on normalized value
-        edge_width = (
-            min_edge_width + (max_edge_width - min_edge_width) * normalized_value / 10
-        )
-
-        # Determine value text color based on term value
-        value_text_color = "#386641"  # Dark green for positive values
-        if term_value < 0:
-            value_text_color = "#ae2012"  # Dark red for negative values
-
-        square = patches.Rectangle(
-            (pos[0] - size / 2, pos[1] - size / 2),
-            size,
-            size,
-            fill=True,
-            color="skyblue",
-            ec="black",
-            linewidth=edge_width,
-        )
-        ax.add_patch(square)
-
-        # Term text in bold black
-        if plot_example:
-            ax.text(
-                pos[0],
-                pos[1],
-                f"{term}",
-                ha="center",
-                va="center",
-                fontsize=16,
-                color="k",
-                fontweight="bold",
-            )
-
-        # Value text in the specified color
-        else:
-            ax.text(
-                pos[0],
-                pos[1],
-                f"{term_value:.2f}",
-                ha="center",
-                va="center",
-                fontsize=16,
-                color=value_text_color,
-                fontweight="bold",
-            )
-
-def plot_term_text_and_value_with_std(ax, start, end, term, term_value, std_value, offset=(0, 0), plot_example=False):
-    # Determine text color based on term value
-    text_color = "#386641"
-    if term_value < 0:
-        text_color = "#ae2012"
-
-    mid_point = (
-        (start[0] + end[0]) / 2 + offset[0],
-        (start[1] + end[1]) / 2 + offset[1],
-    )
-
-    # Adjust offset for some terms
-    if term in ["Ca", "BAz", "BAe"]:
-        offset_x = -0.05
-    elif term in ["Ck", "BKz", "BKe"]:
-        offset_x = 0.05
-    else:
-        offset_x = 0
-
-    if term == "Ce":
-        offset_y = -0.05
-    elif term == "Cz":
-        offset_y = 0.05
-    else:
-        offset_y = 0
-
-    x_pos = mid_point[0] + offset_x
-    y_pos = mid_point[1] + offset_y
-
-    if 'R' in term or 'G' in term:
-        text = f"{term_value:.2f} ± {std_value:.2f}"
-    else:
-        text = f"{term_value:.2f}\n± {std_value:.2f}"
-
-    ax.text(
-        x_pos,
-        y_pos,
-        text,
-        ha="center",
-        va="center",
-        color=text_color,
-        fontsize=16,
-        fontweight="bold",
-    )
-
-def plot_term_arrows_and_text_with_std(ax, size, term, data, std_data_phase, positions, plot_example=False):
-    term_value = data[term]
-    std_value = std_data_phase[term]
-
-    arrow_color = "#5C5850"  # Default color
-
-    if term == "Cz":
-        start = (positions["∂Az/∂t"][0] + size / 2, positions["∂Az/∂t"][1])
-        end = (positions["∂Kz/∂t"][0] - size / 2, positions["∂Kz/∂t"][1])
-        plot_term_text_and_value_with_std(
-            ax, start, end, term, term_value, std_value, offset=(0, 0.1), plot_example=plot_example
-        )
-
-    elif term == "Ca":
-        start = (positions["∂Az/∂t"][0], positions["∂Az/∂t"][1] - size / 2)
-        end = (positions["∂Ae/∂t"][0], positions["∂Ae/∂t"][1] + size / 2)
-        plot_term_text_and_value_with_std(
-            ax, start, end, term, term_value, std_value, offset=(-0.1, 0), plot_example=plot_example
-        )
-
-    elif term == "Ck":
-        start = (positions["∂Kz/∂t"][0], positions["∂Ke/∂t"][1] + size / 2)
-        end = (positions["∂Ke/∂t"][0], positions["∂Kz/∂t"][1] - size / 2)
-        plot_term_text_and_value_with_std(
-            ax, start, end, term, term_value, std_value, offset=(0.1, 0), plot_example=plot_example
-        )
-
-    elif term == "Ce":
-        start = (positions["∂Ae/∂t"][0] + size / 2, positions["∂Ke/∂t"][1])
-        end = (positions["∂Ke/∂t"][0] - size / 2, positions["∂Ae/∂t"][1])
-        plot_term_text_and_value_with_std(
-            ax, start, end, term, term_value, std_value, offset=(0, -0.1), plot_example=plot_example
-        )
-
-    # Plot text for residuals
-    elif term == "Gz":
-        start = (positions["∂Az/∂t"][0], 1)
-        end = (positions["∂Az/∂t"][0], positions["∂Az/∂t"][1] + size / 2)
-        plot_term_text_and_value_with_std(
-            ax, start, end, term, term_value, std_value, offset=(0, 0.2), plot_example=plot_example
-        )
-
-    elif term == "Ge":
-        start = (positions["∂Ae/∂t"][0], -1)
-        end = (positions["∂Ae/∂t"][0], positions["∂Ae/∂t"][1] - size / 2)
-        plot_term_text_and_value_with_std(
-            ax, start, end, term, term_value, std_value, offset=(0, -0.2), plot_example=plot_example
-        )
-
-    elif term == "RKz":
-        start = (positions["∂Kz/∂t"][0], 1)
-        end = (positions["∂Kz/∂t"][0], positions["∂Kz/∂t"][1] + size / 2)
-        plot_term_text_and_value_with_std(
-            ax, start, end, term, term_value, std_value, offset=(0, 0.2), plot_example=plot_example
-        )
-
-    elif term == "RKe":
-        start = (positions["∂Ke/∂t"][0], -1)
-        end = (positions["∂Ke/∂t"][0], positions["∂Ke/∂t"][1] - size / 2)
-        plot_term_text_and_value_with_std(
-            ax, start, end, term, term_value, std_value, offset=(0, -0.2), plot_example=plot_example
-        )
-
-    # Plot text for boundaries
-    elif term in ["BAz", "BAe"]:
-        refered_term = "∂Az/∂t" if term == "BAz" else "∂Ae/∂t"
-        start = (-1, positions[refered_term][1])
-        end = (positions[refered_term][0] - size / 2, positions[refered_term][1])
-        plot_term_text_and_value_with_std(
-            ax, start, end, term, term_value, std_value, offset=(-0.23, 0), plot_example=plot_example
-        )
-
-    elif term in ["BKz", "BKe"]:
-        refered_term = "∂Kz/∂t" if term == "BKz" else "∂Ke/∂t"
-        start = (1, positions[refered_term][1])
-        end = (positions[refered_term][0] + size / 2, positions[refered_term][1])
-        plot_term_text_and_value_with_std(
-            ax, start, end, term, term_value, std_value, offset=(0.23, 0), plot_example=plot_example
-        )
-
-    if term_value < 0:
-        # Swap start and end for negative values
-        start_normalized, end_normalized = end, start
-    else:
-        start_normalized, end_normalized = start, end
-
-    # Plot arrow
-    plot_arrow(ax, start_normalized, end_normalized, data[term], color=arrow_color)
-
-    return start, end
-
-
-def plot_arrow(ax, start, end, term_value, color="#5C5850"):
-    """Draws an arrow on the given axes from start to end point."""
-
-    # Determine arrow size based on term value
-    if np.abs(term_value) < 1:
-        size = 3 + np.abs(term_value)
-    elif np.abs(term_value) < 5:
-        size = 3 + np.abs(term_value)
-    elif np.abs(term_value) < 10:
-        size = 3 + np.abs(term_value)
-    else:
-        size = 15 + np.abs(term_value) * 0.1
-
-    ax.annotate(
-        "",
-        xy=end,
-        xytext=start,
-        arrowprops=dict(
-            facecolor=color,
-            edgecolor=color,
-            width=size,
-            headwidth=size * 3,
-            headlength=size * 3,
-        ),
-    )
-
-def _call_plot_with_std(data, std_data_phase, normalized_data, plot_example=False):
-    # Prepare data
-    conversions = TERM_DETAILS["conversion"]["terms"]
-    residuals = TERM_DETAILS["residuals"]["terms"]
-    boundaries = TERM_DETAILS["boundary"]["terms"]
-
-    fig, ax = plt.subplots(figsize=(8, 8))
-    ax.set_xlim(-1, 1)
-    ax.set_ylim(-1, 1)
-    ax.axis("off")
-
-    # Define positions and size of energy boxes
-    positions = {
-        "∂Az/∂t": (-0.5, 0.5),
-        "∂Ae/∂t": (-0.5, -0.5),
-        "∂Kz/∂t": (0.5, 0.5),
-        "∂Ke/∂t": (0.5, -0.5),
-    }
-    size = 0.4
-
-    # Plot the boxes for energy terms
-    plot_boxes(ax, data, normalized_data, positions, size, plot_example)
-
-    # Add title
-    if not plot_example:
-        if isinstance(data.name, pd.Timestamp):
-            data.name = data.name.strftime("%Y-%m-%d")
-        ax.text(
-            0,
-            0,
-            data.name,
-            fontsize=16,
-            ha="center",
-            va="center",
-            fontweight="bold",
-            color="black",
-        )
-
-    # Iterate over conversion, residual, and boundary terms and plot mean + std values
-    for term in conversions + residuals + boundaries:
-        plot_term_arrows_and_text_with_std(
-            ax, size, term, data, std_data_phase, positions, plot_example=plot_example
-        )
-
 def _plotter(
     daily_means,
     std_data,
@@ -324,33 +62,15 @@ def _plotter(
     plot_example=False,
     app_logger=False,
 ):
-    for date, data in daily_means.iterrows():
-        # Extract the corresponding normalized data for the day
-        normalized_data = normalized_data_not_energy.loc[date]
-
-        std_data_phase = std_data.loc[date]
-
-        # Plot the Lorenz cycle for the day
-        _call_plot_with_std(data, std_data_phase, normalized_data, plot_example=plot_example)
-
-        if isinstance(data.name, pd.Timestamp):
-            figure_name = data.name.strftime("%Y-%m-%d")
-        else:
-            figure_name = data.name
-
-        plt.tight_layout()
-
-        figures_subdirectory = os.path.join(figures_directory, "LEC_specific_steps")
-        os.makedirs(figures_subdirectory, exist_ok=True)
-        figure_path = os.path.join(figures_subdirectory, f"LEC_{figure_name}.png")
-        plt.savefig(figure_path)
-        plt.close()
-        (
-            app_logger.info(f"Lorenz cycle plot saved to {figure_path}")
-            if app_logger
-            else print(f"Lorenz cycle plot saved to {figure_path}")
-        )
-
+    render_lec_diagrams(
+        daily_means,
+        normalized_data_not_energy,
+        os.path.join(figures_directory, "LEC_specific_steps"),
+        std=std_data,
+        std_in_boxes=False,
+        plot_example=plot_example,
+        app_logger=app_logger,
+    )
 
 def plot_period_means(periods_df, std_periods_df, figures_directory): 
 
@@ -445,12 +165,8 @@ if __name__ == "__main__":
 
     terms_prefix = list(groups.keys())
 
-    # Read results
-    systems_energetics = read_life_cycles(base_path)
-
-    # Concatenate all systems' dataframes while retaining the system id and phase
-    all_data = pd.concat([df.assign(system_id=system_id) for system_id, df in systems_energetics.items()])
-    all_data.rename(columns={'Unnamed: 0': 'Phase'}, inplace=True)
+    # Read results of all systems, retaining the system id and phase
+    all_data = load_energetics(base_path).rename(columns={'phase': 'Phase'})
     
     # Select specific steps for each system
     periods_df, std_periods_df = select_specific_steps(all_data)
@@ -1,13 +1,17 @@
 import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
-from tqdm import tqdm
+
+sys.path.append('../src_chapter_5')
+from energetics_store import read_life_cycles
+from binned_kde import cached_kde_1d, plot_density
 
 PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
 base_path = f'{PATH}/csv_database_energy_by_periods'
 output_directory = f'./figures/individual_pdfs/'
+kde_cache_directory = f'{base_path}_kde_cache'
 
 COLOR_TERMS = ["#3B95BF", "#87BF4B", "#BFAB37", "#BF3D3B", "#873e23", "#A13BF0"]
 
@@ -17,24 +21,6 @@ TICK_FONT_SIZE = 12
 TITLE_FONT_SIZE = 16
 LEGEND_FONT_SIZE = 12
 
-def read_life_cycles(base_path):
-    """
-    Reads all CSV files in the specified directory and collects DataFrame for each system.
-    """
-    systems_energetics = {}
-
-    for filename in tqdm(os.listdir(base_path), desc="Reading CSV files"):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(base_path, filename)
-            system_id = filename.split('_')[0]
-            try:
-                df = pd.read_csv(file_path)
-                systems_energetics[system_id] = df
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-
-    return systems_energetics
-
 def plot_individual_pdfs(systems_energetics, output_directory):
     """
     Plots the PDF for each term in the dataset in individual figures.
@@ -67,7 +53,9 @@ def plot_individual_pdfs(systems_energetics, output_directory):
         term_data = mean_data_melted[mean_data_melted['Term'] == term]
         if not term_data.empty:
             plt.figure(figsize=(8, 6))
-            sns.kdeplot(data=term_data, x='Value', bw_adjust=0.5, fill=True, color=COLOR_TERMS[idx % len(COLOR_TERMS)])
+            support, density = cached_kde_1d(kde_cache_directory, (term, 'system mean', 'all'),
+                                             term_data['Value'].values, bw_adjust=0.5)
+            plot_density(plt.gca(), support, density, fill=True, color=COLOR_TERMS[idx % len(COLOR_TERMS)])
             plt.title(f'PDF for {term}', fontsize=TITLE_FONT_SIZE)
             plt.xlabel('Value', fontsize=LABEL_FONT_SIZE)
             plt.ylabel('Density', fontsize=LABEL_FONT_SIZE)
@@ -1,6 +1,5 @@
 import os
 import pandas as pd
-import xarray as xr
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 import numpy as np
@@ -10,13 +9,17 @@ import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 from cartopy.feature import NaturalEarthFeature
 from datetime import timedelta
-import cdsapi
 import math
+import sys
 import metpy.calc as mpcalc
 from metpy.calc import vorticity
 from metpy.units import units
 import imageio.v2 as imageio
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'figures_chapter_3'))
+from era5_cache import era5_fields
+from era5_sources import data_source
+
 # Constants
 COLORS = ["#3B95BF", "#87BF4B", "#BFAB37", "#BF3D3B", "#873e23", "#A13BF0"]
 MARKERS = ["s", "o", "^", "v", "<", ">"]
@@ -29,6 +32,9 @@ LEGEND_FONT_SIZE = 10
 AXIS_LABEL_FONT_SIZE = 12
 TITLE_FONT_SIZE = 18
 crs_longlat = ccrs.PlateCarree()
+# Source of the ERA5 fields: 'cds', 'local' (directory=...) or 'synthetic', and its options
+ERA5_SOURCE = 'cds'
+ERA5_SOURCE_OPTIONS = {}
 
 def setup_gridlines(ax):
     gl = ax.gridlines(draw_labels=True, zorder=2, linestyle="-", alpha=0.8, color=TEXT_COLOR, linewidth=0.25)
@@ -62,18 +68,18 @@ def plot_variable(ax, variable, lat, lon, hgt=None, center_lon=None, center_lat=
     if center_lon is not None and center_lat is not None:
         ax.set_extent([center_lon - 7.5, center_lon + 7.5, center_lat - 7.5, center_lat + 7.5], crs=crs_longlat)
 
-def get_data_cdsapi(track, nc_file):
+def get_data_cdsapi(track):
     min_lat, max_lat = track["lat"].min(), track["lat"].max()
     min_lon, max_lon = track["lon"].min(), track["lon"].max()
     buffered_max_lat = math.ceil(max_lat + 15)
     buffered_min_lon = math.floor(min_lon - 15)
     buffered_min_lat = math.floor(min_lat - 15)
     buffered_max_lon = math.ceil(max_lon + 15)
-    area = f"{buffered_max_lat}/{buffered_min_lon}/{buffered_min_lat}/{buffered_max_lon}"
+    area = (buffered_max_lat, buffered_min_lon, buffered_min_lat, buffered_max_lon)
 
     variables = ["u_component_of_wind", "v_component_of_wind", "temperature", "geopotential"]
 
-    track_datetime_index = pd.DatetimeIndex(track.index)
+    track_datetime_index = pd.DatetimeIndex(track['date'])
     last_track_timestamp = track_datetime_index.max()
     last_possible_data_timestamp_for_day = pd.Timestamp(f"{last_track_timestamp.strftime('%Y-%m-%d')} 21:00:00")
     need_additional_day = last_track_timestamp > last_possible_data_timestamp_for_day
@@ -83,30 +89,17 @@ def get_data_cdsapi(track, nc_file):
         additional_day = (last_track_timestamp + timedelta(days=1)).strftime("%Y%m%d")
         dates = np.append(dates, additional_day)
 
-    time_range = f"{dates[0]}/{dates[-1]}"
-    time_step = str(int((track['date'].iloc[1] - track['date'].iloc[0]).total_seconds() / 3600))
-    time_step = "3" if time_step < "3" else time_step
-
-    c = cdsapi.Client(timeout=600)
-    c.retrieve(
-        "reanalysis-era5-pressure-levels",
-        {
-            "product_type": "reanalysis",
-            "format": "netcdf",
-            "pressure_level": 850,
-            "date": time_range,
-            "area": area,
-            "time": f"00/to/23/by/{time_step}",
-            "variable": variables,
-        },
-        nc_file
-    )
-
-def create_plots_for_gif(track, nc_file, output_dir):
+    time_step = int((track['date'].iloc[1] - track['date'].iloc[0]).total_seconds() / 3600)
+    time_step = max(time_step, 3)
+
+    # Fields from the local ERA5 cache, retrieving only what is missing
+    retrieve = data_source(ERA5_SOURCE, **ERA5_SOURCE_OPTIONS)
+    return era5_fields(variables, [850], area, dates[0], dates[-1], time_step, retrieve)
+
+def create_plots_for_gif(track, ds, output_dir):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    ds = xr.open_dataset(nc_file)
     u = ds['u'] * units('m/s')
     v = ds['v'] * units('m/s')
     t = ds['t'] * units('K')
@@ -160,14 +153,11 @@ def main():
     track = pd.read_csv(track_file)
     track['date'] = pd.to_datetime(track['date'])
     track_id = track["track_id"].unique()[0]
-    nc_file = f"{track_id}_ERA5.nc"
     output_dir = "output_frames"
     gif_name = "theta_animation.gif"
 
-    if not os.path.exists(nc_file):
-        get_data_cdsapi(track, nc_file)
-
-    create_plots_for_gif(track, nc_file, output_dir)
+    ds = get_data_cdsapi(track)
+    create_plots_for_gif(track, ds, output_dir)
     create_gif(output_dir, gif_name)
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 import os
+import sys
 from glob import glob
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -7,10 +8,10 @@ import matplotlib.animation as animation
 import cartopy.crs as ccrs
 import xarray as xr
 import matplotlib.colors as mcolors
-import numpy as np
 import matplotlib as mpl
-import matplotlib.ticker as mticker
-from cartopy.mpl.ticker import LongitudeFormatter, LatitudeFormatter
+
+sys.path.append('../../src_chapter_4')
+from basemap import basemap, draw_basemap
 
 # Configuration
 INFILES_DIRECTORY = '/Users/danilocoutodesouza/Documents/Programs_and_scripts/SWSA-cyclones_energetic-analysis/periods_species_statistics/70W-no-continental/track_density'
@@ -27,34 +28,8 @@ proj = ccrs.AlbersEqualArea(central_longitude=-30, central_latitude=-35, standar
 os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
 
 # Utility Functions
-def gridlines(ax):
-    gl = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed',
-                      alpha=0.6, color='#383838', linewidth=0.5)
-    gl.xlocator = mticker.FixedLocator(np.arange(-180, 181, 10))
-    gl.ylocator = mticker.FixedLocator(np.arange(-90, 91, 10))
-    gl.xformatter = LongitudeFormatter()
-    gl.yformatter = LatitudeFormatter()
-    gl.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.bottom_labels = False
-    gl.right_labels = False
-    gl.top_labels = False
-    gl.left_labels = False
-
-    gl2 = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed', alpha=0, color='#383838')
-    gl2.xlocator = mticker.FixedLocator(np.arange(-180, 181, 20))
-    gl2.ylocator = mticker.FixedLocator(np.arange(-90, 91, 20))
-    gl2.xformatter = LongitudeFormatter()
-    gl2.yformatter = LatitudeFormatter()
-    gl2.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.bottom_labels = False
-    gl2.right_labels = False
-    gl2.top_labels = True
-    gl2.left_labels = True
-
 def plot_density(ax, phase, density, label):
-    ax.set_extent([-80, 50, -15, -90], crs=datacrs)
+    draw_basemap(ax, basemap(proj, [-80, 50, -15, -90]))
     cmap = mcolors.LinearSegmentedColormap.from_list("", COLORS)
 
     levels_dict = {
@@ -76,8 +51,6 @@ def plot_density(ax, phase, density, label):
     cf = ax.contourf(lon, lat, density, cmap=cmap, levels=levels, norm=norm, transform=datacrs)
     ax.contour(lon, lat, density, levels=levels, norm=norm, colors='#383838', linewidths=0.35, linestyles='dashed', transform=datacrs)
     ax.text(0.85, 0.85, label, ha='left', va='bottom', fontsize=16, fontweight='bold', bbox=dict(boxstyle='round', facecolor='white'), transform=ax.transAxes)
-    ax.coastlines()
-    gridlines(ax)
     return cf
 
 def load_density(region, season, phase):
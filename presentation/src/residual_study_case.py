@@ -10,8 +10,8 @@
 #                                                                              #
 # **************************************************************************** #
 
-import cdsapi
 import math
+import sys
 import xarray as xr
 import os
 import logging
@@ -37,6 +37,10 @@ from metpy.constants import g
 from cyclophaser import determine_periods
 from cyclophaser.determine_periods import periods_to_dict, process_vorticity
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'figures_chapter_3'))
+from era5_cache import era5_fields
+from era5_sources import data_source
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -44,6 +48,9 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 TRACKS_DIRECTORY = "/Users/danilocoutodesouza/Documents/Programs_and_scripts/SWSA-cyclones_energetic-analysis/processed_tracks_with_periods"
 STUDY_CASE = 19820697 #19920876
 CRS = ccrs.PlateCarree() 
+# Source of the ERA5 fields: 'cds', 'local' (directory=...) or 'synthetic', and its options
+ERA5_SOURCE = 'cds'
+ERA5_SOURCE_OPTIONS = {}
 OUTPUT_DIRECTORY = '../animations/'
 
 # Define the custom colormap
@@ -56,7 +63,7 @@ custom_cmap = LinearSegmentedColormap.from_list(cmap_name, colors_cmap, N=9)
 color_dots = ['#d62828', '#9aa981', 'gray']
 labels = ["(A)", "(B)", "(C)", "(D)"]
 
-def get_cdsapi_data(track, infile) -> xr.Dataset:
+def get_cdsapi_data(track) -> xr.Dataset:
     # Extract bounding box (lat/lon limits) from track
     min_lat, max_lat = track['lat vor'].min(), track['lat vor'].max()
     min_lon, max_lon = track['lon vor'].min(), track['lon vor'].max()
@@ -67,8 +74,8 @@ def get_cdsapi_data(track, infile) -> xr.Dataset:
     buffered_min_lat = math.floor(min_lat - 15)
     buffered_max_lon = math.ceil(max_lon + 15)
 
-    # Define the area for the request
-    area = f"{buffered_max_lat}/{buffered_min_lon}/{buffered_min_lat}/{buffered_max_lon}"
+    # Define the area for the request (north, west, south, east)
+    area = (buffered_max_lat, buffered_min_lon, buffered_min_lat, buffered_max_lon)
 
     pressure_levels = ['1', '2', '3', '5', '7', '10', '20', '30', '50', '70',
                        '100', '125', '150', '175', '200', '225', '250', '300', '350',
@@ -90,33 +97,12 @@ def get_cdsapi_data(track, infile) -> xr.Dataset:
     logging.info(f"Buffered Data Bounds: min_lon: {buffered_min_lon}, max_lon: {buffered_max_lon}, min_lat: {buffered_min_lat}, max_lat: {buffered_max_lat}")
     logging.info(f"Requesting data for time range: {time_range}, and time step: {time_step}...")
 
-    # Load ERA5 data
-    logging.info("Retrieving data from CDS API...")
-    c = cdsapi.Client()
-    try:
-        c.retrieve(
-            "reanalysis-era5-pressure-levels",
-            {
-                "product_type": "reanalysis",
-                "format": "netcdf",
-                "pressure_level": pressure_levels,
-                "date": time_range,
-                "area": area,
-                'time': f'00/to/23/by/{time_step}',
-                "variable": variables,
-            }, infile
-        )
-    except Exception as e:
-        logging.error(f"Error retrieving data from CDS API: {e}")
-        raise
-
-    if not os.path.exists(infile):
-        raise FileNotFoundError("CDS API file not created.")
-    
+    # Load ERA5 data, retrieving only what is not in the local cache
+    retrieve = data_source(ERA5_SOURCE, **ERA5_SOURCE_OPTIONS)
     try:
-        ds = xr.open_dataset(infile)
+        ds = era5_fields(variables, pressure_levels, area, start_date, end_date, time_step, retrieve)
     except Exception as e:
-        logging.error(f"Error opening dataset: {e}")
+        logging.error(f"Error retrieving ERA5 data: {e}")
         raise
 
     return ds
@@ -221,16 +207,12 @@ def main():
         return
 
     track = tracks[tracks['track_id'] == STUDY_CASE]
-    infile = f"../data/{STUDY_CASE}.nc"
-
-    if not os.path.exists(infile):
-        try:
-            ds = get_cdsapi_data(track, infile)
-        except FileNotFoundError as e:
-            logging.error(e)
-            return
-    else:
-        ds = xr.open_dataset(infile)
+
+    try:
+        ds = get_cdsapi_data(track)
+    except FileNotFoundError as e:
+        logging.error(e)
+        return
 
     # Data processing
     ds = ds.sel(time=slice(track['date'].min(), track['date'].max()))
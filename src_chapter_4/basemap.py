@@ -0,0 +1,265 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    basemap.py                                         :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/07/05 10:14:52 by daniloceano       #+#    #+#              #
+#    Updated: 2024/07/05 10:14:52 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Cached basemap layers (coastlines, borders, states, land and gridlines) of the
+map figures.
+
+ax.coastlines(), ax.add_feature() and ax.gridlines() project the Natural Earth
+geometries and the grid lines again for every panel. basemap() does it once per
+(projection, extent, features, gridlines): the geometries that intersect the
+map are projected and kept as matplotlib paths, and the meridians and parallels
+as projected lines. The layers are kept in memory and saved as .npz in
+BASEMAP_CACHE_DIR, so other figures and later runs only add the paths to their
+axes with draw_basemap().
+
+The labels are still drawn by a cartopy Gridliner without lines (as the
+label-only gridlines of the original figures), so their positions, the labels
+hidden at the corners and the room left for the titles are cartopy's.
+
+The resolution of the features is chosen from the extent of the map as in
+cartopy's auto_scaler, and their default styles are those of ax.coastlines()
+and of cartopy.feature.BORDERS, STATES and LAND.
+"""
+
+import os
+import hashlib
+import numpy as np
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+import shapely
+
+from collections import namedtuple
+from matplotlib.collections import LineCollection, PathCollection
+from matplotlib.path import Path
+from cartopy.mpl.ticker import LongitudeFormatter, LatitudeFormatter
+
+BASEMAP_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'results_chapter_4', 'basemap_cache')
+
+# Natural Earth (category, name) and default style of each feature
+FEATURES = {
+    'coastlines': (('physical', 'coastline'), {'edgecolor': 'black', 'facecolor': 'none', 'zorder': 1.5}),
+    'borders': (('cultural', 'admin_0_boundary_lines_land'), {'edgecolor': 'black', 'facecolor': 'none', 'zorder': 1.5}),
+    'states': (('cultural', 'admin_1_states_provinces_lakes'), {'edgecolor': 'black', 'facecolor': 'none', 'zorder': 1.5}),
+    'land': (('physical', 'land'), {'edgecolor': 'none', 'facecolor': cfeature.COLORS['land'], 'zorder': -1}),
+}
+
+# xlocs, ylocs: meridians and parallels; lines: style of the lines (None to only
+# draw the labels); labels: sides of the frame labelled ('top', 'bottom', 'left', 'right'),
+# drawn by a cartopy Gridliner with the label styles
+GridlineLayer = namedtuple('GridlineLayer', ['xlocs', 'ylocs', 'lines', 'labels', 'xlabel_style', 'ylabel_style'])
+
+# Dashed 10-degree lines and 20-degree labels on the top and left (chapters 4 and 6)
+TWO_LAYER_GRIDLINES = (
+    GridlineLayer(tuple(range(-180, 181, 10)), tuple(range(-90, 91, 10)),
+                  {'linestyle': 'dashed', 'alpha': 0.6, 'color': '#383838', 'linewidth': 0.5, 'zorder': 2},
+                  (), {}, {}),
+    GridlineLayer(tuple(range(-180, 181, 20)), tuple(range(-90, 91, 20)), None, ('top', 'left'),
+                  {'rotation': 0, 'ha': 'center', 'fontsize': 12}, {'rotation': 0, 'ha': 'center', 'fontsize': 12}),
+)
+
+# Single layer with labels on the bottom and left (manuscript_lec_climatology)
+MANUSCRIPT_GRIDLINES = (
+    GridlineLayer(tuple(range(-90, 181, 20)), tuple(range(-90, 91, 10)),
+                  {'linestyle': 'dashed', 'alpha': 0.5, 'color': '#383838', 'linewidth': 0.25, 'zorder': 100},
+                  ('bottom', 'left'), {'size': 12, 'color': '#383838'},
+                  {'size': 12, 'color': '#383838', 'rotation': 45}),
+)
+
+LINE_SAMPLES = 181
+
+# xlim, ylim: limits of the map in projection coordinates; features: {name: [Path]};
+# gridlines: one (GridlineLayer, lines) per layer
+Basemap = namedtuple('Basemap', ['xlim', 'ylim', 'features', 'gridlines'])
+
+_basemaps = {}
+
+def map_limits(projection, extent, crs=ccrs.PlateCarree()):
+    """
+    Limits of the map (as ax.set_extent) in projection coordinates.
+    """
+    x1, x2, y1, y2 = extent
+    box = shapely.LineString([[x1, y1], [x2, y1], [x2, y2], [x1, y2], [x1, y1]])
+    if isinstance(projection, ccrs.PlateCarree) and projection.boundary.equals(box):
+        projected = projection.boundary
+    else:
+        projected = projection.project_geometry(box, crs)
+    x1, y1, x2, y2 = projected.bounds
+    return (x1, x2), (y1, y2)
+
+def _geographic_extent(projection, xlim, ylim, n=LINE_SAMPLES):
+    # Longitude/latitude bounds of the map frame (as ax.get_extent)
+    x, y = np.linspace(*xlim, n), np.linspace(*ylim, n)
+    frame = np.concatenate([np.c_[x, np.full(n, ylim[0])], np.c_[np.full(n, xlim[1]), y],
+                            np.c_[x[::-1], np.full(n, ylim[1])], np.c_[np.full(n, xlim[0]), y[::-1]]])
+    lonlat = ccrs.PlateCarree().transform_points(projection, frame[:, 0], frame[:, 1])[:, :2]
+    lonlat = lonlat[np.isfinite(lonlat).all(axis=1)]
+    return [lonlat[:, 0].min(), lonlat[:, 0].max(), lonlat[:, 1].min(), lonlat[:, 1].max()]
+
+def _to_path(geometry):
+    # matplotlib Path of a (multi) line or polygon
+    parts = getattr(geometry, 'geoms', [geometry])
+    vertices, codes = [], []
+    for part in parts:
+        if part.is_empty:
+            continue
+        rings = [part.exterior, *part.interiors] if isinstance(part, shapely.Polygon) else [part]
+        for ring in rings:
+            coords = np.asarray(ring.coords)[:, :2]
+            ring_codes = np.full(len(coords), Path.LINETO, dtype=Path.code_type)
+            ring_codes[0] = Path.MOVETO
+            if isinstance(part, shapely.Polygon):
+                ring_codes[-1] = Path.CLOSEPOLY
+            vertices.append(coords)
+            codes.append(ring_codes)
+    if not vertices:
+        return None
+    return Path(np.concatenate(vertices), np.concatenate(codes))
+
+def _project_feature(projection, name, extent, scale):
+    (category, ne_name), _ = FEATURES[name]
+    feature = cfeature.NaturalEarthFeature(category, ne_name, scale)
+    paths = []
+    for geometry in feature.intersecting_geometries(extent):
+        path = _to_path(projection.project_geometry(geometry, feature.crs))
+        if path is not None:
+            paths.append(path)
+    return paths
+
+def _grid_line_points(projection, xlocs, ylocs, n=LINE_SAMPLES):
+    # Projected meridians and parallels, split where they leave the projection domain
+    central_lon = projection.proj4_params.get('lon_0', 0)
+    lats = np.linspace(-90, 90, n)
+    lons = np.linspace(central_lon - 180, central_lon + 180, 2 * n)
+    lines = [(np.full(n, lon), lats, 'x', lon) for lon in xlocs] + \
+            [(lons, np.full(2 * n, lat), 'y', lat) for lat in ylocs]
+    projected = []
+    for lon, lat, kind, value in lines:
+        xy = projection.transform_points(ccrs.PlateCarree(), lon, lat)[:, :2]
+        finite = np.isfinite(xy).all(axis=1)
+        for segment in np.split(xy, np.flatnonzero(np.diff(finite.astype(np.int8)) != 0) + 1):
+            if len(segment) > 1 and np.isfinite(segment).all():
+                projected.append((segment, kind, value))
+    return projected
+
+def _project_gridlines(projection, layer):
+    return layer, [segment for segment, _, _ in _grid_line_points(projection, layer.xlocs, layer.ylocs)]
+
+def _cache_path(key, cache_dir):
+    return os.path.join(cache_dir, f'basemap_{hashlib.sha1(repr(key).encode()).hexdigest()[:16]}.npz')
+
+def _pack_lines(arrays, prefix, lines):
+    arrays[f'{prefix}_vertices'] = np.concatenate(lines) if lines else np.empty((0, 2))
+    arrays[f'{prefix}_lengths'] = np.array([len(line) for line in lines], dtype=np.int64)
+
+def _pack_paths(arrays, prefix, paths):
+    _pack_lines(arrays, prefix, [p.vertices for p in paths])
+    arrays[f'{prefix}_codes'] = np.concatenate([p.codes for p in paths]) if paths else np.empty(0, dtype=np.uint8)
+
+def _unpack_paths(saved, prefix, with_codes=True):
+    bounds = np.r_[0, np.cumsum(saved[f'{prefix}_lengths'])]
+    vertices = saved[f'{prefix}_vertices']
+    codes = saved[f'{prefix}_codes'] if with_codes else None
+    return [Path(vertices[a:b], None if codes is None else codes[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+def save_basemap(layers, path):
+    arrays = {'xlim': np.asarray(layers.xlim), 'ylim': np.asarray(layers.ylim),
+              'features': np.asarray(list(layers.features), dtype=str)}
+    for name, paths in layers.features.items():
+        _pack_paths(arrays, f'feature_{name}', paths)
+    for i, (_, lines) in enumerate(layers.gridlines):
+        _pack_lines(arrays, f'grid{i}', lines)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Worker processes may build the same basemap at the same time
+    tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+def load_basemap(path, gridlines=TWO_LAYER_GRIDLINES):
+    """
+    Basemap saved by save_basemap, with the GridlineLayers it was built for.
+    """
+    with np.load(path) as saved:
+        features = {name: _unpack_paths(saved, f'feature_{name}') for name in saved['features']}
+        layers = []
+        for i, layer in enumerate(gridlines):
+            lines = [p.vertices for p in _unpack_paths(saved, f'grid{i}', with_codes=False)]
+            layers.append((layer, lines))
+        return Basemap(tuple(saved['xlim']), tuple(saved['ylim']), features, layers)
+
+def basemap(projection, extent, features=('coastlines',), gridlines=TWO_LAYER_GRIDLINES, scale='auto',
+            cache_dir=BASEMAP_CACHE_DIR):
+    """
+    Projected basemap layers of a map, from memory, from cache_dir or built.
+
+    Parameters:
+    - projection: cartopy projection of the axes.
+    - extent: (x0, x1, y0, y1) of the map in PlateCarree, as in ax.set_extent.
+    - features: Keys of FEATURES to project.
+    - gridlines: GridlineLayers (e.g., TWO_LAYER_GRIDLINES or MANUSCRIPT_GRIDLINES).
+    - scale: Natural Earth resolution ('110m', '50m', '10m') or 'auto'.
+
+    Returns:
+    - Basemap to be drawn with draw_basemap.
+    """
+    key = (projection.proj4_init, tuple(float(e) for e in extent), tuple(features), scale,
+           tuple((layer.xlocs, layer.ylocs) for layer in gridlines))
+    if key in _basemaps:
+        return _basemaps[key]
+
+    path = _cache_path(key, cache_dir)
+    if os.path.exists(path):
+        layers = load_basemap(path, gridlines)
+    else:
+        xlim, ylim = map_limits(projection, extent)
+        geographic_extent = _geographic_extent(projection, xlim, ylim)
+        if scale == 'auto':
+            scale = cfeature.AdaptiveScaler('110m', (('50m', 50), ('10m', 15))).scale_from_extent(geographic_extent)
+        layers = Basemap(xlim, ylim,
+                         {name: _project_feature(projection, name, geographic_extent, scale) for name in features},
+                         [_project_gridlines(projection, layer) for layer in gridlines])
+        save_basemap(layers, path)
+    _basemaps[key] = layers
+    return layers
+
+def draw_basemap(ax, layers, **styles):
+    """
+    Sets the extent of a map and adds the basemap layers to it.
+
+    Parameters:
+    - ax: GeoAxes with the projection of the basemap.
+    - layers: Basemap returned by basemap().
+    - styles: Style of each feature overriding FEATURES, e.g.,
+      land={'color': 'gray', 'alpha': 0.3}.
+    """
+    ax.set_xlim(layers.xlim)
+    ax.set_ylim(layers.ylim)
+
+    for name, paths in layers.features.items():
+        style = {**FEATURES[name][1], **styles.get(name, {})}
+        if 'color' in style:
+            style.pop('edgecolor'), style.pop('facecolor')
+        ax.add_collection(PathCollection(paths, transform=ax.transData, **style), autolim=False)
+
+    for layer, lines in layers.gridlines:
+        if layer.lines is not None:
+            ax.add_collection(LineCollection(lines, transform=ax.transData, **layer.lines), autolim=False)
+        if layer.labels:
+            # Labels only: the lines of the Gridliner are transparent
+            gl = ax.gridlines(draw_labels=True, xlocs=list(layer.xlocs), ylocs=list(layer.ylocs), alpha=0,
+                              zorder=(layer.lines or {}).get('zorder', 2))
+            gl.xformatter = LongitudeFormatter()
+            gl.yformatter = LatitudeFormatter()
+            for side in ('top', 'bottom', 'left', 'right'):
+                setattr(gl, f'{side}_labels', side in layer.labels)
+            gl.xlabel_style = dict(layer.xlabel_style)
+            gl.ylabel_style = dict(layer.ylabel_style)
@@ -1,7 +1,8 @@
 import os
-from glob import glob
 import pandas as pd
 
+from periods_index import update_periods_index, phase_sequences, system_starts
+
 PERIODS_DIR = '/Users/danilocoutodesouza/Documents/Programs_and_scripts/SWSA-cyclones_energetic-analysis/periods-energetics'
 
 def abbreviate_phase_name(phase_name):
@@ -48,9 +49,11 @@ def main():
 
     for region in regions:
 
-        # Get list of csv files
+        # Get the periods of all systems from the (cached) periods index
         region_dir = f'{PERIODS_DIR}/70W-no-continental_{region}' if region else f'{PERIODS_DIR}/70W-no-continental'
-        csv_files = glob(f'{region_dir}/*')
+        index = update_periods_index(region_dir)
+        sequences = phase_sequences(index)
+        starts = system_starts(index)
 
         # Initialize counter for total count of systems
         total_systems_season = {'DJF': 0, 'MAM': 0, 'JJA': 0, 'SON': 0}
@@ -58,31 +61,22 @@ def main():
         phase_counts = {}
         species_list = {}
 
-        total_systems = len(csv_files)
-
-        # Check if the CSV file contains the desired region in the prefix
-        for csv_file in csv_files:
-            if region in csv_file:
-                df = pd.read_csv(csv_file, index_col=[0])
-            else:
-                continue 
+        total_systems = len(sequences)
 
-            phases = list(df.index)
-            phase_arrangement = ', '.join(phases)
+        for track_id, phase_arrangement in sequences.items():
             phase_counts[phase_arrangement] = phase_counts.get(phase_arrangement, 0) + 1
 
             # Add species to list
-            cyclone_id = csv_file.split('/')[-1].split('.')[0]
+            cyclone_id = f'{region}_{track_id}'
             if phase_arrangement not in list(species_list.keys()):
                 species_list[phase_arrangement] = []
             species_list[phase_arrangement].append(cyclone_id)
 
             # Get the month of the system_start
-            if len(df.columns) > 0:
-                system_start = pd.to_datetime(df.iloc[0][0])
-                system_month = system_start.month
-            else:
+            system_start = starts.get(track_id)
+            if pd.isna(system_start):
                 continue
+            system_month = system_start.month
 
             # Find the corresponding season in the month_season_map
             corresponding_season = month_season_map[system_month]
@@ -0,0 +1,228 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    density_accumulator.py                             :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/21 09:35:12 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/21 09:35:12 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Appendable track density accumulators keyed by month.
+
+For each region, {region}_track_density_months.nc stores the unnormalized kernel
+sums of every phase layer for every month (dimensions month, phase, lat, lon),
+plus the number of positions per month. The density is linear in the kernel
+sums, so the climatology of any sub-period and season is the sum over the
+selected months divided by the number of months with positions, without going
+back to the raw tracks.
+
+When new tracks arrive only their months are accumulated and appended; months
+that were reprocessed replace the stored ones.
+
+Note: the peak_intensity layer uses the maximum vor42 of the whole track, so its
+seasonal slices are not the per-season maxima of density_layers.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from track_density import bin_positions, kernel_sums, density_from_kernel_sums, density_grid
+from density_layers import SEASON_MONTHS, PEAK_INTENSITY, peak_intensity_mask
+from phase_labeller import label_phases
+from export_density_all import DATABASE_DIRECTORY, get_tracks, filter_tracks_area, get_periods
+
+MONTHS_PER_CHUNK = 12  # months binned together, bounds the memory of the lattice
+
+def accumulate_months(tracks, phases, months=None):
+    """
+    Monthly kernel sums of the phase layers (plus peak_intensity) of the tracks.
+
+    Parameters:
+    - tracks: DataFrame with 'track_id', 'date', 'lat vor', 'lon vor', 'vor42'
+      and 'period' (positions of a single region).
+    - phases: Phase layers to accumulate.
+    - months: Only accumulate these months (first day of each month). The peak
+      intensity is still taken over the whole tracks.
+
+    Returns:
+    - xr.Dataset with 'kernel_sum' (month, phase, lat, lon), 'num_positions'
+      (month, phase) and 'num_rows' (month, all positions of the month).
+    """
+    layers = list(phases) + [PEAK_INTENSITY]
+    n_layers = len(layers)
+
+    peak = peak_intensity_mask(tracks)
+    dates = pd.to_datetime(tracks['date'])
+    if months is not None:
+        in_months = dates.dt.to_period('M').dt.to_timestamp().isin(pd.to_datetime(months)).to_numpy()
+        tracks, dates, peak = tracks[in_months], dates[in_months], peak[in_months]
+    month_index = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy()
+    months, month_codes = np.unique(month_index, return_inverse=True)
+    phase_codes = pd.Categorical(tracks['period'], categories=phases).codes.astype(np.int64)
+
+    keep = phase_codes >= 0
+    rows = np.concatenate([np.flatnonzero(keep), np.flatnonzero(peak)])
+    codes = np.concatenate([phase_codes[keep], np.full(peak.sum(), n_layers - 1)])
+    lat = tracks['lat vor'].to_numpy()[rows]
+    lon = tracks['lon vor'].to_numpy()[rows]
+    row_months = month_codes[rows]
+
+    longrd, latgrd = density_grid()
+    sums = np.zeros((len(months), n_layers, len(latgrd), len(longrd)), dtype=np.float32)
+    for first in range(0, len(months), MONTHS_PER_CHUNK):
+        last = min(first + MONTHS_PER_CHUNK, len(months))
+        in_chunk = (row_months >= first) & (row_months < last)
+        groups = (row_months[in_chunk] - first) * n_layers + codes[in_chunk]
+        counts = bin_positions(lat[in_chunk], lon[in_chunk], groups=groups, n_groups=(last - first) * n_layers)
+        sums[first:last] = kernel_sums(counts).reshape(last - first, n_layers, len(latgrd), len(longrd))
+
+    num_positions = np.bincount(row_months * n_layers + codes, minlength=len(months) * n_layers)
+    num_rows = np.bincount(month_codes, minlength=len(months))
+
+    month_coord = pd.to_datetime({'year': months // 12, 'month': months % 12 + 1, 'day': 1})
+    return xr.Dataset(
+        {
+            'kernel_sum': (('month', 'phase', 'lat', 'lon'), sums),
+            'num_positions': (('month', 'phase'), num_positions.reshape(len(months), n_layers)),
+            'num_rows': (('month',), num_rows),
+        },
+        coords={'month': month_coord.values, 'phase': layers, 'lat': latgrd, 'lon': longrd},
+    )
+
+def accumulator_path(directory, region):
+    return os.path.join(directory, f'{region}_track_density_months.nc')
+
+def load_accumulator(path):
+    """
+    Loads an accumulator store fully in memory (so the file can be rewritten).
+    """
+    if not os.path.exists(path):
+        return None
+    with xr.open_dataset(path) as ds:
+        return ds.load()
+
+def _write(accumulator, path):
+    tmp_path = f'{path}.tmp'
+    accumulator.to_netcdf(tmp_path)
+    os.replace(tmp_path, path)
+
+def append_months(path, new):
+    """
+    Appends the months of new to the store, replacing months already stored.
+    """
+    stored = load_accumulator(path)
+    if stored is not None:
+        stored = stored.sel(month=~stored['month'].isin(new['month'].values))
+        new = xr.concat([stored, new], dim='month', join='outer', fill_value=0).sortby('month')
+    _write(new, path)
+    return new
+
+def remove_months(path, months):
+    """
+    Removes months (e.g., to be reprocessed) from the store.
+
+    Parameters:
+    - path: Accumulator store.
+    - months: First day of each month, as any array-like of dates (e.g., the
+      unique() of a datetime Series).
+    """
+    stored = load_accumulator(path)
+    if stored is None:
+        raise FileNotFoundError(f"No accumulator store at {path}")
+    months = pd.DatetimeIndex(months).values
+    stored = stored.sel(month=~stored['month'].isin(months))
+    _write(stored, path)
+    return stored
+
+def climatology(accumulator, start=None, end=None, season=None):
+    """
+    Track density of the months between start and end (inclusive) and, if
+    given, of a season ('DJF', 'MAM', 'JJA' or 'SON').
+
+    The normalization is the same as the exporters: divided by the number of
+    months with positions.
+    """
+    selected = accumulator.sel(month=slice(start, end))
+    if season:
+        selected = selected.sel(month=selected['month'].dt.month.isin(SEASON_MONTHS[season]))
+
+    num_time = int((selected['num_rows'] > 0).sum())
+    sums = selected['kernel_sum'].sum('month', dtype=np.float64)
+    density = density_from_kernel_sums(sums, num_time) if num_time else sums * 0.
+    density.name = 'track_density'
+    density.attrs['units'] = 'positions / 10^6 km^2 / month'
+    density.attrs['num_time'] = num_time
+    return density
+
+def check_append_remove():
+    """
+    Appends two months of synthetic tracks to a temporary store, removes one
+    with the unique() months of a Series (as main builds them) and checks the
+    reloaded store.
+    """
+    import tempfile
+
+    tracks = pd.DataFrame({
+        'track_id': [1, 1, 2, 2],
+        'date': pd.to_datetime(['2000-01-03', '2000-01-04', '2000-02-03', '2000-02-04']),
+        'lat vor': [-30., -31., -35., -36.],
+        'lon vor': [-50., -49., -45., -44.],
+        'vor42': [-1e-5, -2e-5, -1e-5, -3e-5],
+        'period': ['incipient', 'mature', 'incipient', 'mature'],
+    })
+    phases = ['incipient', 'mature']
+    with tempfile.TemporaryDirectory() as directory:
+        path = accumulator_path(directory, 'TEST')
+        try:
+            remove_months(path, [])
+            raise AssertionError("remove_months did not raise without a store")
+        except FileNotFoundError:
+            pass
+
+        append_months(path, accumulate_months(tracks, phases))
+        january = tracks.loc[tracks['date'].dt.month == 1, 'date'].dt.to_period('M').dt.to_timestamp().unique()
+        remove_months(path, january)
+
+        reloaded = load_accumulator(path)
+        expected = accumulate_months(tracks, phases, months=[pd.Timestamp('2000-02-01')])
+        assert list(pd.DatetimeIndex(reloaded['month'].values)) == [pd.Timestamp('2000-02-01')]
+        xr.testing.assert_allclose(reloaded, expected)
+    print("Appended two months, removed one and reloaded the store: OK")
+
+def main():
+    analysis_type = '70W-no-continental'
+    phases = ['incipient', 'intensification', 'mature', 'decay',
+              'intensification 2', 'mature 2', 'decay 2', 'residual']
+    output_directory = '../results_chapter_4/track_density_months'
+    os.makedirs(output_directory, exist_ok=True)
+
+    tracks = get_tracks()
+    for region in ['ARG', 'LA-PLATA', 'SE-BR']:
+        print(f"Region: {region}")
+        path = accumulator_path(output_directory, region)
+        stored = load_accumulator(path)
+
+        region_tracks = filter_tracks_area(tracks, region)
+        periods = get_periods(analysis_type, f'{DATABASE_DIRECTORY}/{analysis_type}_{region}/')
+        region_tracks = region_tracks[region_tracks['track_id'].isin(periods['track_id'])].reset_index(drop=True)
+        region_tracks['period'] = label_phases(region_tracks, periods)
+
+        # Only accumulate the months that are not in the store yet
+        months = pd.to_datetime(region_tracks['date']).dt.to_period('M').dt.to_timestamp().unique()
+        if stored is not None:
+            months = months[~months.isin(pd.DatetimeIndex(stored['month'].values))]
+        if len(months) == 0:
+            print("No new months.")
+            continue
+
+        append_months(path, accumulate_months(region_tracks, phases, months=months))
+        print(f'Wrote {path}')
+
+if __name__ == '__main__':
+    main()
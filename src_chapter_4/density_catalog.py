@@ -0,0 +1,136 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    density_catalog.py                                 :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/07/06 09:48:13 by daniloceano       #+#    #+#              #
+#    Updated: 2024/07/06 09:48:13 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Catalog of the track density files of the genesis regions.
+
+The <region>_track_density[_<season>].nc files (written by export_density_all)
+are opened once, lazily: a phase is only read from disk the first time it is
+used, and then kept. The combined fields ('SAt', the sum of the regions, and
+sums over seasons or phases) and the differences (DJF - JJA, region - total)
+are computed on first use and cached too, so a figure run reads each variable
+and computes each sum only once, however many panels use it.
+
+The cached DataArrays are read-only; operations on them (a + b, a - b) return
+new arrays, but in-place operations (a += b) raise an error.
+"""
+
+import os
+import xarray as xr
+
+from functools import lru_cache
+
+DENSITY_REGIONS = ('ARG', 'LA-PLATA', 'SE-BR')
+COMBINED_REGION = 'SAt'
+
+_datasets = {}
+
+def density_file(directory, region, season=None):
+    season_str = f"_{season}" if season else ""
+    return os.path.join(directory, f'{region}_track_density{season_str}.nc')
+
+def open_density_file(directory, region, season=None):
+    """
+    Dataset of a region and season (None for the whole period), opened once
+    without reading its variables, or None if the file does not exist.
+    """
+    infile = density_file(directory, region, season)
+    if infile not in _datasets:
+        if os.path.exists(infile):
+            _datasets[infile] = xr.open_dataset(infile)
+        else:
+            print(f"File not found: {infile}")
+            _datasets[infile] = None
+    return _datasets[infile]
+
+def _read_only(array):
+    array.values.flags.writeable = False
+    return array
+
+def _sum(arrays):
+    total = None
+    for array in arrays:
+        if array is not None:
+            total = array.copy() if total is None else total + array
+    return None if total is None else _read_only(total)
+
+@lru_cache(maxsize=None)
+def density_field(directory, region, season, phase):
+    """
+    Track density of a region, season and phase.
+
+    Parameters:
+    - directory: Directory of the track density files.
+    - region: A genesis region, COMBINED_REGION (sum of DENSITY_REGIONS) or a
+      tuple of regions to be summed.
+    - season: 'DJF', 'JJA', ..., None (whole period) or a tuple of seasons to
+      be summed.
+    - phase: A phase (variable of the files) or a tuple of phases to be summed.
+
+    Returns:
+    - Read-only DataArray, or None if none of the files exist.
+    """
+    if region == COMBINED_REGION:
+        region = DENSITY_REGIONS
+    if isinstance(region, tuple):
+        return _sum(density_field(directory, r, season, phase) for r in region)
+    if isinstance(season, tuple):
+        return _sum(density_field(directory, region, s, phase) for s in season)
+    if isinstance(phase, tuple):
+        return _sum(density_field(directory, region, season, p) for p in phase)
+
+    ds = open_density_file(directory, region, season)
+    if ds is None:
+        return None
+    return _read_only(ds[phase].load())
+
+@lru_cache(maxsize=None)
+def normalized_density(directory, region, season, phase):
+    """
+    Density scaled to [0, 1] by its minimum and maximum.
+    """
+    field = density_field(directory, region, season, phase)
+    if field is None:
+        return None
+    return _read_only((field - field.min()) / (field.max() - field.min()))
+
+@lru_cache(maxsize=None)
+def season_difference(directory, region, phase, seasons=('DJF', 'JJA')):
+    """
+    Density of the first season minus that of the second (DJF - JJA).
+    """
+    first, second = (density_field(directory, region, season, phase) for season in seasons)
+    if first is None or second is None:
+        return None
+    return _read_only(first - second)
+
+@lru_cache(maxsize=None)
+def region_anomaly(directory, region, season, phase):
+    """
+    Density of a region minus the combined density of all regions.
+    """
+    field = density_field(directory, region, season, phase)
+    total = density_field(directory, COMBINED_REGION, season, phase)
+    if field is None or total is None:
+        return None
+    return _read_only(field - total)
+
+def close_catalog():
+    """
+    Closes the files and clears the cached fields.
+    """
+    for cached in (density_field, normalized_density, season_difference, region_anomaly):
+        cached.cache_clear()
+    for ds in _datasets.values():
+        if ds is not None:
+            ds.close()
+    _datasets.clear()
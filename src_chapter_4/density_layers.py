@@ -0,0 +1,167 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    density_layers.py                                  :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/20 11:02:47 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/20 11:02:47 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Batched export of all track density layers (season x phase) of each region.
+
+Every position gets integer codes for its region, season and layer (its phase,
+plus the 'peak_intensity' layer for the position of maximum vor42 of each
+track). All layers of a region are binned in one pass and convolved together
+with the shared stencils of track_density, instead of filtering the DataFrame
+and refitting a KDE for every season/phase combination. The 'total' season is
+the sum of the kernel sums of the four seasons, except for 'peak_intensity',
+whose maximum is taken within each season (as the per-season files did) and
+over the whole track for 'total'.
+
+Output is one netCDF per region with dimensions (season, phase, lat, lon).
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from track_density import bin_positions, kernel_sums, density_from_kernel_sums, density_grid
+
+SEASON_MONTHS = {
+    'DJF': [12, 1, 2],
+    'MAM': [3, 4, 5],
+    'JJA': [6, 7, 8],
+    'SON': [9, 10, 11],
+}
+SEASONS = list(SEASON_MONTHS) + ['total']
+PEAK_INTENSITY = 'peak_intensity'
+
+# Season code (position in SEASONS) of each month, index 0 unused
+MONTH_TO_SEASON = np.zeros(13, dtype=np.int64)
+for code, months in enumerate(SEASON_MONTHS.values()):
+    MONTH_TO_SEASON[months] = code
+
+def peak_intensity_mask(tracks, by=None):
+    """
+    Positions where each track reaches its maximum vor42 (within each value of
+    the by codes, e.g., season, if given).
+    """
+    keys = tracks['track_id'] if by is None else [tracks['track_id'], by]
+    max_vor42 = tracks['vor42'].groupby(keys).transform('max')
+    return (tracks['vor42'] == max_vor42).to_numpy()
+
+def compute_density_layers(tracks, phases=None, region_col=None):
+    """
+    Computes the density of every (region, season, phase) layer in one sweep.
+
+    Parameters:
+    - tracks: DataFrame with 'track_id', 'date', 'lat vor', 'lon vor', 'vor42'
+      and 'period'.
+    - phases: Phase layers to export (defaults to the phases found in tracks).
+    - region_col: Column with the region of each position. If None, all
+      positions belong to a single region named 'SAt'.
+
+    Returns:
+    - Dictionary {region: xr.Dataset} with 'track_density' (season, phase, lat,
+      lon), 'num_time' (season) and 'num_positions' (season, phase).
+    """
+    dates = pd.to_datetime(tracks['date'])
+    if phases is None:
+        phases = [phase for phase in pd.unique(tracks['period']) if pd.notna(phase)]
+    layers = list(phases) + [PEAK_INTENSITY]
+    n_seasons, n_layers = len(SEASON_MONTHS), len(layers)
+
+    regions = pd.Categorical(tracks[region_col]) if region_col else pd.Categorical(['SAt'] * len(tracks))
+    region_codes = regions.codes.astype(np.int64)
+    season_codes = MONTH_TO_SEASON[dates.dt.month.to_numpy()]
+    phase_codes = pd.Categorical(tracks['period'], categories=phases).codes.astype(np.int64)
+    year_months = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy()
+
+    # Phase layers and the peak intensity layers share the same positions. Peak
+    # positions of the whole tracks go to an extra season slot used for 'total'
+    season_peak = peak_intensity_mask(tracks, by=season_codes)
+    total_peak = peak_intensity_mask(tracks)
+    lat = tracks['lat vor'].to_numpy()
+    lon = tracks['lon vor'].to_numpy()
+    keep = phase_codes >= 0
+    layer_rows = np.concatenate([np.flatnonzero(keep), np.flatnonzero(season_peak), np.flatnonzero(total_peak)])
+    layer_codes = np.concatenate([phase_codes[keep], np.full(season_peak.sum(), n_layers - 1),
+                                  np.full(total_peak.sum(), n_layers - 1)])
+    layer_seasons = np.concatenate([season_codes[keep], season_codes[season_peak],
+                                    np.full(total_peak.sum(), n_seasons)])
+    n_groups = (n_seasons + 1) * n_layers
+
+    longrd, latgrd = density_grid()
+    datasets = {}
+    for r, region in enumerate(regions.categories):
+        in_region = region_codes[layer_rows] == r
+        rows = layer_rows[in_region]
+        groups = layer_seasons[in_region] * n_layers + layer_codes[in_region]
+
+        counts = bin_positions(lat[rows], lon[rows], groups=groups, n_groups=n_groups)
+        sums = kernel_sums(counts).reshape(n_seasons + 1, n_layers, len(latgrd), len(longrd))
+        sums[-1, :-1] = sums[:-1, :-1].sum(axis=0)
+
+        num_positions = np.bincount(groups, minlength=n_groups).reshape(n_seasons + 1, n_layers)
+        num_positions[-1, :-1] = num_positions[:-1, :-1].sum(axis=0)
+
+        # Number of months with any position of the region, as before
+        region_months = np.unique(year_months[region_codes == r])
+        num_time = np.bincount(MONTH_TO_SEASON[region_months % 12 + 1], minlength=n_seasons)
+        num_time = np.append(num_time, num_time.sum())
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            density = density_from_kernel_sums(sums, num_time[:, None, None, None])
+        density[num_time == 0] = 0.
+
+        datasets[region] = xr.Dataset(
+            {
+                'track_density': (('season', 'phase', 'lat', 'lon'), density),
+                'num_time': (('season',), num_time),
+                'num_positions': (('season', 'phase'), num_positions),
+            },
+            coords={'season': SEASONS, 'phase': layers, 'lat': latgrd, 'lon': longrd},
+            attrs={'units': 'positions / 10^6 km^2 / month'},
+        )
+    return datasets
+
+def export_density_layers(datasets, output_directory):
+    """
+    Writes one {region}_track_density_layers.nc per region.
+    """
+    fnames = []
+    for region, dataset in datasets.items():
+        fname = os.path.join(output_directory, f'{region}_track_density_layers.nc')
+        dataset.to_netcdf(fname)
+        print(f'Wrote {fname}')
+        fnames.append(fname)
+    return fnames
+
+def season_dataset(dataset, season):
+    """
+    Per-phase variables of one season of a layered dataset (the old file layout:
+    one variable per phase with positions plus 'peak_intensity').
+    """
+    layer = dataset.sel(season=season, drop=True)
+    data_dict = {}
+    for phase in layer['phase'].values:
+        if layer['num_positions'].sel(phase=phase) > 0:
+            data_dict[str(phase)] = layer['track_density'].sel(phase=phase, drop=True).rename(str(phase))
+    return xr.Dataset(data_dict)
+
+def export_season_files(datasets, output_directory, seasons=('JJA', 'DJF', False)):
+    """
+    Writes the old per-season files ({region}_track_density{_season}.nc) from
+    the layered datasets, for the scripts that still read that layout.
+    """
+    for region, dataset in datasets.items():
+        for season in seasons:
+            season_str = f"_{season}" if season else ""
+            fname = f'{output_directory}/{region}_track_density{season_str}.nc'
+            season_dataset(dataset, season if season else 'total').to_netcdf(fname)
+            print(f'Wrote {fname}')
@@ -0,0 +1,153 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    figure_jobs.py                                     :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/07/05 16:02:37 by daniloceano       #+#    #+#              #
+#    Updated: 2024/07/05 16:02:37 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Parallel rendering of figure batches.
+
+The map scripts draw one figure per phase, season, pair of phases, etc. Each
+figure is independent, so expand_jobs() turns the combinations into FigureJobs
+(a module-level function and its keyword arguments) and run_figure_jobs() runs
+them on a process pool with the Agg backend, printing the time of each job.
+If any job fails, its traceback is printed with the timings and
+run_figure_jobs raises an error, so the scripts do not exit normally without
+their figures.
+
+The densities are read once by the parent process and written with
+share_arrays() as .npy files, which the jobs open with open_shared() as
+read-only memory maps, so the workers share the pages instead of each one
+reading the netCDF files or receiving a pickled copy of the arrays.
+"""
+
+import os
+import time
+import itertools
+import traceback
+import numpy as np
+import xarray as xr
+import matplotlib
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# function: module-level function drawing and saving the figure; kwargs: its arguments
+FigureJob = namedtuple('FigureJob', ['name', 'function', 'kwargs'])
+# outputs: what the function returned (e.g., the saved file), None if it failed; error: traceback of a failure
+JobTiming = namedtuple('JobTiming', ['name', 'seconds', 'outputs', 'pid', 'error'])
+# path: .npy file; coords: {name: (dims, values)}
+SharedArray = namedtuple('SharedArray', ['path', 'name', 'dims', 'coords'])
+
+def expand_jobs(function, name, constants=None, **combinations):
+    """
+    One FigureJob for each combination of the values in combinations.
+
+    Parameters:
+    - function: Function drawing a figure, called as function(**constants, **combination).
+    - name: Name of the jobs, formatted with the combination (e.g., 'density_map_{phase}').
+    - constants: Arguments passed to all jobs (e.g., the shared densities).
+    - combinations: Values of each varying argument (e.g., phase=PHASES, season=SEASONS).
+
+    Returns:
+    - List of FigureJobs, in the order of itertools.product.
+    """
+    keys = list(combinations)
+    jobs = []
+    for values in itertools.product(*(combinations[key] for key in keys)):
+        combination = dict(zip(keys, values))
+        jobs.append(FigureJob(name.format(**combination), function, {**(constants or {}), **combination}))
+    return jobs
+
+def share_arrays(arrays, directory):
+    """
+    Writes the values of DataArrays as .npy files to be opened by open_shared.
+
+    Parameters:
+    - arrays: {key: DataArray}; None values are skipped.
+    - directory: Directory of the .npy files (e.g., a TemporaryDirectory).
+
+    Returns:
+    - {key: SharedArray}, small enough to be passed to every job.
+    """
+    os.makedirs(directory, exist_ok=True)
+    shared = {}
+    for i, (key, array) in enumerate(arrays.items()):
+        if array is None:
+            continue
+        path = os.path.join(directory, f'array_{i}.npy')
+        np.save(path, np.ascontiguousarray(array.values))
+        coords = {name: (coord.dims, coord.values) for name, coord in array.coords.items()}
+        shared[key] = SharedArray(path, array.name, array.dims, coords)
+    return shared
+
+def open_shared(shared):
+    """
+    DataArray backed by a read-only memory map of a SharedArray.
+    """
+    return xr.DataArray(np.load(shared.path, mmap_mode='r'), dims=shared.dims, coords=shared.coords,
+                        name=shared.name)
+
+def _init_worker():
+    # Figures are only saved: no GUI backend in the workers
+    matplotlib.use("Agg")
+
+def _run_job(job):
+    start = time.perf_counter()
+    outputs, error = None, None
+    try:
+        outputs = job.function(**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        print(f"Error in {job.name}:\n{error}")
+    return JobTiming(job.name, time.perf_counter() - start, outputs, os.getpid(), error)
+
+def report_timings(timings, wall_time):
+    """
+    Prints the time of each job, slowest first, and the speedup of the batch.
+    """
+    for timing in sorted(timings, key=lambda timing: timing.seconds, reverse=True):
+        status = ' (failed)' if timing.error is not None else ''
+        print(f"{timing.name:<60} {timing.seconds:8.2f} s  pid {timing.pid}{status}")
+    total = sum(timing.seconds for timing in timings)
+    print(f"{len(timings)} jobs: {total:.2f} s of work in {wall_time:.2f} s "
+          f"({total / wall_time if wall_time else 1:.1f}x)")
+
+def run_figure_jobs(jobs, processes=None):
+    """
+    Runs the FigureJobs on worker processes, with the Agg backend.
+
+    Parameters:
+    - jobs: List of FigureJobs; their functions must be importable by the workers.
+    - processes: Number of worker processes (default: CPUs).
+
+    Returns:
+    - List of JobTimings, in the order of jobs.
+
+    Raises:
+    - RuntimeError if any job failed, after all jobs ran and the timings and
+      tracebacks were printed.
+    """
+    n_workers = min(processes or os.cpu_count() or 1, len(jobs))
+    start = time.perf_counter()
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) as executor:
+            timings = list(executor.map(_run_job, jobs))
+    else:
+        _init_worker()
+        timings = [_run_job(job) for job in jobs]
+    report_timings(timings, time.perf_counter() - start)
+
+    failed = [timing for timing in timings if timing.error is not None]
+    for timing in failed:
+        print(f"Traceback of {timing.name}:\n{timing.error}")
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(timings)} figure jobs failed: "
+                           f"{', '.join(timing.name for timing in failed)}")
+    return timings
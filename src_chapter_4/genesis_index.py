@@ -0,0 +1,101 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    genesis_index.py                                   :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/17 14:03:22 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/17 14:03:22 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Genesis-point index of the tracks.
+
+The genesis of a system is the first row of its track. build_genesis_index()
+extracts it for every track_id in a single first-occurrence pass, and the region
+tests below work on that compact table with vectorized point-in-box and
+point-in-polygon checks, instead of scanning the full tracks once per system.
+
+The column names are parameters, so the same functions work on the raw tracks
+('lon vor', 'lat vor') and on the chapter 5/6 database ('lon', 'lat').
+"""
+
+import numpy as np
+import pandas as pd
+
+# (min_lon, min_lat, max_lon, max_lat)
+GENESIS_REGIONS = {
+    "SE-BR": (-52, -38, -37, -23),
+    "LA-PLATA": (-69, -38, -52, -23),
+    "ARG": (-70, -55, -50, -39),
+}
+
+def build_genesis_index(tracks, id_col='track_id', date_col='date', lon_col='lon vor', lat_col='lat vor'):
+    """
+    Returns a table indexed by track_id with the first position of each track.
+
+    Rows are taken in the order they appear for each track_id (i.e., the order of
+    the track files), which is the same row the per-cyclone head(1) used to pick.
+    """
+    columns = [col for col in [id_col, date_col, lon_col, lat_col] if col in tracks.columns]
+    first_rows = ~tracks[id_col].duplicated(keep='first')
+    genesis = tracks.loc[first_rows, columns].set_index(id_col)
+    return genesis
+
+def save_genesis_index(genesis, path):
+    genesis.to_parquet(path)
+
+def load_genesis_index(path):
+    return pd.read_parquet(path)
+
+def points_in_box(lon, lat, bounds):
+    """
+    Vectorized test of points against a (min_lon, min_lat, max_lon, max_lat) box,
+    boundaries included.
+    """
+    min_lon, min_lat, max_lon, max_lat = bounds
+    lon, lat = np.asarray(lon), np.asarray(lat)
+    return (min_lat <= lat) & (lat <= max_lat) & (min_lon <= lon) & (lon <= max_lon)
+
+def points_in_polygon(lon, lat, polygon):
+    """
+    Vectorized even-odd (ray casting) test of points against a polygon given as
+    a sequence of (lon, lat) vertices.
+    """
+    lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+    vertices = np.asarray(polygon, dtype=float)
+    x0, y0 = vertices[:, 0], vertices[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+
+    inside = np.zeros(lon.shape, dtype=bool)
+    for xa, ya, xb, yb in zip(x0, y0, x1, y1):
+        crosses = (ya > lat) != (yb > lat)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = xa + (lat - ya) * (xb - xa) / (yb - ya)
+        inside ^= crosses & (lon < x_cross)
+    return inside
+
+def genesis_in_region(genesis, region, lon_col='lon vor', lat_col='lat vor'):
+    """
+    Boolean Series (indexed by track_id) telling which systems have genesis in region.
+
+    region can be one of the GENESIS_REGIONS names, a (min_lon, min_lat, max_lon,
+    max_lat) box or a polygon given as a list of (lon, lat) vertices.
+    """
+    if isinstance(region, str):
+        if region not in GENESIS_REGIONS:
+            raise ValueError(f"Invalid region '{region}'. Region must be one of: {', '.join(GENESIS_REGIONS.keys())}")
+        region = GENESIS_REGIONS[region]
+
+    lon, lat = genesis[lon_col].values, genesis[lat_col].values
+    if np.ndim(region) == 1 and len(region) == 4:
+        mask = points_in_box(lon, lat, region)
+    else:
+        mask = points_in_polygon(lon, lat, region)
+    return pd.Series(mask, index=genesis.index)
+
+def track_ids_in_region(genesis, region, lon_col='lon vor', lat_col='lat vor'):
+    mask = genesis_in_region(genesis, region, lon_col, lat_col)
+    return mask.index[mask.values]
@@ -5,8 +5,8 @@ import matplotlib.colors as mcolors
 import numpy as np
 import os
 import matplotlib as mpl
-import matplotlib.ticker as mticker
-from cartopy.mpl.ticker import LongitudeFormatter, LatitudeFormatter
+
+from basemap import basemap, draw_basemap
 
 # Configuration
 INFILES_DIRECTORY = '../../Programs_and_scripts/SWSA-cyclones_energetic-analysis/periods_species_statistics/70W-no-continental/track_density'
@@ -31,36 +31,6 @@ COLOR_PHASES = {
 datacrs = ccrs.PlateCarree()
 proj = ccrs.AlbersEqualArea(central_longitude=-30, central_latitude=-35, standard_parallels=(-20.0, -60.0))
 
-def gridlines(ax):
-    gl = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed',
-                      alpha=0.6, color='#383838', linewidth=0.5)
-    gl.xlocator = mticker.FixedLocator(np.arange(-180, 181, 10))
-    gl.ylocator = mticker.FixedLocator(np.arange(-90, 91, 10))
-    gl.xformatter = LongitudeFormatter()
-    gl.yformatter = LatitudeFormatter()
-    gl.xlabel_style = {'size': 14, 'color': '#383838'}
-    gl.ylabel_style = {'size': 14, 'color': '#383838'}
-    gl.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.bottom_labels = False
-    gl.right_labels = False
-    gl.top_labels = False
-    gl.left_labels = False
-
-    gl2 = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed', alpha=0, color='#383838')
-    gl2.xlocator = mticker.FixedLocator(np.arange(-180, 181, 20))
-    gl2.ylocator = mticker.FixedLocator(np.arange(-90, 91, 20))
-    gl2.xformatter = LongitudeFormatter()
-    gl2.yformatter = LatitudeFormatter()
-    gl2.xlabel_style = {'size': 14, 'color': '#383838'}
-    gl2.ylabel_style = {'size': 14, 'color': '#383838'}
-    gl2.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.bottom_labels = False
-    gl2.right_labels = False
-    gl2.top_labels = True
-    gl2.left_labels = True
-
 def create_colormap(color):
     return mcolors.LinearSegmentedColormap.from_list("", ["white", color], N=256)
 
@@ -70,7 +40,7 @@ def normalize_density(density):
     return (density - min_val) / (max_val - min_val)
 
 def plot_combined_density(ax, density, phase, color):
-    ax.set_extent([-80, 50, -15, -90], crs=datacrs)
+    draw_basemap(ax, basemap(proj, [-80, 50, -15, -90]))
     cmap = create_colormap(color)
     norm_density = normalize_density(density)
     
@@ -78,8 +48,6 @@ def plot_combined_density(ax, density, phase, color):
     mask = np.ma.masked_where(norm_density < 0.2, norm_density)
     
     cf = ax.contourf(density.lon, density.lat, mask, cmap=cmap, transform=datacrs, extend='max', alpha=0.8)
-    ax.coastlines()
-    gridlines(ax)
     return cf
 
 def plot_density_for_region(region):
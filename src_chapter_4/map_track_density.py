@@ -12,13 +12,15 @@
 
 import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
-import xarray as xr
 import matplotlib.colors as mcolors
 import numpy as np
 import os
+import tempfile
 import matplotlib as mpl
-import matplotlib.ticker as mticker
-from cartopy.mpl.ticker import LongitudeFormatter, LatitudeFormatter
+
+from basemap import basemap, draw_basemap
+from density_catalog import COMBINED_REGION, DENSITY_REGIONS, density_field
+from figure_jobs import expand_jobs, open_shared, run_figure_jobs, share_arrays
 
 # Configuration
 INFILES_DIRECTORY = '/Users/danilocoutodesouza/Documents/Programs_and_scripts/SWSA-cyclones_energetic-analysis/periods_species_statistics/70W-no-continental/track_density'
@@ -35,49 +37,9 @@ datacrs = ccrs.PlateCarree()
 proj = ccrs.AlbersEqualArea(central_longitude=-30, central_latitude=-35, standard_parallels=(-20.0, -60.0))
 
 # Utility Functions
-def gridlines(ax):
-    # Create the gridlines with a finer interval
-    gl = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed',
-                      alpha=0.6, color='#383838', linewidth=0.5)
-    gl.xlocator = mticker.FixedLocator(np.arange(-180, 181, 10))
-    gl.ylocator = mticker.FixedLocator(np.arange(-90, 91, 10))
-    
-    # Use formatters to show labels
-    gl.xformatter = LongitudeFormatter()
-    gl.yformatter = LatitudeFormatter()
-    
-    # Control which labels are displayed
-    gl.xlabel_style = {'size': 14, 'color': '#383838'}
-    gl.ylabel_style = {'size': 14, 'color': '#383838'}
-    gl.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.bottom_labels = False
-    gl.right_labels = False
-    gl.top_labels = False
-    gl.left_labels = False
-
-    # Coarser interval
-    gl2 = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed', alpha=0, color='#383838')
-    gl2.xlocator = mticker.FixedLocator(np.arange(-180, 181, 20))
-    gl2.ylocator = mticker.FixedLocator(np.arange(-90, 91, 20))
-    
-    # Use formatters to show labels
-    gl2.xformatter = LongitudeFormatter()
-    gl2.yformatter = LatitudeFormatter()
-    
-    # Control which labels are displayed
-    gl2.xlabel_style = {'size': 14, 'color': '#383838'}
-    gl2.ylabel_style = {'size': 14, 'color': '#383838'}
-    gl2.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.bottom_labels = False
-    gl2.right_labels = False
-    gl2.top_labels = True
-    gl2.left_labels = True
-
 def plot_density(fig, ax, phase, density, label):
     # ax.set_extent([-90, 180, 0, -90], crs=datacrs)
-    ax.set_extent([-80, 50, -15, -90], crs=datacrs)
+    draw_basemap(ax, basemap(proj, [-80, 50, -15, -90]))
     cmap = mcolors.LinearSegmentedColormap.from_list("", COLORS)
 
     levels_dict = {
@@ -99,110 +61,82 @@ def plot_density(fig, ax, phase, density, label):
     cf = ax.contourf(lon, lat, density, cmap=cmap, levels=levels, norm=norm, transform=datacrs)
     ax.contour(lon, lat, density, levels=levels, norm=norm, colors='#383838', linewidths=0.35, linestyles='dashed', transform=datacrs)
     ax.text(0.85, 0.85, label, ha='left', va='bottom', fontsize=16, fontweight='bold', bbox=dict(boxstyle='round', facecolor='white'), transform=ax.transAxes)
-    ax.coastlines()
-    gridlines(ax)
     return levels, cf
 
-def load_and_sum_densities(phases, season):
-    combined_density = None
-    for region in ["ARG", "LA-PLATA", "SE-BR"]:
-        region_str = region
-        season_str = f"_{season}" if season else ""
-        infile = os.path.join(INFILES_DIRECTORY, f'{region_str}_track_density{season_str}.nc')
-        
-        if os.path.exists(infile):
-            ds = xr.open_dataset(infile)
-            if combined_density is None:
-                combined_density = ds[phases].copy()
-            else:
-                combined_density += ds[phases]
-        else:
-            print(f"File not found: {infile}")
-    
-    return combined_density
-
-def plot_each_phase():
-    for phase in PHASES:
-        fig, axes = plt.subplots(nrows=4, ncols=2, figsize=(12, 15), subplot_kw={'projection': proj})
-        axes = axes.flatten()
-        for i, region in enumerate(REGIONS):
-            for j, season in enumerate(SEASONS):
-                ax = axes[i*2 + j]
-
-                if not region:
-                    density = load_and_sum_densities(phase, season)
-                    region_str = "SAt"
-                else:
-                    region_str = region
-                    season_str = f"_{season}" if season else ""
-                    infile = os.path.join(INFILES_DIRECTORY, f'{region_str}_track_density{season_str}.nc')
-                    
-                    if not os.path.exists(infile):
-                        print(f"File not found: {infile}")
-                        continue
-
-                    ds = xr.open_dataset(infile)
-                    density = ds[phase]
-
-                label = LABELS[i*2 + j]
-                levels, cf = plot_density(fig, ax, phase, density, label)
-
-                if i*2 + j == 7:
-                    cbar_axes = fig.add_axes([0.15, 0.05, 0.7, 0.04])
-                    ticks = np.round(levels, decimals=2)
-                    colorbar = plt.colorbar(cf, cax=cbar_axes, ticks=ticks, format='%g', orientation='horizontal')
-                    colorbar.ax.tick_params(labelsize=12)
-
-        plt.subplots_adjust(wspace=0.15)
-        fname = os.path.join(OUTPUT_DIRECTORY, f'density_map_{phase}.png')
-        plt.savefig(fname, bbox_inches='tight')
-        plt.close(fig)
-        print(f'Density map saved in {fname}')
-
-def plot_secondary_development():
-    secondary_phases = ['intensification 2', 'mature 2', 'decay 2', 'residual']
-    for season in SEASONS:
-        fig = plt.figure(figsize=(12, 7))
-        for i, phase in enumerate(secondary_phases):
-            ax = fig.add_subplot(2, 2, i+1, projection=proj)
-
-            density = load_and_sum_densities(phase, season)
+def load_densities(share_directory):
+    """
+    Densities of each region (and their sum, SAt), season and phase, read and
+    summed once by the density catalog and shared with the figure jobs, as
+    {(region, season, phase): SharedArray}.
+    """
+    densities = {(region, season, phase): density_field(INFILES_DIRECTORY, region, season, phase)
+                 for region in [COMBINED_REGION, *DENSITY_REGIONS] for season in SEASONS for phase in PHASES}
+    densities[(COMBINED_REGION, 'all', 'residual')] = density_field(INFILES_DIRECTORY, COMBINED_REGION,
+                                                                    tuple(SEASONS), 'residual')
+    return share_arrays(densities, share_directory)
+
+def shared_density(densities, region, season, phase):
+    key = (region, season, phase)
+    return open_shared(densities[key]) if key in densities else None
+
+def plot_phase(densities, phase):
+    fig, axes = plt.subplots(nrows=4, ncols=2, figsize=(12, 15), subplot_kw={'projection': proj})
+    axes = axes.flatten()
+    for i, region in enumerate(REGIONS):
+        for j, season in enumerate(SEASONS):
+            ax = axes[i*2 + j]
+
+            region_str = region or COMBINED_REGION
+            density = shared_density(densities, region_str, season, phase)
             if density is None:
-                print(f"No data found for phase: {phase} in season: {season}")
                 continue
 
-            label = LABELS[i]
+            label = LABELS[i*2 + j]
             levels, cf = plot_density(fig, ax, phase, density, label)
 
-            if i == 3:
+            if i*2 + j == 7:
                 cbar_axes = fig.add_axes([0.15, 0.05, 0.7, 0.04])
                 ticks = np.round(levels, decimals=2)
                 colorbar = plt.colorbar(cf, cax=cbar_axes, ticks=ticks, format='%g', orientation='horizontal')
                 colorbar.ax.tick_params(labelsize=12)
 
-        plt.subplots_adjust(wspace=0.15)
-        fname = os.path.join(OUTPUT_DIRECTORY, f'density_map_secondary_development_{season}.png')
-        plt.savefig(fname, bbox_inches='tight')
-        plt.close(fig)
-        print(f'Density map saved in {fname}')
+    plt.subplots_adjust(wspace=0.15)
+    fname = os.path.join(OUTPUT_DIRECTORY, f'density_map_{phase}.png')
+    plt.savefig(fname, bbox_inches='tight')
+    plt.close(fig)
+    print(f'Density map saved in {fname}')
+    return fname
 
-def plot_residual_phase_aggregate():
+def plot_secondary_development(densities, season):
+    secondary_phases = ['intensification 2', 'mature 2', 'decay 2', 'residual']
+    fig = plt.figure(figsize=(12, 7))
+    for i, phase in enumerate(secondary_phases):
+        ax = fig.add_subplot(2, 2, i+1, projection=proj)
+
+        density = shared_density(densities, COMBINED_REGION, season, phase)
+        if density is None:
+            print(f"No data found for phase: {phase} in season: {season}")
+            continue
+
+        label = LABELS[i]
+        levels, cf = plot_density(fig, ax, phase, density, label)
+
+        if i == 3:
+            cbar_axes = fig.add_axes([0.15, 0.05, 0.7, 0.04])
+            ticks = np.round(levels, decimals=2)
+            colorbar = plt.colorbar(cf, cax=cbar_axes, ticks=ticks, format='%g', orientation='horizontal')
+            colorbar.ax.tick_params(labelsize=12)
+
+    plt.subplots_adjust(wspace=0.15)
+    fname = os.path.join(OUTPUT_DIRECTORY, f'density_map_secondary_development_{season}.png')
+    plt.savefig(fname, bbox_inches='tight')
+    plt.close(fig)
+    print(f'Density map saved in {fname}')
+    return fname
+
+def plot_residual_phase_aggregate(densities):
     fig, ax = plt.subplots(figsize=(12, 7), subplot_kw={'projection': proj})
-    combined_density = None
-
-    for region in ["ARG", "LA-PLATA", "SE-BR"]:
-        for season in SEASONS:
-            season_str = f"_{season}" if season else ""
-            infile = os.path.join(INFILES_DIRECTORY, f'{region}_track_density{season_str}.nc')
-            
-            if os.path.exists(infile):
-                ds = xr.open_dataset(infile)
-                if combined_density is None:
-                    combined_density = ds['residual'].copy()
-                else:
-                    combined_density += ds['residual']
-            else:
-                print(f"File not found: {infile}")
+    combined_density = shared_density(densities, COMBINED_REGION, 'all', 'residual')
 
     if combined_density is not None:
         levels, cf = plot_density(fig, ax, 'residual', combined_density, '(I)')
@@ -217,12 +151,18 @@ def plot_residual_phase_aggregate():
         plt.savefig(fname, bbox_inches='tight')
         plt.close(fig)
         print(f'Density map saved in {fname}')
+        return fname
     else:
+        plt.close(fig)
         print("No data found for the residual phase across all regions and seasons.")
 
 # Main Execution
 if __name__ == "__main__":
     os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
-    plot_each_phase()
-    plot_secondary_development()
-    plot_residual_phase_aggregate()
\ No newline at end of file
+    with tempfile.TemporaryDirectory() as share_directory:
+        shared = {'densities': load_densities(share_directory)}
+        jobs = (expand_jobs(plot_phase, 'density_map_{phase}', shared, phase=PHASES)
+                + expand_jobs(plot_secondary_development, 'density_map_secondary_development_{season}', shared,
+                              season=SEASONS)
+                + expand_jobs(plot_residual_phase_aggregate, 'density_map_residual_aggregate', shared))
+        run_figure_jobs(jobs)
@@ -12,13 +12,15 @@
 
 import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
-import xarray as xr
 import matplotlib.colors as mcolors
 import numpy as np
 import os
+import tempfile
 import matplotlib as mpl
-import matplotlib.ticker as mticker
-from cartopy.mpl.ticker import LongitudeFormatter, LatitudeFormatter
+
+from basemap import basemap, draw_basemap
+from density_catalog import COMBINED_REGION, normalized_density
+from figure_jobs import FigureJob, open_shared, run_figure_jobs, share_arrays
 
 # Configuration
 INFILES_DIRECTORY = '/home/daniloceano/Documents/Programs_and_scripts/SWSA-cyclones_energetic-analysis/periods_species_statistics/70W-no-continental/track_density'
@@ -33,47 +35,8 @@ datacrs = ccrs.PlateCarree()
 proj = ccrs.AlbersEqualArea(central_longitude=-30, central_latitude=-35, standard_parallels=(-20.0, -60.0))
 
 # Utility Functions
-def gridlines(ax):
-    gl = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed',
-                      alpha=0.6, color='#383838', linewidth=0.5)
-    gl.xlocator = mticker.FixedLocator(np.arange(-180, 181, 10))
-    gl.ylocator = mticker.FixedLocator(np.arange(-90, 91, 10))
-    
-    # Use formatters to show labels
-    gl.xformatter = LongitudeFormatter()
-    gl.yformatter = LatitudeFormatter()
-    
-    # Control which labels are displayed
-    gl.xlabel_style = {'size': 14, 'color': '#383838'}
-    gl.ylabel_style = {'size': 14, 'color': '#383838'}
-    gl.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.bottom_labels = False
-    gl.right_labels = False
-    gl.top_labels = False
-    gl.left_labels = False
-
-    # Coarser interval
-    gl2 = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed', alpha=0, color='#383838')
-    gl2.xlocator = mticker.FixedLocator(np.arange(-180, 181, 20))
-    gl2.ylocator = mticker.FixedLocator(np.arange(-90, 91, 20))
-    
-    # Use formatters to show labels
-    gl2.xformatter = LongitudeFormatter()
-    gl2.yformatter = LatitudeFormatter()
-    
-    # Control which labels are displayed
-    gl2.xlabel_style = {'size': 14, 'color': '#383838'}
-    gl2.ylabel_style = {'size': 14, 'color': '#383838'}
-    gl2.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.bottom_labels = False
-    gl2.right_labels = False
-    gl2.top_labels = True
-    gl2.left_labels = True
-
 def plot_density_difference(fig, ax, phase, density_diff, label, season):
-    ax.set_extent([-80, 50, -15, -90], crs=datacrs)
+    draw_basemap(ax, basemap(proj, [-80, 50, -15, -90]))
     cmap = mcolors.LinearSegmentedColormap.from_list("", COLORS)
     
     levels = np.linspace(-1, 1, 21)
@@ -83,32 +46,40 @@ def plot_density_difference(fig, ax, phase, density_diff, label, season):
     cf = ax.contourf(lon, lat, density_diff, cmap=cmap, levels=levels, norm=norm, transform=datacrs)
     ax.contour(lon, lat, density_diff, levels=levels, norm=norm, colors='#383838', linewidths=0.35, linestyles='dashed', transform=datacrs)
     ax.text(0.85, 0.85, label, ha='left', va='bottom', fontsize=16, fontweight='bold', bbox=dict(boxstyle='round', facecolor='white'), transform=ax.transAxes)
-    ax.coastlines()
-    gridlines(ax)
     return levels, cf
 
-def load_and_sum_densities(phase, season):
-    combined_density = None
-    for region in ["ARG", "LA-PLATA", "SE-BR"]:
-        region_str = region
-        season_str = f"_{season}" if season else ""
-        infile = os.path.join(INFILES_DIRECTORY, f'{region_str}_track_density{season_str}.nc')
-        
-        if os.path.exists(infile):
-            ds = xr.open_dataset(infile)
-            if combined_density is None:
-                combined_density = ds[phase].copy()
-            else:
-                combined_density += ds[phase]
-        else:
-            print(f"File not found: {infile}")
-    
-    return combined_density
+def load_densities(share_directory):
+    """
+    Normalized combined density of each season and phase, read, summed and
+    normalized once by the density catalog and shared with the figure jobs, as
+    {(season, phase): SharedArray}.
+    """
+    densities = {(season, phase): normalized_density(INFILES_DIRECTORY, COMBINED_REGION, season, phase)
+                 for season in SEASONS for phase in PHASES}
+    return share_arrays(densities, share_directory)
+
+def plot_phase_difference(densities, phase_prev, phase):
+    fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(14, 7), subplot_kw={'projection': proj})
+    for season, ax, label in zip(SEASONS, axes, ['(A)', '(B)']):
+        density_prev = open_shared(densities[(season, phase_prev)])
+        density = open_shared(densities[(season, phase)])
+        density_diff = density - density_prev
+
+        levels, cf = plot_density_difference(fig, ax, phase, density_diff, label, season)
+
+    cbar_axes = fig.add_axes([0.15, 0.05, 0.7, 0.04])
+    ticks = np.linspace(-1, 1, 11)
+    colorbar = plt.colorbar(cf, cax=cbar_axes, ticks=ticks, format='%g', orientation='horizontal')
+    colorbar.ax.tick_params(labelsize=12)
 
-def normalize_density(density):
-    return (density - density.min()) / (density.max() - density.min())
+    plt.subplots_adjust(wspace=0.15, hspace=0.3)
+    fname = os.path.join(OUTPUT_DIRECTORY, f'density_difference_map_{phase_prev}_to_{phase}.png')
+    plt.savefig(fname, bbox_inches='tight')
+    plt.close(fig)
+    print(f'Density difference map saved in {fname}')
+    return fname
 
-def plot_phase_differences():
+def phase_difference_jobs(densities):
     phase_pairs = [
         ('incipient', 'intensification'),
         ('intensification', 'mature'),
@@ -117,27 +88,12 @@ def plot_phase_differences():
         ('intensification 2', 'mature 2'),
         ('mature 2', 'decay 2')
     ]  # Excluding residual phase
-    for phase_prev, phase in phase_pairs:
-        fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(14, 7), subplot_kw={'projection': proj})
-        for season, ax, label in zip(SEASONS, axes, ['(A)', '(B)']):
-            density_prev = normalize_density(load_and_sum_densities(phase_prev, season))
-            density = normalize_density(load_and_sum_densities(phase, season))
-            density_diff = density - density_prev
-
-            levels, cf = plot_density_difference(fig, ax, phase, density_diff, label, season)
-
-        cbar_axes = fig.add_axes([0.15, 0.05, 0.7, 0.04])
-        ticks = np.linspace(-1, 1, 11)
-        colorbar = plt.colorbar(cf, cax=cbar_axes, ticks=ticks, format='%g', orientation='horizontal')
-        colorbar.ax.tick_params(labelsize=12)
-
-        plt.subplots_adjust(wspace=0.15, hspace=0.3)
-        fname = os.path.join(OUTPUT_DIRECTORY, f'density_difference_map_{phase_prev}_to_{phase}.png')
-        plt.savefig(fname, bbox_inches='tight')
-        plt.close(fig)
-        print(f'Density difference map saved in {fname}')
+    return [FigureJob(f'density_difference_map_{phase_prev}_to_{phase}', plot_phase_difference,
+                      {'densities': densities, 'phase_prev': phase_prev, 'phase': phase})
+            for phase_prev, phase in phase_pairs]
 
 # Main Execution
 if __name__ == "__main__":
     os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
-    plot_phase_differences()
\ No newline at end of file
+    with tempfile.TemporaryDirectory() as share_directory:
+        run_figure_jobs(phase_difference_jobs(load_densities(share_directory)))
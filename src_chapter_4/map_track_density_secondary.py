@@ -3,10 +3,10 @@ import cartopy.crs as ccrs
 import xarray as xr
 import numpy as np
 import os
-import matplotlib.ticker as mticker
-from cartopy.mpl.ticker import LongitudeFormatter, LatitudeFormatter
 import matplotlib.patches as mpatches
 
+from basemap import basemap, draw_basemap
+
 # Configuration
 INFILES_DIRECTORY = '../../Programs_and_scripts/SWSA-cyclones_energetic-analysis/periods_species_statistics/70W-no-continental/track_density'
 SECONDARY_INFILES_DIRECTORY = '../results_chapter_4/track_density_secondary_development/'
@@ -29,35 +29,6 @@ COLOR_PHASES = {
 datacrs = ccrs.PlateCarree()
 proj = ccrs.AlbersEqualArea(central_longitude=-30, central_latitude=-35, standard_parallels=(-20.0, -60.0))
 
-def gridlines(ax):
-    gl = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed', alpha=0.6, color='#383838', linewidth=0.5)
-    gl.xlocator = mticker.FixedLocator(np.arange(-180, 181, 10))
-    gl.ylocator = mticker.FixedLocator(np.arange(-90, 91, 10))
-    gl.xformatter = LongitudeFormatter()
-    gl.yformatter = LatitudeFormatter()
-    gl.xlabel_style = {'size': 14, 'color': '#383838'}
-    gl.ylabel_style = {'size': 14, 'color': '#383838'}
-    gl.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.bottom_labels = False
-    gl.right_labels = False
-    gl.top_labels = False
-    gl.left_labels = False
-
-    gl2 = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed', alpha=0, color='#383838')
-    gl2.xlocator = mticker.FixedLocator(np.arange(-180, 181, 20))
-    gl2.ylocator = mticker.FixedLocator(np.arange(-90, 91, 20))
-    gl2.xformatter = LongitudeFormatter()
-    gl2.yformatter = LatitudeFormatter()
-    gl2.xlabel_style = {'size': 14, 'color': '#383838'}
-    gl2.ylabel_style = {'size': 14, 'color': '#383838'}
-    gl2.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.bottom_labels = False
-    gl2.right_labels = False
-    gl2.top_labels = True
-    gl2.left_labels = True
-
 def normalize_density(density):
     min_val = density.min()
     max_val = density.max()
@@ -70,7 +41,7 @@ def plot_density_contours(ax, density, phase, color):
 def plot_density_for_region(region, combined_density=None, ax=None):
     if ax is None:
         fig, ax = plt.subplots(figsize=(10, 10), subplot_kw={'projection': proj})
-        ax.set_extent([-80, 50, -15, -90], crs=datacrs)
+        draw_basemap(ax, basemap(proj, [-80, 50, -15, -90]))
         new_figure = True
     else:
         new_figure = False
@@ -96,8 +67,6 @@ def plot_density_for_region(region, combined_density=None, ax=None):
         legend_handles.append(mpatches.Patch(color=COLOR_PHASES[phase], label=phase))
     
     if new_figure:
-        ax.coastlines()
-        gridlines(ax)
 
         ax.set_title(region, fontsize=16)
         # Remove duplicate entries in legend
@@ -112,7 +81,7 @@ def plot_density_for_region(region, combined_density=None, ax=None):
 
 def plot_aggregate_density():
     fig, ax = plt.subplots(figsize=(10, 10), subplot_kw={'projection': proj})
-    ax.set_extent([-80, 50, -15, -90], crs=datacrs)
+    draw_basemap(ax, basemap(proj, [-80, 50, -15, -90]))
     ax.set_title(AGGREGATE_LABEL, fontsize=16)
 
     legend_handles = []
@@ -134,9 +103,6 @@ def plot_aggregate_density():
                     combined_density[phase] += density
         legend_handles += plot_density_for_region(region, combined_density=combined_density, ax=ax)
 
-    ax.coastlines()
-    gridlines(ax)
-    
     # Remove duplicate entries in legend
     unique_handles = list({handle.get_label(): handle for handle in legend_handles}.values())
     ax.legend(handles=unique_handles, loc='upper right')
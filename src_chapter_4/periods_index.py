@@ -0,0 +1,154 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    periods_index.py                                   :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/22 15:18:09 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/22 15:18:09 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Cached index of a periods-energetics directory.
+
+All <region>_<track_id>.csv periods files of a directory are parsed into a single
+compact table (track_id, order, phase code, start, end as int64 epoch seconds),
+saved next to the directory as <directory>_index.parquet. A manifest
+(<directory>_manifest.json) keeps the mtime, size and SHA-1 of every file, so
+later runs only re-parse files that were added or whose content changed.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+
+from phase_labeller import read_periods_file
+
+PHASES = ['incipient', 'intensification', 'mature', 'decay', 'residual',
+          'incipient 2', 'intensification 2', 'mature 2', 'decay 2']
+PHASE_CODES = {phase: code for code, phase in enumerate(PHASES)}
+
+INDEX_COLUMNS = ['track_id', 'order', 'phase', 'start', 'end']
+
+def index_paths(periods_directory):
+    base = os.path.normpath(periods_directory)
+    return f'{base}_index.parquet', f'{base}_manifest.json'
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def _track_id(file_name):
+    return int(file_name.split('_')[-1].split('.csv')[0])
+
+def _from_seconds(values):
+    # NaT is stored as the smallest int64, which numpy converts back to NaT
+    return pd.to_datetime(np.asarray(values, dtype=np.int64).astype('datetime64[s]'))
+
+def _parse_file(path):
+    periods = read_periods_file(path)
+    unknown = set(periods['period']) - set(PHASE_CODES)
+    if unknown:
+        raise ValueError(f"Unknown phases {sorted(unknown)} in {path}, expected one of {PHASES}")
+    start = periods['start'].values.astype('datetime64[s]').astype(np.int64)
+    end = periods['end'].values.astype('datetime64[s]').astype(np.int64)
+    return pd.DataFrame({
+        'track_id': np.full(len(periods), _track_id(os.path.basename(path)), dtype=np.int32),
+        'order': np.arange(len(periods), dtype=np.int8),
+        'phase': periods['period'].map(PHASE_CODES).astype(np.int8).values,
+        'start': start,
+        'end': end,
+    })
+
+def update_periods_index(periods_directory):
+    """
+    Builds or refreshes the index of a periods directory and returns it.
+    """
+    index_path, manifest_path = index_paths(periods_directory)
+    index = pd.read_parquet(index_path) if os.path.exists(index_path) else pd.DataFrame(columns=INDEX_COLUMNS)
+    manifest = {}
+    # Without the index, the manifest is of no use: every file is parsed again
+    if os.path.exists(index_path) and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    new_manifest, changed = {}, []
+    with os.scandir(periods_directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.csv'):
+                continue
+            stat = entry.stat()
+            record = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+            old = manifest.get(entry.name)
+            if old and old['mtime_ns'] == record['mtime_ns'] and old['size'] == record['size']:
+                record['sha1'] = old['sha1']
+            else:
+                # Touched or new file: only re-parse it if the content changed
+                record['sha1'] = _file_hash(entry.path)
+                if not old or old['sha1'] != record['sha1']:
+                    changed.append(entry.name)
+            new_manifest[entry.name] = record
+
+    removed = set(manifest) - set(new_manifest)
+    if not changed and not removed and os.path.exists(index_path):
+        if new_manifest != manifest:
+            with open(manifest_path, 'w') as f:
+                json.dump(new_manifest, f)
+        return index
+
+    print(f"Parsing {len(changed)} new or changed periods files in {periods_directory}...")
+    stale = {_track_id(name) for name in changed} | {_track_id(name) for name in removed}
+    index = index[~index['track_id'].isin(stale)]
+
+    with ThreadPoolExecutor() as executor:
+        parsed = list(executor.map(_parse_file, [os.path.join(periods_directory, name) for name in changed]))
+
+    index = pd.concat([index] + parsed, ignore_index=True)
+    index = index.astype({'track_id': np.int32, 'order': np.int8, 'phase': np.int8,
+                          'start': np.int64, 'end': np.int64})
+    index = index.sort_values(['track_id', 'order']).reset_index(drop=True)
+
+    index.to_parquet(index_path, index=False)
+    with open(manifest_path, 'w') as f:
+        json.dump(new_manifest, f)
+    return index
+
+def load_periods(periods_directory, require_phase=None):
+    """
+    Periods of all systems of a directory as the long table used by
+    phase_labeller.label_phases (track_id, period, start, end).
+
+    Systems whose periods do not include require_phase (e.g., 'mature') are dropped.
+    """
+    index = update_periods_index(periods_directory)
+    if require_phase is not None:
+        with_phase = index.loc[index['phase'] == PHASE_CODES[require_phase], 'track_id']
+        index = index[index['track_id'].isin(with_phase)]
+
+    return pd.DataFrame({
+        'track_id': index['track_id'].values,
+        'period': np.asarray(PHASES, dtype=object)[index['phase'].values],
+        'start': _from_seconds(index['start'].values),
+        'end': _from_seconds(index['end'].values),
+    })
+
+def phase_sequences(index):
+    """
+    Phases of each system in file order, joined as in the count tables
+    (e.g., 'incipient, intensification, mature, decay'), indexed by track_id.
+    """
+    names = pd.Series(np.asarray(PHASES, dtype=object)[index['phase'].values], index=index['track_id'].values)
+    return names.groupby(level=0, sort=False).agg(', '.join)
+
+def system_starts(index):
+    """
+    Start of the first phase of each system, indexed by track_id.
+    """
+    first = index[index['order'] == 0]
+    return pd.Series(_from_seconds(first['start'].values), index=first['track_id'].values)
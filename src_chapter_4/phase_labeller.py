@@ -0,0 +1,141 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    phase_labeller.py                                  :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/18 10:21:05 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/18 10:21:05 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Labels every track position with its life cycle phase.
+
+All tracks and all periods (one row per track_id/phase with start and end) are
+joined at once: the track rows are sorted by (track_id, date) and each period
+interval is located with two searchsorted calls, so the whole database is
+labelled in one vectorized pass instead of a date_range/isin or iterrows loop per
+system.
+
+When intervals of the same system share a boundary time, overlap='last' keeps the
+phase that comes later in the periods file (what process_period_file did) and
+overlap='first' keeps the earlier one (what create_database.label_phases did).
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+def read_periods_file(path):
+    """
+    Reads one cyclophaser periods file into a (period, start, end) DataFrame.
+    """
+    periods = pd.read_csv(path)
+    periods.columns = ['period', 'start', 'end']
+    periods['start'] = pd.to_datetime(periods['start'], format='%Y-%m-%d %H:%M:%S')
+    periods['end'] = pd.to_datetime(periods['end'], format='%Y-%m-%d %H:%M:%S')
+    return periods
+
+def periods_table(periods_by_track):
+    """
+    Concatenates {track_id: periods DataFrame} into one long table with a
+    track_id column, keeping the file order of the phases of each system.
+    """
+    frames = [periods.assign(track_id=int(track_id)) for track_id, periods in periods_by_track.items()]
+    if not frames:
+        return pd.DataFrame(columns=['track_id', 'period', 'start', 'end'])
+    table = pd.concat(frames, ignore_index=True)
+    return table[['track_id', 'period', 'start', 'end']]
+
+def read_periods_directory(periods_directory, require_phase=None):
+    """
+    Reads every periods file of a directory (named *_<track_id>.csv) into one table.
+
+    Systems whose periods do not include require_phase (e.g., 'mature') are dropped.
+    """
+    period_files = sorted(f for f in os.listdir(periods_directory) if f.endswith('.csv'))
+    track_ids = [int(f.split('_')[-1].split('.csv')[0]) for f in period_files]
+
+    # Reading is I/O bound, so threads are enough here
+    with ThreadPoolExecutor() as executor:
+        results = list(tqdm(executor.map(read_periods_file,
+                                         [os.path.join(periods_directory, f) for f in period_files]),
+                            total=len(period_files)))
+
+    periods_by_track = {track_id: periods for track_id, periods in zip(track_ids, results)
+                        if require_phase is None or require_phase in periods['period'].values}
+    return periods_table(periods_by_track)
+
+def _to_seconds(values):
+    return pd.to_datetime(values).values.astype('datetime64[s]').astype(np.int64)
+
+def label_phases(tracks, periods, id_col='track_id', date_col='date', overlap='last', no_phase=np.nan):
+    """
+    Assigns the phase of every track row from the periods intervals.
+
+    Parameters:
+    - tracks: DataFrame with id_col and date_col.
+    - periods: Long table with track_id, period, start and end (see periods_table).
+    - overlap: 'last' or 'first', which interval wins where intervals overlap.
+    - no_phase: Label for rows outside every interval.
+
+    Returns:
+    - Series of phase labels aligned with tracks.index.
+    """
+    if overlap not in ('last', 'first'):
+        raise ValueError(f"Invalid overlap '{overlap}'. Must be 'last' or 'first'")
+
+    labels = np.full(len(tracks), no_phase, dtype=object)
+    periods = periods.dropna(subset=['start', 'end'])
+    # An interval ending before it starts labels no rows (as an empty date_range did)
+    inverted = (periods['end'] < periods['start']).to_numpy()
+    if inverted.any():
+        print(f"Skipping {inverted.sum()} periods ending before they start, track_id: "
+              f"{', '.join(str(i) for i in pd.unique(periods['track_id'].to_numpy()[inverted]))}")
+        periods = periods[~inverted]
+    if len(tracks) == 0 or len(periods) == 0:
+        return pd.Series(labels, index=tracks.index)
+
+    ids = tracks[id_col].to_numpy()
+    dates = _to_seconds(tracks[date_col])
+    period_ids = periods['track_id'].to_numpy()
+    starts = _to_seconds(periods['start'])
+    ends = _to_seconds(periods['end'])
+
+    # Single sortable key per row: rank of the track_id, then seconds since t0
+    unique_ids, track_rank = np.unique(ids, return_inverse=True)
+    t0 = min(dates.min(), starts.min())
+    span = max(dates.max(), ends.max()) - t0 + 1
+    keys = track_rank.astype(np.int64) * span + (dates - t0)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    # Locate the rows of each interval
+    period_rank = np.searchsorted(unique_ids, period_ids)
+    known = period_rank < len(unique_ids)
+    known[known] = unique_ids[period_rank[known]] == period_ids[known]
+    lo = np.searchsorted(sorted_keys, period_rank * span + (starts - t0), side='left')
+    hi = np.searchsorted(sorted_keys, period_rank * span + (ends - t0), side='right')
+    lengths = np.where(known, hi - lo, 0)
+
+    interval = np.repeat(np.arange(len(periods)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    rows = order[np.repeat(lo, lengths) + offsets]
+
+    # Resolve overlaps by the position of the interval in the periods table
+    if overlap == 'last':
+        winner = np.full(len(tracks), -1)
+        np.maximum.at(winner, rows, interval)
+        labelled = winner >= 0
+    else:
+        winner = np.full(len(tracks), len(periods))
+        np.minimum.at(winner, rows, interval)
+        labelled = winner < len(periods)
+
+    labels[labelled] = periods['period'].to_numpy()[winner[labelled]]
+    return pd.Series(labels, index=tracks.index)
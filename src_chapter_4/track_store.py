@@ -0,0 +1,133 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    track_store.py                                     :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/17 09:12:40 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/17 09:12:40 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Columnar store for the raw SAt tracks.
+
+The raw tracks come as one headerless CSV per month (ff_cyc_SAt_era5_YYYYMM.csv).
+Running this module once converts them into a Parquet dataset partitioned by
+year/month (hive layout: year=YYYY/month=M/part-0.parquet), with the longitudes
+already in the [-180, 180] range. Months already converted are skipped, so it can
+be re-run when new months of tracks arrive.
+
+load_tracks() memory-maps the dataset and only reads the requested columns and
+the partitions/row groups that match the filters, so the scripts no longer need
+to re-parse every CSV with a multiprocessing pool.
+"""
+
+import os
+import re
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pyarrow.fs as pafs
+
+from glob import glob
+from tqdm import tqdm
+
+RAW_TRACKS_DIR = '/Users/danilocoutodesouza/Documents/Programs_and_scripts/SWSA-cyclones_energetic-analysis/raw_data'
+TRACK_STORE_DIR = f'{RAW_TRACKS_DIR}/SAt_parquet'
+
+TRACK_COLUMNS = ['track_id', 'date', 'lon vor', 'lat vor', 'vor42']
+
+TRACK_SCHEMA = pa.schema([
+    ('track_id', pa.int32()),
+    ('date', pa.timestamp('s')),
+    ('lon vor', pa.float32()),
+    ('lat vor', pa.float32()),
+    ('vor42', pa.float32()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('month', pa.int8())]), flavor='hive')
+
+def read_raw_month(file):
+    """
+    Reads one monthly raw track file and returns it with the store dtypes.
+    """
+    tracks = pd.read_csv(file, header=None, names=TRACK_COLUMNS)
+    tracks['date'] = pd.to_datetime(tracks['date'], format='%Y-%m-%d %H:%M:%S')
+    tracks['lon vor'] = np.where(tracks['lon vor'] > 180, tracks['lon vor'] - 360, tracks['lon vor'])
+    return tracks.astype({'track_id': 'int32', 'lon vor': 'float32', 'lat vor': 'float32', 'vor42': 'float32'})
+
+def convert_raw_tracks(raw_tracks_dir=f'{RAW_TRACKS_DIR}/SAt', store_dir=TRACK_STORE_DIR, overwrite=False):
+    """
+    Converts the monthly raw track CSVs into the partitioned Parquet store.
+
+    Each raw file becomes the year/month partition of its file name, so a track
+    is never split across partitions. Existing partitions are kept unless
+    overwrite is True.
+    """
+    file_list = sorted(glob(f"{raw_tracks_dir}/*.csv"))
+    print(f"Converting {len(file_list)} raw track files to {store_dir}...")
+
+    for file in tqdm(file_list):
+        year_month = re.search(r'(\d{4})(\d{2})\.csv$', os.path.basename(file))
+        if year_month is None:
+            print(f"Skipping {file}: no YYYYMM in file name")
+            continue
+        year, month = int(year_month.group(1)), int(year_month.group(2))
+
+        partition_dir = os.path.join(store_dir, f'year={year}', f'month={month}')
+        partition_file = os.path.join(partition_dir, 'part-0.parquet')
+        if os.path.exists(partition_file) and not overwrite:
+            continue
+
+        tracks = read_raw_month(file)
+        table = pa.Table.from_pandas(tracks, schema=TRACK_SCHEMA, preserve_index=False)
+        os.makedirs(partition_dir, exist_ok=True)
+        pq.write_table(table, partition_file, row_group_size=65536)
+
+    print("Done.")
+
+def track_dataset(store_dir=TRACK_STORE_DIR):
+    """
+    Opens the store as a memory-mapped pyarrow dataset.
+    """
+    filesystem = pafs.LocalFileSystem(use_mmap=True)
+    return ds.dataset(os.path.abspath(store_dir), format='parquet', partitioning=PARTITIONING,
+                      filesystem=filesystem)
+
+def load_tracks(store_dir=TRACK_STORE_DIR, columns=None, filters=None, years=None, months=None):
+    """
+    Loads tracks from the store with column and predicate pushdown.
+
+    Parameters:
+    - store_dir: Directory of the Parquet store.
+    - columns: Columns to read (defaults to all track columns).
+    - filters: pyarrow expression or list of (column, op, value) tuples, e.g.
+      [('lat vor', '<', -20), ('track_id', 'in', ids)].
+    - years, months: Partition values to keep (file year/month of the tracks).
+
+    Returns:
+    - DataFrame with the same columns as the old get_tracks().
+    """
+    columns = list(columns) if columns is not None else TRACK_COLUMNS
+
+    expressions = []
+    if filters is not None:
+        expressions.append(filters if isinstance(filters, ds.Expression) else pq.filters_to_expression(filters))
+    if years is not None:
+        expressions.append(ds.field('year').isin(list(years)))
+    if months is not None:
+        expressions.append(ds.field('month').isin(list(months)))
+
+    expression = None
+    for expr in expressions:
+        expression = expr if expression is None else expression & expr
+
+    table = track_dataset(store_dir).to_table(columns=columns, filter=expression)
+    return table.to_pandas()
+
+if __name__ == '__main__':
+    convert_raw_tracks()
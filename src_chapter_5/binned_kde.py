@@ -0,0 +1,295 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    binned_kde.py                                      :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/28 09:47:30 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/28 09:47:30 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Binned Gaussian kernel density estimates for large samples.
+
+The values are linearly binned on a fine regular grid and the bin weights are
+convolved with the Gaussian kernel by FFT, so an estimate costs O(N + M log M)
+(M grid points) instead of O(N x grid) as scipy.stats.gaussian_kde. The grid
+only depends on the count, (co)variance and range of the data, so samples too
+large for memory can be binned chunk by chunk (kde_grid_*, bin_*) and turned
+into densities at the end (density_from_bins_*). The
+bandwidth follows gaussian_kde ('scott', 'silverman' or a scalar factor, times
+the data covariance; the 2-D kernel keeps the correlation of the data) and the
+support grid follows seaborn's kdeplot (gridsize, cut, clip), so the curves
+can be drawn in place of kdeplot.
+
+cached_kde_1d / cached_kde_2d keep the results in a directory of .npz files,
+keyed by a label such as (term, phase, region), the parameters and a hash of
+the values, so restyling a figure does not recompute densities.
+"""
+
+import os
+import hashlib
+import numpy as np
+
+from matplotlib.colors import to_rgba
+
+GRIDSIZE = 200
+CUT = 3
+KERNEL_CUTOFF = 5
+BINS_PER_BANDWIDTH = 20
+MAX_BINS_1D = 2 ** 20
+MAX_BINS_2D = 2 ** 11
+
+def bandwidth_factor(n, dimensions=1, bw_method='scott'):
+    """
+    Bandwidth factor of scipy.stats.gaussian_kde.
+    """
+    if bw_method == 'scott':
+        return n ** (-1. / (dimensions + 4))
+    if bw_method == 'silverman':
+        return (n * (dimensions + 2) / 4.) ** (-1. / (dimensions + 4))
+    if np.isscalar(bw_method):
+        return float(bw_method)
+    raise ValueError("bw_method must be 'scott', 'silverman' or a scalar")
+
+def _support(minimum, maximum, bandwidth, cut, clip, gridsize):
+    low = -np.inf if clip is None or clip[0] is None else clip[0]
+    high = np.inf if clip is None or clip[1] is None else clip[1]
+    return np.linspace(max(minimum - bandwidth * cut, low), min(maximum + bandwidth * cut, high), gridsize)
+
+def _bin_axis(minimum, maximum, bandwidth, cut, max_bins):
+    # Binning axis covering the data and the kernel tails, fine relative to the bandwidth
+    low, high = minimum - bandwidth * cut, maximum + bandwidth * cut
+    n_bins = int(np.clip(np.ceil((high - low) / bandwidth * BINS_PER_BANDWIDTH) + 1, 64, max_bins))
+    return low, (high - low) / (n_bins - 1), n_bins
+
+def _linear_bin(values, axis):
+    low, delta, n_bins = axis
+    position = (values - low) / delta
+    left = np.clip(np.floor(position).astype(np.int64), 0, n_bins - 2)
+    right_weight = np.clip(position - left, 0, 1)
+    return left, right_weight
+
+def _convolve(counts, kernel):
+    # Linear convolution of counts with a centered kernel, same shape as counts
+    shape = [c + k - 1 for c, k in zip(counts.shape, kernel.shape)]
+    fft_shape = [int(2 ** np.ceil(np.log2(s))) for s in shape]
+    result = np.fft.irfftn(np.fft.rfftn(counts, fft_shape) * np.fft.rfftn(kernel, fft_shape), fft_shape)
+    slices = tuple(slice((k - 1) // 2, (k - 1) // 2 + c) for c, k in zip(counts.shape, kernel.shape))
+    return result[slices]
+
+def _kernel_offsets(bandwidth, axis):
+    low, delta, n_bins = axis
+    half_width = min(int(np.ceil(KERNEL_CUTOFF * bandwidth / delta)), n_bins - 1)
+    return np.arange(-half_width, half_width + 1) * delta
+
+def kde_grid_1d(n, variance, minimum, maximum, cut=CUT, bw_method='scott', bw_adjust=1):
+    """
+    Bandwidth and binning axis of the density of n values with the given
+    variance, minimum and maximum (e.g., from streaming statistics).
+    """
+    bandwidth = bandwidth_factor(n, 1, bw_method) * bw_adjust * np.sqrt(variance)
+    return {'bandwidth': bandwidth, 'minimum': minimum, 'maximum': maximum, 'cut': cut,
+            'axis': _bin_axis(minimum, maximum, bandwidth, cut, MAX_BINS_1D)}
+
+def bin_1d(values, grid):
+    """
+    Linear binning of values (NaN dropped) on the axis of grid; the counts of
+    successive chunks can be added.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    n_bins = grid['axis'][2]
+    left, right_weight = _linear_bin(values, grid['axis'])
+    counts = np.bincount(left, weights=1 - right_weight, minlength=n_bins)
+    return counts + np.bincount(left + 1, weights=right_weight, minlength=n_bins)
+
+def density_from_bins_1d(counts, grid, gridsize=GRIDSIZE, clip=None):
+    """
+    Density on the kdeplot support grid from the binned counts.
+    """
+    bandwidth = grid['bandwidth']
+    support = _support(grid['minimum'], grid['maximum'], bandwidth, grid['cut'], clip, gridsize)
+    offsets = _kernel_offsets(bandwidth, grid['axis'])
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (np.sqrt(2 * np.pi) * bandwidth)
+    density = _convolve(counts, kernel) / counts.sum()
+
+    low, delta, n_bins = grid['axis']
+    return support, np.clip(np.interp(support, low + np.arange(n_bins) * delta, density), 0, None)
+
+def kde_1d(values, gridsize=GRIDSIZE, cut=CUT, clip=None, bw_method='scott', bw_adjust=1):
+    """
+    Density of values on the support grid of seaborn's kdeplot.
+
+    Parameters:
+    - values: 1-D array (NaN values are dropped).
+    - gridsize, cut, clip: Support grid, as in kdeplot.
+    - bw_method, bw_adjust: Bandwidth, as in kdeplot (gaussian_kde factor times bw_adjust).
+
+    Returns:
+    - Tuple (support, density); empty arrays if the density cannot be estimated
+      (less than two values or zero variance).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) < 2 or np.ptp(values) == 0:
+        return np.array([]), np.array([])
+
+    grid = kde_grid_1d(len(values), values.var(ddof=1), values.min(), values.max(), cut, bw_method, bw_adjust)
+    return density_from_bins_1d(bin_1d(values, grid), grid, gridsize, clip)
+
+def kde_grid_2d(n, covariance, minimum, maximum, cut=CUT, bw_method='scott', bw_adjust=1):
+    """
+    Kernel covariance and binning axes of the joint density of n pairs with the
+    given covariance matrix, minima and maxima (e.g., from streaming statistics).
+    Raises numpy.linalg.LinAlgError if the covariance is singular.
+    """
+    covariance = np.asarray(covariance, dtype=np.float64) * (bandwidth_factor(n, 2, bw_method) * bw_adjust) ** 2
+    inverse = np.linalg.inv(covariance)
+    bandwidths = np.sqrt(np.diag(covariance))
+    return {'covariance': covariance, 'inverse': inverse, 'bandwidths': bandwidths,
+            'minimum': np.asarray(minimum, dtype=np.float64), 'maximum': np.asarray(maximum, dtype=np.float64),
+            'cut': cut, 'axes': [_bin_axis(minimum[d], maximum[d], bandwidths[d], cut, MAX_BINS_2D) for d in range(2)]}
+
+def bin_2d(x, y, grid):
+    """
+    Bilinear binning of the (x, y) pairs (pairs with NaN dropped) on the axes
+    of grid, counts indexed [x bin, y bin]; the counts of successive chunks can
+    be added.
+    """
+    data = np.column_stack([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)])
+    data = data[~np.isnan(data).any(axis=1)]
+    shape = [axis[2] for axis in grid['axes']]
+    (left_x, wx), (left_y, wy) = [_linear_bin(data[:, d], grid['axes'][d]) for d in range(2)]
+    counts = np.zeros(shape[0] * shape[1])
+    for dx, weight_x in ((0, 1 - wx), (1, wx)):
+        for dy, weight_y in ((0, 1 - wy), (1, wy)):
+            counts += np.bincount((left_x + dx) * shape[1] + left_y + dy, weights=weight_x * weight_y,
+                                  minlength=len(counts))
+    return counts.reshape(shape)
+
+def density_from_bins_2d(counts, grid, gridsize=GRIDSIZE, clip=None):
+    """
+    Joint density on the kdeplot support grids from the binned counts.
+
+    Returns:
+    - Tuple (x_support, y_support, density), density of shape (len(y_support), len(x_support)).
+    """
+    clip = (None, None) if clip is None else clip
+    supports = [_support(grid['minimum'][d], grid['maximum'][d], grid['bandwidths'][d], grid['cut'], clip[d],
+                         gridsize) for d in range(2)]
+
+    dx, dy = np.meshgrid(*[_kernel_offsets(grid['bandwidths'][d], grid['axes'][d]) for d in range(2)], indexing='ij')
+    inverse = grid['inverse']
+    quadratic = inverse[0, 0] * dx ** 2 + 2 * inverse[0, 1] * dx * dy + inverse[1, 1] * dy ** 2
+    kernel = np.exp(-0.5 * quadratic) / (2 * np.pi * np.sqrt(np.linalg.det(grid['covariance'])))
+    density = _convolve(counts, kernel) / counts.sum()
+
+    # Bilinear interpolation of the binned density on the support grids
+    positions = []
+    for d, (low, delta, n_bins) in enumerate(grid['axes']):
+        position = np.clip((supports[d] - low) / delta, 0, n_bins - 1)
+        left = np.clip(np.floor(position).astype(np.int64), 0, n_bins - 2)
+        positions.append((left, position - left))
+    (ix, tx), (iy, ty) = positions
+    tx, ty = tx[:, None], ty[None, :]
+    ix, iy = ix[:, None], iy[None, :]
+    interpolated = ((1 - tx) * (1 - ty) * density[ix, iy] + tx * (1 - ty) * density[ix + 1, iy] +
+                    (1 - tx) * ty * density[ix, iy + 1] + tx * ty * density[ix + 1, iy + 1])
+    return supports[0], supports[1], np.clip(interpolated.T, 0, None)
+
+def kde_2d(x, y, gridsize=GRIDSIZE, cut=CUT, clip=None, bw_method='scott', bw_adjust=1):
+    """
+    Joint density of (x, y) on the support grid of seaborn's bivariate kdeplot.
+
+    Parameters:
+    - x, y: 1-D arrays (pairs with NaN values are dropped).
+    - gridsize, cut, clip, bw_method, bw_adjust: As in kde_1d (clip is a pair of
+      (low, high) limits, one per variable).
+
+    Returns:
+    - Tuple (x_support, y_support, density) with density of shape
+      (len(y_support), len(x_support)), as used by contour; empty arrays if the
+      density cannot be estimated.
+    """
+    data = np.column_stack([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)])
+    data = data[~np.isnan(data).any(axis=1)]
+    if len(data) < 3 or np.any(np.ptp(data, axis=0) == 0):
+        return np.array([]), np.array([]), np.empty((0, 0))
+    try:
+        grid = kde_grid_2d(len(data), np.cov(data, rowvar=False), data.min(axis=0), data.max(axis=0),
+                           cut, bw_method, bw_adjust)
+    except np.linalg.LinAlgError:
+        return np.array([]), np.array([]), np.empty((0, 0))
+    return density_from_bins_2d(bin_2d(data[:, 0], data[:, 1], grid), grid, gridsize, clip)
+
+def iso_proportion_levels(density, levels=10, thresh=0.05):
+    """
+    Density levels enclosing iso-proportions of the mass, as the contour levels
+    of seaborn's bivariate kdeplot.
+    """
+    proportions = np.linspace(thresh, 1, levels) if np.isscalar(levels) else np.asarray(levels)
+    sorted_values = np.sort(np.ravel(density))[::-1]
+    cumulative = np.cumsum(sorted_values) / sorted_values.sum()
+    return np.take(sorted_values, np.searchsorted(cumulative, 1 - proportions), mode='clip')
+
+def _cache_file(cache_directory, label, arrays, params):
+    digest = hashlib.sha1(repr(sorted(params.items())).encode())
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    name = '_'.join(str(part) for part in np.atleast_1d(np.asarray(label, dtype=object)))
+    name = ''.join(c if c.isalnum() or c in '-.' else '_' for c in name)
+    return os.path.join(cache_directory, f'{name}_{digest.hexdigest()[:16]}.npz')
+
+def cached_kde_1d(cache_directory, label, values, **params):
+    """
+    kde_1d of values, loaded from cache_directory if it was already computed
+    for the same label (e.g., (term, phase, region)), values and parameters.
+    """
+    path = _cache_file(cache_directory, label, [values], params)
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return cached['support'], cached['density']
+    support, density = kde_1d(values, **params)
+    os.makedirs(cache_directory, exist_ok=True)
+    np.savez(path, support=support, density=density)
+    return support, density
+
+def cached_kde_2d(cache_directory, label, x, y, **params):
+    """
+    kde_2d of (x, y), cached as cached_kde_1d.
+    """
+    path = _cache_file(cache_directory, label, [x, y], params)
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return cached['x_support'], cached['y_support'], cached['density']
+    x_support, y_support, density = kde_2d(x, y, **params)
+    os.makedirs(cache_directory, exist_ok=True)
+    np.savez(path, x_support=x_support, y_support=y_support, density=density)
+    return x_support, y_support, density
+
+def plot_density(ax, support, density, fill=False, color=None, alpha=None, vertical=False, **kwargs):
+    """
+    Draws a density curve as seaborn's kdeplot does (filled with alpha 0.25 and
+    an opaque edge, or a line).
+    """
+    if len(support) == 0:
+        return None
+    if color is None:
+        color = ax._get_lines.get_next_color()
+    if fill:
+        alpha = 0.25 if alpha is None else alpha
+        kwargs.setdefault('facecolor', to_rgba(color, alpha))
+        kwargs.setdefault('edgecolor', to_rgba(color, 1))
+        fill_between = ax.fill_betweenx if vertical else ax.fill_between
+        artist = fill_between(support, 0, density, **kwargs)
+        artist.sticky_edges.x[:] = [0, np.inf] if vertical else []
+        artist.sticky_edges.y[:] = [] if vertical else [0, np.inf]
+    else:
+        kwargs['color'] = to_rgba(color, 1 if alpha is None else alpha)
+        artist, = ax.plot(density, support, **kwargs) if vertical else ax.plot(support, density, **kwargs)
+        artist.sticky_edges.x[:] = [0, np.inf] if vertical else []
+        artist.sticky_edges.y[:] = [] if vertical else [0, np.inf]
+    return artist
@@ -14,7 +14,7 @@ import os
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from tqdm import tqdm
+from energetics_store import read_life_cycles
 
 PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
 base_path = f'{PATH}/csv_database_energy_by_periods'
@@ -39,26 +39,6 @@ TICK_FONT_SIZE = 12
 TITLE_FONT_SIZE = 16
 LEGEND_FONT_SIZE = 12
 
-def read_life_cycles(base_path):
-    """
-    Reads all CSV files in the specified directory and collects DataFrame for each system.
-    """
-    systems_energetics = {}
-
-    for filename in tqdm(os.listdir(base_path), desc="Reading CSV files"):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(base_path, filename)
-            system_id = filename.split('_')[0]
-            try:
-                df = pd.read_csv(file_path)
-                df = df.rename(columns={'Unnamed: 0': 'phase'})
-                df.index = range(1, len(df) + 1)
-                systems_energetics[system_id] = df
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-
-    return systems_energetics
-
 def compute_total_phase(systems_energetics):
     """
     Computes the mean values across all phases for each system to represent the "Total" phase.
@@ -151,7 +131,7 @@ def plot_box_plots_by_phase(systems_energetics, group_name, terms_prefix, output
 if __name__ == "__main__":
     os.makedirs(output_directory, exist_ok=True)
 
-    systems_energetics = read_life_cycles(base_path)
+    systems_energetics = read_life_cycles(base_path, phase_column='phase')
     systems_energetics = compute_total_phase(systems_energetics)
 
     # Define term prefixes for each group
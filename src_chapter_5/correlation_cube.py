@@ -0,0 +1,181 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    correlation_cube.py                                :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/07/01 09:18:52 by daniloceano       #+#    #+#              #
+#    Updated: 2024/07/01 09:18:52 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Correlation matrices of the LEC terms for every (phase, region, season) slice.
+
+The samples are the per-system means of each phase (and of the 'Total' phase,
+the mean over the phases of each system, as in energetics_cube). Each mean is
+assigned to the four slices (region or 'all') x (season or 'all') of its phase,
+the values are ranked within every slice in one grouped pass, and the Pearson
+correlations of the values and of the ranks (Spearman) are obtained from
+masked matrix products of each slice, using for every pair of terms the
+systems where both are defined (as DataFrame.corr). Only the pairs of terms
+missing for different systems are ranked again over their common systems.
+
+The cube is saved next to the energetics store as
+<directory>_correlation_cube.parquet, one row per (slice, method, pair).
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from energetics_cube import ALL, TOTAL_PHASE, _factorize, _with_total_phase
+from energetics_store import load_energetics, store_path, term_columns
+
+SLICE_DIMENSIONS = ['phase', 'region', 'season']
+METHODS = ['pearson', 'spearman']
+
+def correlation_cube_path(base_path):
+    return f'{os.path.normpath(base_path)}_correlation_cube.parquet'
+
+def system_means(energetics, terms):
+    """
+    Mean of each term per (system, phase), including the 'Total' phase.
+    """
+    rows = _with_total_phase(energetics, terms)
+    return rows.groupby(['system_id', 'phase'], sort=False)[terms].mean().reset_index()
+
+def _slice_rows(means, systems):
+    # Each (system, phase) mean is repeated for its region and season and for 'all'
+    labels = {}
+    for dim in SLICE_DIMENSIONS[1:]:
+        if systems is not None and dim in systems.columns:
+            labels[dim] = means['system_id'].map(systems[dim]).astype(object).fillna(ALL).values
+        else:
+            labels[dim] = np.full(len(means), ALL, dtype=object)
+
+    copies = []
+    for region in (labels['region'], np.full(len(means), ALL, dtype=object)):
+        for season in (labels['season'], np.full(len(means), ALL, dtype=object)):
+            copies.append(pd.DataFrame({'phase': means['phase'].values, 'region': region, 'season': season}))
+    rows = pd.concat(copies, ignore_index=True)
+    # Systems already labelled 'all' would otherwise be counted twice in the 'all' slices
+    rows['row'] = np.tile(np.arange(len(means)), 4)
+    return rows.drop_duplicates().reset_index(drop=True)
+
+def _pairwise_pearson(values):
+    # Pearson correlation and count of complete rows of every pair of columns
+    valid = ~np.isnan(values)
+    mask = valid.astype(np.float64)
+    # Shifting by the column means keeps the sums of products well conditioned
+    shift = np.where(valid, values, 0.).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    centered = np.where(valid, values - shift, 0.)
+
+    count = mask.T @ mask
+    sum_x = centered.T @ mask
+    sum_xx = (centered ** 2).T @ mask
+    sum_xy = centered.T @ centered
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = sum_xy - sum_x * sum_x.T / count
+        variance_x = sum_xx - sum_x ** 2 / count
+        correlation = covariance / np.sqrt(variance_x * variance_x.T)
+    correlation[count < 2] = np.nan
+    return np.clip(correlation, -1, 1), count
+
+def _pairwise_spearman(values, ranks):
+    # Pearson correlation of the ranks, re-ranking the pairs with different missing rows
+    correlation, count = _pairwise_pearson(ranks)
+    valid = ~np.isnan(values)
+    patterns, codes = np.unique(valid, axis=1, return_inverse=True)
+    if patterns.shape[1] > 1:
+        for i, j in zip(*np.nonzero(codes.ravel()[:, None] < codes.ravel()[None, :])):
+            both = valid[:, i] & valid[:, j]
+            if both.sum() >= 2:
+                pair_ranks = pd.DataFrame(values[both][:, [i, j]]).rank(method='average').to_numpy()
+                correlation[i, j] = correlation[j, i] = _pairwise_pearson(pair_ranks)[0][0, 1]
+    return correlation, count
+
+def build_correlation_cube(energetics, systems=None, terms=None):
+    """
+    Builds the correlation cube from the long-format energetics.
+
+    Parameters:
+    - energetics: DataFrame as returned by energetics_store.load_energetics.
+    - systems: DataFrame indexed by system_id with 'region' and/or 'season'
+      (e.g., energetics_cube.systems_table); missing dimensions are 'all'.
+    - terms: Terms to correlate (all terms if None).
+
+    Returns:
+    - DataFrame with the SLICE_DIMENSIONS, 'method', 'term_x', 'term_y',
+      'correlation' and 'count' (systems where both terms are defined).
+    """
+    terms = term_columns(energetics) if terms is None else list(terms)
+    means = system_means(energetics, terms)
+    rows = _slice_rows(means, systems)
+    slice_codes, slice_index = _factorize(rows[SLICE_DIMENSIONS])
+
+    values = pd.DataFrame(means[terms].to_numpy(dtype=np.float64)[rows['row'].values], columns=terms)
+    ranks = values.groupby(slice_codes, sort=False).rank(method='average').to_numpy()
+    values = values.to_numpy()
+
+    order = np.argsort(slice_codes, kind='stable')
+    bounds = np.r_[0, np.cumsum(np.bincount(slice_codes, minlength=len(slice_index)))]
+    n_terms = len(terms)
+    term_x, term_y = np.repeat(terms, n_terms), np.tile(terms, n_terms)
+
+    tables = []
+    for s, cell in enumerate(slice_index):
+        members = order[bounds[s]:bounds[s + 1]]
+        for method in METHODS:
+            if method == 'pearson':
+                correlation, count = _pairwise_pearson(values[members])
+            else:
+                correlation, count = _pairwise_spearman(values[members], ranks[members])
+            tables.append(pd.DataFrame({'phase': cell[0], 'region': cell[1], 'season': cell[2], 'method': method,
+                                        'term_x': term_x, 'term_y': term_y,
+                                        'correlation': correlation.ravel(), 'count': count.ravel().astype(np.int64)}))
+    return pd.concat(tables, ignore_index=True)
+
+def correlation_cube(base_path, systems=None, rebuild=False):
+    """
+    Loads the saved correlation cube of base_path, (re)building it from the
+    energetics store if it is missing, older than the store or if rebuild is True.
+    systems may also be a function of the energetics returning the systems
+    table, so it is only computed when the cube is built.
+    """
+    path = correlation_cube_path(base_path)
+    if not rebuild and os.path.exists(path):
+        # Loading the store first refreshes it if the CSV files changed
+        load_energetics(base_path, columns=[])
+        if os.path.getmtime(path) >= os.path.getmtime(store_path(base_path)):
+            return pd.read_parquet(path)
+    energetics = load_energetics(base_path)
+    cube = build_correlation_cube(energetics, systems(energetics) if callable(systems) else systems)
+    cube.to_parquet(path, index=False)
+    print(f"Wrote {path}")
+    return cube
+
+def correlation_matrix(cube, method='pearson', phase=TOTAL_PHASE, region=ALL, season=ALL):
+    """
+    Correlation matrix (terms x terms) of one slice of the cube.
+    """
+    selected = cube[(cube['method'] == method) & (cube['phase'] == phase) &
+                    (cube['region'] == region) & (cube['season'] == season)]
+    if selected.empty:
+        raise ValueError(f"No correlations for method={method}, phase={phase}, region={region}, season={season}")
+    terms = list(pd.unique(selected['term_x']))
+    matrix = selected.pivot(index='term_x', columns='term_y', values='correlation')
+    matrix = matrix.loc[terms, terms]
+    matrix.index.name, matrix.columns.name = None, None
+    return matrix
+
+def main():
+    PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
+    base_path = f'{PATH}/csv_database_energy_by_periods'
+
+    from energetics_cube import systems_table
+    correlation_cube(base_path, systems_table, rebuild=True)
+
+if __name__ == "__main__":
+    main()
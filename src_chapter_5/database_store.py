@@ -0,0 +1,129 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    database_store.py                                  :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/07/04 09:41:18 by daniloceano       #+#    #+#              #
+#    Updated: 2024/07/04 09:41:18 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Consolidated store of the tracks with periods and energetics.
+
+The track_periods_energetics_<track_id>.csv files of database_tracks (one per
+system, written by create_database) are ingested once into a single parquet
+table saved next to the directory (<directory>.parquet), sorted by track_id
+and keeping the row order of each file, so the first row of a system is still
+its genesis.
+
+The row groups are small and sorted, so load_database() only reads the row
+groups of the requested systems, instead of globbing the directory and parsing
+the file name of every CSV. As in energetics_store, the store is rebuilt when
+the CSV files change (number of files or newest modification time).
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from concurrent.futures import ThreadPoolExecutor
+
+DATABASE_DIRECTORY = '../results_chapter_5/database_tracks'
+SOURCE_KEY = b'database_source'
+ROW_GROUP_SIZE = 16384
+
+def database_store_path(directory=DATABASE_DIRECTORY):
+    return f'{os.path.normpath(directory)}.parquet'
+
+def _source_signature(directory):
+    n_files, newest = 0, 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.csv'):
+                n_files += 1
+                newest = max(newest, entry.stat().st_mtime_ns)
+    return {'n_files': n_files, 'newest_mtime_ns': newest}
+
+def _read_track(file_path):
+    try:
+        return pd.read_csv(file_path)
+    except Exception as e:
+        print(f"Error processing {os.path.basename(file_path)}: {e}")
+        return None
+
+def build_database_store(directory=DATABASE_DIRECTORY, path=None):
+    """
+    Ingests all CSV files of directory into the parquet store.
+
+    Returns:
+    - The DataFrame that was written.
+    """
+    path = path or database_store_path(directory)
+    signature = _source_signature(directory)
+    file_paths = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.csv'))
+
+    print(f"Ingesting {len(file_paths)} track files from {directory}...")
+    with ThreadPoolExecutor() as executor:
+        tracks = [df for df in executor.map(_read_track, file_paths) if df is not None]
+
+    database = pd.concat(tracks, ignore_index=True)
+    database['track_id'] = database['track_id'].astype(np.int64)
+    database['date'] = pd.to_datetime(database['date']).astype('datetime64[ns]')
+    database = database.sort_values('track_id', kind='stable').reset_index(drop=True)
+
+    table = pa.Table.from_pandas(database, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), SOURCE_KEY: json.dumps(signature).encode()}
+    tmp_path = f'{path}.tmp'
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp_path, path)
+    print(f"Wrote {path}")
+    return database
+
+def _is_current(directory, path):
+    if not os.path.exists(path):
+        return False
+    if not os.path.isdir(directory):
+        # Store shipped without the CSV files
+        return True
+    metadata = pq.read_schema(path).metadata or {}
+    if SOURCE_KEY not in metadata:
+        return False
+    return json.loads(metadata[SOURCE_KEY]) == _source_signature(directory)
+
+def database_store(directory=DATABASE_DIRECTORY):
+    """
+    Path of the store of directory, (re)built if the CSV files changed.
+    """
+    path = database_store_path(directory)
+    if not _is_current(directory, path):
+        build_database_store(directory, path)
+    return path
+
+def load_database(directory=DATABASE_DIRECTORY, columns=None, track_ids=None):
+    """
+    Rows of the database, sorted by track_id and in the order of each file.
+
+    Parameters:
+    - directory: database_tracks directory.
+    - columns: Columns to read (all if None).
+    - track_ids: Only read these systems (all if None).
+
+    Returns:
+    - DataFrame with the columns of the CSV files.
+    """
+    filters = None
+    if track_ids is not None:
+        filters = [('track_id', 'in', [int(track_id) for track_id in track_ids])]
+    return pd.read_parquet(database_store(directory), columns=columns, filters=filters)
+
+def main():
+    build_database_store(DATABASE_DIRECTORY)
+
+if __name__ == "__main__":
+    main()
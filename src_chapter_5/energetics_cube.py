@@ -0,0 +1,281 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    energetics_cube.py                                 :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/24 11:20:33 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/24 11:20:33 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Phase-level aggregation cube of the LEC terms.
+
+For every cell (phase, region, season, cluster) and term, the cube keeps the
+sufficient statistics of the per-phase values of the systems: count, mean, sum
+of squared deviations from the mean (m2), min and max, plus a mergeable
+quantile sketch (quantile_sketch).
+The 'Total' phase holds the mean over the phases of each system, as
+compute_total_phase in statistics_phases.
+
+Statistics of any slice (mean, std, quantiles, range) are obtained by merging
+the statistics of the selected cells (Chan's formula, as in
+streaming_correlation), without going back to the raw data. The cube is built
+once from the energetics store and saved next to it as
+<directory>_cube_moments.parquet and <directory>_cube_sketch.parquet, with the
+systems table it was built with (<directory>_cube_systems.parquet), so a
+rebuild keeps the region, season and cluster dimensions.
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+from collections import namedtuple
+
+from energetics_store import load_energetics, store_path, term_columns
+from quantile_sketch import build_sketch, merge_sketches, sketch_quantiles
+
+sys.path.append('../src_chapter_4')
+from track_store import load_tracks
+from genesis_index import GENESIS_REGIONS, build_genesis_index, genesis_in_region
+from density_layers import SEASONS, MONTH_TO_SEASON
+
+DIMENSIONS = ['phase', 'region', 'season', 'cluster']
+ALL = 'all'
+TOTAL_PHASE = 'Total'
+
+EnergeticsCube = namedtuple('EnergeticsCube', ['moments', 'sketch'])
+
+def cube_paths(base_path):
+    base = os.path.normpath(base_path)
+    return f'{base}_cube_moments.parquet', f'{base}_cube_sketch.parquet'
+
+def cube_systems_path(base_path):
+    return f'{os.path.normpath(base_path)}_cube_systems.parquet'
+
+def _factorize(frame):
+    # Integer code of each row and the unique rows as an index named like the columns
+    codes, uniques = pd.factorize(pd.MultiIndex.from_frame(frame))
+    if frame.shape[1] == 1:
+        return codes, pd.Index(uniques.get_level_values(0), name=frame.columns[0])
+    return codes, pd.MultiIndex.from_tuples(list(uniques), names=list(frame.columns))
+
+def _with_total_phase(energetics, terms):
+    total = energetics.groupby('system_id', sort=False, observed=True)[terms].mean().reset_index()
+    total['phase'] = TOTAL_PHASE
+    energetics = energetics[['system_id', 'phase'] + terms].copy()
+    energetics['phase'] = energetics['phase'].astype(object)
+    return pd.concat([energetics, total], ignore_index=True)
+
+def build_energetics_cube(energetics, systems=None, terms=None):
+    """
+    Builds the cube from the long-format energetics.
+
+    Parameters:
+    - energetics: DataFrame as returned by energetics_store.load_energetics.
+    - systems: DataFrame indexed by system_id with any of the 'region', 'season'
+      and 'cluster' columns. Missing dimensions (or systems) are labelled 'all'.
+    - terms: Terms to aggregate (all terms if None).
+
+    Returns:
+    - EnergeticsCube(moments, sketch): moments has the DIMENSIONS, 'term',
+      'count', 'mean', 'm2', 'min' and 'max'; sketch has the DIMENSIONS,
+      'term', 'key' and 'count'.
+    """
+    terms = term_columns(energetics) if terms is None else list(terms)
+    rows = _with_total_phase(energetics, terms)
+
+    labels = {'phase': rows['phase'].values}
+    for dim in DIMENSIONS[1:]:
+        if systems is not None and dim in systems.columns:
+            labels[dim] = rows['system_id'].map(systems[dim]).astype(object).fillna(ALL).values
+        else:
+            labels[dim] = np.full(len(rows), ALL, dtype=object)
+
+    # One integer code per cell, and one group per (cell, term)
+    cell_codes, cell_index = _factorize(pd.DataFrame(labels))
+    n_cells, n_terms = len(cell_index), len(terms)
+
+    values = rows[terms].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+    groups = cell_codes[:, None] * n_terms + np.arange(n_terms)[None, :]
+    filled = np.where(valid, values, 0.)
+
+    n_groups = n_cells * n_terms
+    count = np.bincount(groups.ravel(), weights=valid.ravel(), minlength=n_groups)
+    total = np.bincount(groups.ravel(), weights=filled.ravel(), minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, 0.)
+    # Squared deviations from the mean of each cell (two passes, no cancellation)
+    deviations = np.where(valid, values - mean[groups], 0.)
+    m2 = np.bincount(groups.ravel(), weights=(deviations ** 2).ravel(), minlength=n_groups)
+    minimum = np.full(n_groups, np.inf)
+    maximum = np.full(n_groups, -np.inf)
+    np.minimum.at(minimum, groups[valid], values[valid])
+    np.maximum.at(maximum, groups[valid], values[valid])
+
+    group_cells = cell_index.to_frame(index=False).iloc[np.repeat(np.arange(n_cells), n_terms)].reset_index(drop=True)
+    group_cells['term'] = np.tile(terms, n_cells)
+
+    moments = group_cells.assign(count=count.astype(np.int64), mean=mean, m2=m2, min=minimum, max=maximum)
+    moments = moments[moments['count'] > 0].reset_index(drop=True)
+
+    sketch = build_sketch(values[valid], groups[valid])
+    sketch = pd.concat([group_cells.iloc[sketch['group'].values].reset_index(drop=True),
+                        sketch[['key', 'count']].reset_index(drop=True)], axis=1)
+    return EnergeticsCube(moments, sketch)
+
+def save_cube(cube, base_path, systems=None):
+    moments_path, sketch_path = cube_paths(base_path)
+    cube.moments.to_parquet(moments_path, index=False)
+    cube.sketch.to_parquet(sketch_path, index=False)
+    print(f"Wrote {moments_path} and {sketch_path}")
+    if systems is not None:
+        systems.to_parquet(cube_systems_path(base_path))
+
+def load_cube(base_path):
+    moments_path, sketch_path = cube_paths(base_path)
+    return EnergeticsCube(pd.read_parquet(moments_path), pd.read_parquet(sketch_path))
+
+def _split_dimensions(moments):
+    # Dimensions of a saved cube with cells other than 'all'
+    return [dim for dim in DIMENSIONS[1:] if (moments[dim] != ALL).any()]
+
+def energetics_cube(base_path, systems=None, rebuild=False):
+    """
+    Loads the saved cube of base_path, (re)building it from the energetics store
+    if it is missing, older than the store or if rebuild is True.
+
+    systems may also be a function of the energetics returning the systems
+    table, as in correlation_cube. Without systems, the cube is rebuilt with
+    the systems table saved with it; a cube with region, season or cluster
+    cells is never overwritten by one without them.
+    """
+    moments_path, _ = cube_paths(base_path)
+    if not rebuild and os.path.exists(moments_path):
+        # Loading the store first refreshes it if the CSV files changed
+        load_energetics(base_path, columns=[])
+        if os.path.getmtime(moments_path) >= os.path.getmtime(store_path(base_path)):
+            cube = load_cube(base_path)
+            # Cubes saved before the moments were kept as mean and m2 are rebuilt
+            if 'm2' in cube.moments.columns:
+                return cube
+
+    energetics = load_energetics(base_path)
+    if callable(systems):
+        systems = systems(energetics)
+    if systems is None and os.path.exists(cube_systems_path(base_path)):
+        systems = pd.read_parquet(cube_systems_path(base_path))
+    if systems is None and os.path.exists(moments_path):
+        dimensions = _split_dimensions(pd.read_parquet(moments_path, columns=DIMENSIONS[1:]))
+        if dimensions:
+            raise ValueError(f"The cube of {base_path} has {', '.join(dimensions)} cells but no systems table "
+                             f"was given: rebuild it with energetics_cube(base_path, systems_table)")
+    cube = build_energetics_cube(energetics, systems)
+    save_cube(cube, base_path, systems)
+    return cube
+
+def _select(table, selection):
+    mask = np.ones(len(table), dtype=bool)
+    for dim, value in selection.items():
+        if dim not in DIMENSIONS + ['term']:
+            raise ValueError(f"Invalid dimension '{dim}'. Must be one of: {', '.join(DIMENSIONS + ['term'])}")
+        if value is None:
+            continue
+        values = [value] if isinstance(value, str) or np.ndim(value) == 0 else list(value)
+        mask &= table[dim].isin(values).values
+    return table[mask]
+
+def cube_statistics(cube, by=('phase',), quantiles=(0.2, 0.5, 0.8), **selection):
+    """
+    Statistics of the cells matching selection, grouped by the by dimensions
+    (the other dimensions are aggregated).
+
+    Parameters:
+    - cube: EnergeticsCube.
+    - by: Dimensions kept in the result (term is always kept).
+    - quantiles: Quantiles estimated from the sketches.
+    - selection: Values (or lists of values) for any of the DIMENSIONS or
+      'term', e.g. phase=['incipient', 'mature'], season='DJF'.
+
+    Returns:
+    - DataFrame indexed by (*by, 'term') with 'count', 'mean', 'std', 'min',
+      'max' and one 'q<quantile>' column per quantile.
+    """
+    keys = list(by) + ['term']
+    moments = _select(cube.moments, selection)
+    # Chan's merge of the cells: m2 = sum(m2_i) + sum(n_i * (mean_i - mean) ** 2)
+    n_cells = moments['count'].astype(np.float64)
+    moments = moments.assign(weighted=n_cells * moments['mean'])
+    grouped = moments.groupby(keys, sort=False)
+    group_mean = grouped['weighted'].transform('sum') / grouped['count'].transform('sum')
+    moments = moments.assign(m2=moments['m2'] + n_cells * (moments['mean'] - group_mean) ** 2)
+    stats = moments.groupby(keys, sort=False).agg(count=('count', 'sum'), weighted=('weighted', 'sum'),
+                                                   m2=('m2', 'sum'), min=('min', 'min'), max=('max', 'max'))
+    n = stats['count'].astype(np.float64)
+    stats['mean'] = stats['weighted'] / n
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['std'] = np.sqrt(stats['m2'] / (n - 1))
+    stats = stats[['count', 'mean', 'std', 'min', 'max']]
+
+    if quantiles:
+        sketch = _select(cube.sketch, selection)
+        group_codes, group_index = _factorize(sketch[keys])
+        merged = merge_sketches(pd.DataFrame({'group': group_codes, 'key': sketch['key'].values,
+                                              'count': sketch['count'].values}))
+        estimates = sketch_quantiles(merged, quantiles)
+        estimates.index = group_index[estimates.index.values]
+        estimates.columns = [f'q{q:g}' for q in quantiles]
+        stats = stats.join(estimates)
+    return stats
+
+def term_table(cube, statistic='mean', by='phase', **selection):
+    """
+    One statistic of all terms as a (by x term) table, e.g. the phase means
+    used by the LEC diagrams.
+    """
+    stats = cube_statistics(cube, by=(by,), quantiles=() if not statistic.startswith('q') else
+                            (float(statistic[1:]),), **selection)
+    table = stats[statistic].unstack('term')
+    terms = [term for term in pd.unique(cube.moments['term']) if term in table.columns]
+    return table[terms]
+
+def systems_table(energetics, clusters_path=None):
+    """
+    Genesis region and season (from the track store) and, if clusters_path is
+    given, cluster of each system, indexed by system_id.
+    """
+    system_ids = pd.unique(energetics['system_id'])
+    tracks = load_tracks(columns=['track_id', 'date', 'lon vor', 'lat vor'],
+                         filters=[('track_id', 'in', system_ids.tolist())])
+    tracks = tracks.sort_values(['track_id', 'date'], kind='stable')
+    genesis = build_genesis_index(tracks)
+
+    systems = pd.DataFrame(index=genesis.index)
+    systems['region'] = 'SAt'
+    for region in GENESIS_REGIONS:
+        systems.loc[genesis_in_region(genesis, region).values, 'region'] = region
+    months = pd.to_datetime(genesis['date']).dt.month.values
+    systems['season'] = np.asarray(SEASONS, dtype=object)[MONTH_TO_SEASON[months]]
+
+    if clusters_path and os.path.exists(clusters_path):
+        clusters = pd.read_csv(clusters_path).set_index('track_id')['cluster']
+        systems['cluster'] = clusters.reindex(systems.index).map(
+            lambda c: ALL if pd.isna(c) else f'Cluster {int(c) + 1}')
+    return systems
+
+def main():
+    PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
+    base_path = f'{PATH}/csv_database_energy_by_periods'
+    clusters_path = '../manuscript_lec_climatology/figures/eof_clusters_intense/pcs_with_clusters.csv'
+
+    energetics = load_energetics(base_path, columns=[])
+    systems = systems_table(energetics, clusters_path)
+    energetics_cube(base_path, systems, rebuild=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    energetics_eofs.py                                 :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/07/02 10:12:36 by daniloceano       #+#    #+#              #
+#    Updated: 2024/07/02 10:12:36 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+EOFs of the energetics life-cycle vectors and the PCs of the systems.
+
+Each system is represented by the mean of every term over its phases (the
+'Total' phase of energetics_cube), and the EOFs are the principal axes of the
+centered (not standardized) vectors, so that the energetics of a set of PCs
+is pcs @ eofs + mean.
+
+The decomposition is an incremental SVD (sklearn IncrementalPCA) kept at full
+rank, so adding systems with partial_fit gives the same EOFs as fitting all
+systems again. The signs of the EOFs are kept from one update to the next, so
+the PCs of the systems already analyzed do not flip.
+
+The model, the vectors and the PCs are saved next to the energetics store as
+<directory>_eofs.npz. energetics_eofs() only fits the systems added to the
+store since the last run and projects them onto the updated EOFs; systems
+whose energetics changed or were removed trigger a new fit.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from collections import namedtuple
+from sklearn.decomposition import IncrementalPCA
+
+from energetics_store import load_energetics, store_path, term_columns
+
+N_EOFS = 8
+DOMINANT_EOFS = 4
+BATCH_SIZE = 5000
+TAIL_QUANTILES = {'q90': 0.9, 'q10': 0.1}
+
+# model: IncrementalPCA; vectors: DataFrame (system_id x term) used to fit it;
+# pcs: DataFrame (track_id x PC1..PCn) of the vectors on the first N_EOFS EOFs
+EOFAnalysis = namedtuple('EOFAnalysis', ['model', 'vectors', 'pcs'])
+
+def eofs_path(base_path):
+    return f'{os.path.normpath(base_path)}_eofs.npz'
+
+def life_cycle_vectors(energetics, terms=None):
+    """
+    Mean of each term over the phases of each system, indexed by system_id
+    (systems missing a term in all phases are dropped).
+    """
+    terms = term_columns(energetics) if terms is None else list(terms)
+    vectors = energetics[terms].astype(np.float64).groupby(energetics['system_id'], sort=True).mean()
+    return vectors.dropna().rename(columns=lambda x: x.replace(' (finite diff.)', ''))
+
+def _align_signs(model, reference):
+    # Flips the EOFs pointing away from the previous ones
+    n = min(len(reference), len(model.components_))
+    signs = np.where(np.einsum('ij,ij->i', model.components_[:n], reference[:n]) < 0, -1., 1.)
+    model.components_[:n] *= signs[:, None]
+
+def partial_fit(model, vectors, batch_size=BATCH_SIZE):
+    """
+    Updates the EOFs with new systems (in batches of batch_size), keeping the
+    signs of the previous EOFs.
+    """
+    reference = model.components_.copy() if hasattr(model, 'components_') else None
+    values = vectors.to_numpy(dtype=np.float64)
+    for start in range(0, len(values), batch_size):
+        model.partial_fit(values[start:start + batch_size])
+    if reference is not None:
+        _align_signs(model, reference)
+    return model
+
+def fit_eofs(vectors, batch_size=BATCH_SIZE):
+    """
+    Fits the full-rank EOFs of the life-cycle vectors.
+    """
+    if vectors.isna().any(axis=None):
+        raise ValueError("Life-cycle vectors with missing terms can't be decomposed")
+    model = IncrementalPCA(n_components=min(vectors.shape), batch_size=batch_size)
+    return partial_fit(model, vectors, batch_size)
+
+def project(model, vectors, n_eofs=N_EOFS):
+    """
+    PCs (PC1..PCn) of the vectors on the first n_eofs EOFs, indexed by track_id.
+    """
+    pcs = (vectors.to_numpy(dtype=np.float64) - model.mean_) @ model.components_[:n_eofs].T
+    return pd.DataFrame(pcs, index=pd.Index(vectors.index, name='track_id'),
+                        columns=[f'PC{k + 1}' for k in range(pcs.shape[1])])
+
+def eofs_table(analysis, n_eofs=N_EOFS):
+    """
+    Loadings of the first n_eofs EOFs (one row per EOF, one column per term),
+    as csv_eofs_energetics_with_track/Total/eofs.csv.
+    """
+    return pd.DataFrame(analysis.model.components_[:n_eofs], columns=analysis.vectors.columns,
+                        index=pd.Index(np.arange(1, n_eofs + 1), name='EOF'))
+
+def explained_variance(analysis, n_eofs=N_EOFS):
+    """
+    Eigenvalues and explained variance ratios of the first n_eofs EOFs.
+    """
+    model = analysis.model
+    return pd.DataFrame({'eigenvalue': model.explained_variance_[:n_eofs],
+                         'explained_variance_ratio': model.explained_variance_ratio_[:n_eofs]},
+                        index=pd.Index(np.arange(1, n_eofs + 1), name='EOF'))
+
+def save_eofs(analysis, path):
+    model, vectors = analysis.model, analysis.vectors
+    tmp_path = f'{path}.tmp.npz'
+    np.savez(tmp_path, components=model.components_, singular_values=model.singular_values_,
+             explained_variance=model.explained_variance_,
+             explained_variance_ratio=model.explained_variance_ratio_, mean=model.mean_, var=model.var_,
+             noise_variance=model.noise_variance_, n_samples_seen=model.n_samples_seen_,
+             system_ids=vectors.index.to_numpy(), terms=np.asarray(vectors.columns, dtype=str),
+             vectors=vectors.to_numpy(), pcs=analysis.pcs.to_numpy())
+    os.replace(tmp_path, path)
+    print(f"Wrote {path}")
+
+def load_eofs(path):
+    """
+    EOFAnalysis saved by save_eofs, with a model that can be updated by partial_fit.
+    """
+    with np.load(path) as saved:
+        model = IncrementalPCA(n_components=len(saved['components']))
+        model.components_ = saved['components']
+        model.singular_values_ = saved['singular_values']
+        model.explained_variance_ = saved['explained_variance']
+        model.explained_variance_ratio_ = saved['explained_variance_ratio']
+        model.mean_ = saved['mean']
+        model.var_ = saved['var']
+        model.noise_variance_ = saved['noise_variance'].item()
+        model.n_samples_seen_ = saved['n_samples_seen'].item()
+        model.n_components_ = len(saved['components'])
+        model.n_features_in_ = saved['components'].shape[1]
+        vectors = pd.DataFrame(saved['vectors'], columns=list(saved['terms']),
+                               index=pd.Index(saved['system_ids'], name='system_id'))
+        pcs = pd.DataFrame(saved['pcs'], index=pd.Index(saved['system_ids'], name='track_id'),
+                           columns=[f'PC{k + 1}' for k in range(saved['pcs'].shape[1])])
+    return EOFAnalysis(model, vectors, pcs)
+
+def update_eofs(analysis, vectors):
+    """
+    EOFAnalysis of vectors, reusing analysis when the only differences are new
+    systems (fitted with partial_fit); otherwise the EOFs are fitted again.
+    """
+    if analysis is not None and list(analysis.vectors.columns) == list(vectors.columns):
+        previous = analysis.vectors
+        if previous.index.isin(vectors.index).all() and \
+                np.array_equal(vectors.loc[previous.index].to_numpy(), previous.to_numpy()):
+            new = vectors[~vectors.index.isin(previous.index)]
+            if len(new):
+                print(f"Adding {len(new)} systems to the EOFs")
+                partial_fit(analysis.model, new)
+            vectors = pd.concat([previous, new])
+            return EOFAnalysis(analysis.model, vectors, project(analysis.model, vectors))
+    model = fit_eofs(vectors)
+    return EOFAnalysis(model, vectors, project(model, vectors))
+
+def energetics_eofs(base_path, rebuild=False):
+    """
+    EOF analysis of the systems of the energetics store, loaded from
+    <directory>_eofs.npz and updated with the systems added since it was saved.
+    """
+    path = eofs_path(base_path)
+    analysis = None
+    if not rebuild and os.path.exists(path):
+        analysis = load_eofs(path)
+        # Loading the store first refreshes it if the CSV files changed
+        load_energetics(base_path, columns=[])
+        if os.path.getmtime(path) >= os.path.getmtime(store_path(base_path)):
+            return analysis
+    updated = update_eofs(analysis, life_cycle_vectors(load_energetics(base_path)))
+    save_eofs(updated, path)
+    return updated
+
+def dominant_eofs(pcs, n_eofs=DOMINANT_EOFS, suffix=None):
+    """
+    Adds 'dominant_eof' (1..n_eofs), the EOF with the largest absolute PC of
+    each system.
+
+    Parameters:
+    - pcs: DataFrame with PC1..PCn.
+    - suffix: None to keep all systems, or a key of TAIL_QUANTILES: 'q90' keeps
+      the systems whose dominant PC is above its 90th percentile (EOF(+)) and
+      'q10' those below its 10th percentile (EOF(-)).
+    """
+    columns = [f'PC{k + 1}' for k in range(n_eofs)]
+    values = pcs[columns].to_numpy()
+    dominant = np.abs(values).argmax(axis=1)
+    pcs = pcs.assign(dominant_eof=dominant + 1)
+    if suffix is None:
+        return pcs
+
+    quantile = TAIL_QUANTILES[suffix]
+    limits = np.quantile(values, quantile, axis=0)[dominant]
+    selected = values[np.arange(len(values)), dominant]
+    keep = selected >= limits if quantile >= 0.5 else selected <= limits
+    return pcs[keep]
+
+def load_pcs(base_path, suffix=None):
+    """
+    PCs of all systems with 'track_id' as a column, as the old pcs.csv (or
+    pcs_with_dominant_eof_<suffix>.csv when suffix is given).
+    """
+    pcs = energetics_eofs(base_path).pcs
+    if suffix is not None:
+        pcs = dominant_eofs(pcs, suffix=suffix)
+    return pcs.reset_index()[[*pcs.columns, 'track_id']]
+
+def main():
+    PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
+    base_path = f'{PATH}/csv_database_energy_by_periods'
+
+    analysis = energetics_eofs(base_path)
+    print(explained_variance(analysis))
+
+if __name__ == "__main__":
+    main()
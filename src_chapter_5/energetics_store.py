@@ -0,0 +1,160 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    energetics_store.py                                :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/23 10:12:40 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/23 10:12:40 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Consolidated store of the energetics by periods.
+
+The <system_id>_*.csv files of csv_database_energy_by_periods (one row per phase,
+one column per LEC term) are ingested once into a long-format parquet table saved
+next to the directory (<directory>.parquet) with columns 'system_id', 'phase'
+(categorical) and one float32 column per term, keeping the original term names.
+
+The store is rebuilt when the CSV files change (number of files or newest
+modification time), and loads are cached per process, so the figure and table
+scripts share a single fast read instead of parsing thousands of CSV files.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+PHASES = ['incipient', 'intensification', 'mature', 'decay', 'residual',
+          'incipient 2', 'intensification 2', 'mature 2', 'decay 2']
+
+ID_COLUMNS = ['system_id', 'phase']
+SOURCE_KEY = b'energetics_source'
+
+def store_path(base_path):
+    return f'{os.path.normpath(base_path)}.parquet'
+
+def _source_signature(base_path):
+    n_files, newest = 0, 0
+    with os.scandir(base_path) as entries:
+        for entry in entries:
+            if entry.name.endswith('.csv'):
+                n_files += 1
+                newest = max(newest, entry.stat().st_mtime_ns)
+    return {'n_files': n_files, 'newest_mtime_ns': newest}
+
+def _read_system(file_path):
+    try:
+        df = pd.read_csv(file_path)
+    except Exception as e:
+        print(f"Error processing {os.path.basename(file_path)}: {e}")
+        return None
+    df = df.rename(columns={'Unnamed: 0': 'phase'})
+    df.insert(0, 'system_id', int(os.path.basename(file_path).split('_')[0]))
+    return df
+
+def build_energetics_store(base_path, path=None):
+    """
+    Ingests all CSV files of base_path into the parquet store.
+
+    Parameters:
+    - base_path: Directory with the <system_id>_*.csv energetics by periods.
+    - path: Output file (defaults to store_path(base_path)).
+
+    Returns:
+    - The long-format DataFrame that was written.
+    """
+    path = path or store_path(base_path)
+    signature = _source_signature(base_path)
+    file_paths = sorted(os.path.join(base_path, f) for f in os.listdir(base_path) if f.endswith('.csv'))
+
+    print(f"Ingesting {len(file_paths)} energetics files from {base_path}...")
+    with ThreadPoolExecutor() as executor:
+        systems = [df for df in executor.map(_read_system, file_paths) if df is not None]
+
+    energetics = pd.concat(systems, ignore_index=True)
+    terms = [col for col in energetics.columns if col not in ID_COLUMNS]
+    energetics[terms] = energetics[terms].apply(pd.to_numeric, errors='coerce').astype(np.float32)
+    energetics['system_id'] = energetics['system_id'].astype(np.int64)
+    found = set(energetics['phase'].dropna())
+    categories = [p for p in PHASES if p in found] + sorted(found - set(PHASES))
+    energetics['phase'] = pd.Categorical(energetics['phase'], categories=categories)
+
+    table = pa.Table.from_pandas(energetics, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), SOURCE_KEY: json.dumps(signature).encode()}
+    tmp_path = f'{path}.tmp'
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Wrote {path}")
+    return energetics
+
+def _is_current(base_path, path):
+    if not os.path.exists(path):
+        return False
+    if not os.path.isdir(base_path):
+        # Store shipped without the CSV files
+        return True
+    metadata = pq.read_schema(path).metadata or {}
+    if SOURCE_KEY not in metadata:
+        return False
+    return json.loads(metadata[SOURCE_KEY]) == _source_signature(base_path)
+
+@lru_cache(maxsize=None)
+def _cached_load(base_path, columns):
+    path = store_path(base_path)
+    if not _is_current(base_path, path):
+        build_energetics_store(base_path, path)
+    if columns is not None:
+        columns = ID_COLUMNS + [col for col in columns if col not in ID_COLUMNS]
+    return pd.read_parquet(path, columns=columns)
+
+def load_energetics(base_path, columns=None, phases=None):
+    """
+    Long-format energetics of all systems.
+
+    Parameters:
+    - base_path: Directory with the energetics by periods CSV files.
+    - columns: Terms to load (all terms if None); 'system_id' and 'phase' are
+      always included.
+    - phases: Only keep rows of these phases.
+
+    Returns:
+    - DataFrame with 'system_id', 'phase' and one float32 column per term, in
+      the order of the original files.
+    """
+    energetics = _cached_load(os.path.normpath(base_path), tuple(columns) if columns is not None else None)
+    if phases is not None:
+        energetics = energetics[energetics['phase'].isin(phases)]
+    # Copy, so callers can modify the frame without touching the cache
+    return energetics.copy()
+
+def term_columns(energetics):
+    return [col for col in energetics.columns if col not in ID_COLUMNS]
+
+def read_life_cycles(base_path, phase_column='Unnamed: 0', columns=None):
+    """
+    Per-system DataFrames as the old per-file readers returned them, built
+    from the store.
+
+    Parameters:
+    - base_path: Directory with the energetics by periods CSV files.
+    - phase_column: Name of the phase column ('Unnamed: 0' as in the CSV files,
+      or e.g. 'phase').
+    - columns: Terms to load (all terms if None).
+
+    Returns:
+    - Dictionary {system_id (str): DataFrame}.
+    """
+    energetics = load_energetics(base_path, columns=columns)
+    energetics['phase'] = energetics['phase'].astype(object)
+    energetics = energetics.rename(columns={'phase': phase_column})
+    return {str(system_id): df.drop(columns='system_id').reset_index(drop=True)
+            for system_id, df in energetics.groupby('system_id', sort=False)}
@@ -0,0 +1,178 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    pc_clusters.py                                     :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/07/03 14:27:10 by daniloceano       #+#    #+#              #
+#    Updated: 2024/07/03 14:27:10 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+K-means clustering of the PCs of the systems, with the number of clusters
+selected from several scores.
+
+Each worker process runs one seed (spawned from a single numpy SeedSequence)
+through k = 2..K with MiniBatchKMeans, warm starting every k from the centers
+of k - 1 plus one center drawn as in k-means++. For each k the seed with the
+lowest distortion (inertia) is kept and scored with:
+
+- distortion, whose elbow (Kneedle, as yellowbrick's KElbowVisualizer) gives k;
+- silhouette, on a sample of SILHOUETTE_SAMPLE systems;
+- Davies-Bouldin.
+
+The clusters at the selected k are refined by a full KMeans started from the
+best mini-batch centers. The standardization and the centers are saved as
+.npz, so new systems are assigned with predict_clusters instead of a re-fit.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import davies_bouldin_score, pairwise_distances_argmin_min, silhouette_score
+
+DEFAULT_SEED = 42
+N_SEEDS = 4
+K_RANGE = (2, 10)
+BATCH_SIZE = 1024
+SILHOUETTE_SAMPLE = 5000
+
+# columns: PCs clustered; mean, scale: standardization; centers: standardized cluster centers
+ClusterModel = namedtuple('ClusterModel', ['columns', 'mean', 'scale', 'centers'])
+# scores: DataFrame indexed by k; centers: {k: best standardized centers}; elbow: selected k (or None)
+KSelection = namedtuple('KSelection', ['scores', 'centers', 'elbow'])
+
+def standardize(data):
+    """
+    Standardized values of a DataFrame (as sklearn StandardScaler), with the
+    mean and scale used.
+    """
+    values = data.to_numpy(dtype=np.float64)
+    mean, scale = values.mean(axis=0), values.std(axis=0)
+    scale = np.where(scale == 0, 1., scale)
+    return (values - mean) / scale, mean, scale
+
+def _seeds(seed, n_seeds):
+    return [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(n_seeds)]
+
+def _next_center(values, centers, rng):
+    # k-means++ draw: probability proportional to the squared distance to the nearest center
+    distances = pairwise_distances_argmin_min(values, centers)[1] ** 2
+    if distances.sum() == 0:
+        return values[rng.integers(len(values))]
+    return values[rng.choice(len(values), p=distances / distances.sum())]
+
+def _warm_started_chain(args):
+    values, ks, seed, batch_size = args
+    rng = np.random.default_rng(seed)
+    chain, centers = [], None
+    for k in ks:
+        init = 'k-means++' if centers is None else np.vstack([centers, _next_center(values, centers, rng)])
+        model = MiniBatchKMeans(n_clusters=k, init=init, n_init=1, batch_size=batch_size,
+                                random_state=seed).fit(values)
+        centers = model.cluster_centers_
+        chain.append((k, seed, model.inertia_, centers))
+    return chain
+
+def elbow(ks, distortions):
+    """
+    Knee of a decreasing convex curve (Kneedle): the k farthest below the line
+    joining the first and last normalized points, or None if there is none.
+    """
+    ks, distortions = np.asarray(ks, dtype=np.float64), np.asarray(distortions, dtype=np.float64)
+    if len(ks) < 3 or np.ptp(distortions) == 0:
+        return None
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    y = (distortions - distortions.min()) / np.ptp(distortions)
+    difference = 1 - x - y
+    best = int(np.argmax(difference))
+    return int(ks[best]) if difference[best] > 0 else None
+
+def _labels(values, centers):
+    return pairwise_distances_argmin_min(values, centers)[0]
+
+def select_k(values, k_range=K_RANGE, n_seeds=N_SEEDS, seed=DEFAULT_SEED, batch_size=BATCH_SIZE,
+             silhouette_sample=SILHOUETTE_SAMPLE, processes=None):
+    """
+    Scores of k = k_range[0]..k_range[1] - 1 clusters (range as yellowbrick's k).
+
+    Parameters:
+    - values: 2-D array of standardized values.
+    - n_seeds: Warm-started chains, one per worker process.
+    - silhouette_sample: Systems sampled for the silhouette score.
+    - processes: Worker processes (default: CPUs).
+
+    Returns:
+    - KSelection(scores, centers, elbow); scores has 'distortion', 'silhouette',
+      'davies_bouldin' and the 'seed' of the best chain of each k.
+    """
+    ks = list(range(*k_range))
+    tasks = [(values, ks, chain_seed, batch_size) for chain_seed in _seeds(seed, n_seeds)]
+    n_workers = min(processes or os.cpu_count() or 1, len(tasks))
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            chains = list(executor.map(_warm_started_chain, tasks))
+    else:
+        chains = [_warm_started_chain(task) for task in tasks]
+
+    rows, centers = [], {}
+    for k in ks:
+        _, best_seed, inertia, best_centers = min((run for chain in chains for run in chain if run[0] == k),
+                                                  key=lambda run: run[2])
+        labels = _labels(values, best_centers)
+        n_labels = len(np.unique(labels))
+        silhouette = silhouette_score(values, labels, sample_size=min(silhouette_sample, len(values)),
+                                      random_state=seed) if 1 < n_labels < len(values) else np.nan
+        davies_bouldin = davies_bouldin_score(values, labels) if n_labels > 1 else np.nan
+        rows.append({'k': k, 'distortion': inertia, 'silhouette': silhouette,
+                     'davies_bouldin': davies_bouldin, 'seed': best_seed})
+        centers[k] = best_centers
+
+    scores = pd.DataFrame(rows).set_index('k')
+    return KSelection(scores, centers, elbow(scores.index, scores['distortion']))
+
+def fit_clusters(data, k=None, selection=None, **kwargs):
+    """
+    Clusters the rows of data (e.g., PC1..PCn) into k clusters (the elbow of
+    select_k if k is None), refined by KMeans from the best mini-batch centers.
+
+    Returns:
+    - Tuple (ClusterModel, KSelection).
+    """
+    values, mean, scale = standardize(data)
+    if selection is None:
+        selection = select_k(values, **kwargs)
+    if k is None:
+        k = selection.elbow if selection.elbow is not None else int(selection.scores['silhouette'].idxmax())
+    init = selection.centers[k] if k in selection.centers else 'k-means++'
+    kmeans = KMeans(n_clusters=k, init=init, n_init=1 if k in selection.centers else 10,
+                    random_state=DEFAULT_SEED).fit(values)
+    return ClusterModel(list(data.columns), mean, scale, kmeans.cluster_centers_), selection
+
+def predict_clusters(model, data):
+    """
+    Cluster (0..k-1) of each row of data: the nearest center of the model.
+    """
+    values = (data[model.columns].to_numpy(dtype=np.float64) - model.mean) / model.scale
+    return _labels(values, model.centers)
+
+def cluster_centroids(model):
+    """
+    Centers of the clusters in the units of the data, one row per cluster.
+    """
+    return pd.DataFrame(model.centers * model.scale + model.mean, columns=model.columns)
+
+def save_cluster_model(model, path):
+    np.savez(path, columns=np.asarray(model.columns, dtype=str), mean=model.mean, scale=model.scale,
+             centers=model.centers)
+    print(f"Wrote {path}")
+
+def load_cluster_model(path):
+    with np.load(path) as saved:
+        return ClusterModel(list(saved['columns']), saved['mean'], saved['scale'], saved['centers'])
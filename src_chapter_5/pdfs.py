@@ -14,14 +14,16 @@ import os
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
 from joypy import joyplot
-from tqdm import tqdm
+from energetics_store import read_life_cycles
+from streaming_stats import frame_chunks, stream_statistics, summarize
+from binned_kde import cached_kde_1d, plot_density
 from scipy.stats import gaussian_kde
 
 PATH = '/Users/danilocoutodesouza/Documents/Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
 base_path = f'{PATH}/csv_database_energy_by_periods'
 output_directory = f'../figures_chapter_5/pdfs/'
+kde_cache_directory = f'{base_path}_kde_cache'
 
 COLOR_PHASES = {
     'Total': '#070A2B',
@@ -40,24 +42,6 @@ TICK_FONT_SIZE = 12
 TITLE_FONT_SIZE = 16
 LEGEND_FONT_SIZE = 12
 
-def read_life_cycles(base_path):
-    """
-    Reads all CSV files in the specified directory and collects DataFrame for each system.
-    """
-    systems_energetics = {}
-
-    for filename in tqdm(os.listdir(base_path), desc="Reading CSV files"):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(base_path, filename)
-            system_id = filename.split('_')[0]
-            try:
-                df = pd.read_csv(file_path)
-                systems_energetics[system_id] = df
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-
-    return systems_energetics
-
 def compute_group_caps(systems_energetics, terms_prefix, special_case=None):
     """
     Computes caps for a group of terms based on the 0.2 and 0.8 quantiles across all systems.
@@ -70,20 +54,16 @@ def compute_group_caps(systems_energetics, terms_prefix, special_case=None):
     Returns:
     - A tuple (min_cap, max_cap) representing the computed value caps for the group.
     """
-    all_values = []
-
-    for df in systems_energetics.values():
-        relevant_cols = [col for col in df.columns if col.startswith(tuple(terms_prefix))]
-        all_values.extend(df[relevant_cols].values.flatten())
-
-    all_values = pd.Series(all_values).dropna()
+    # Values of all terms of the group pooled in a single streaming sketch
+    first = next(iter(systems_energetics.values()))
+    relevant_cols = [col for col in first.columns if col.startswith(tuple(terms_prefix))]
+    stats = stream_statistics(frame_chunks(systems_energetics.values()), {col: 'group' for col in relevant_cols})
+    q2, q8 = summarize(stats, quantiles=(0.2, 0.8)).loc['group', ['q0.2', 'q0.8']]
 
     if special_case == 'Energy Terms':
         min_cap = 0  # Special case for Energy Terms
-        max_cap = all_values.quantile(0.8)
+        max_cap = q8
     else:
-        q2 = all_values.quantile(0.2)
-        q8 = all_values.quantile(0.8)
         highest_cap = np.amax(np.abs([q2, q8]))
         min_cap, max_cap = -highest_cap, highest_cap
 
@@ -124,10 +104,15 @@ def plot_ridge_group(systems_energetics, group_name, terms_prefix, output_direct
     n_cols = 2
     n_rows = (n_terms + 1) // n_cols
 
+    # Density curves of each term (cached, so restyling the figure does not recompute them)
+    densities = {term: cached_kde_1d(kde_cache_directory, (term, 'all', 'all'),
+                                     all_data_melted.loc[all_data_melted['Term'] == term, 'Value'].values)
+                 for term in terms}
+
     fig, axes = plt.subplots(n_rows, n_cols, figsize=(14, 4 * n_rows), sharex=False)
 
     for idx, (ax, term) in enumerate(zip(axes.flatten(), terms)):
-        sns.kdeplot(data=all_data_melted[all_data_melted['Term'] == term], x='Value', ax=ax, fill=True)
+        plot_density(ax, *densities[term], fill=True)
         ax.set_title(term.replace('(finite diff.)', ''), fontsize=TITLE_FONT_SIZE)
         ax.tick_params(axis='both', which='major', labelsize=TICK_FONT_SIZE)
         ax.set_ylabel('Density', fontsize=LABEL_FONT_SIZE)
@@ -161,18 +146,23 @@ def plot_ridge_group_phases(systems_energetics, group_name, terms_prefix, output
     n_cols = 2
     n_rows = (n_terms + 1) // n_cols
 
-    fig, axes = plt.subplots(n_rows, n_cols, figsize=(14, 4 * n_rows), sharex=True)
-
-    for idx, (ax, term) in enumerate(zip(axes.flatten(), terms)):
-        for phase, color in COLOR_PHASES.items():
+    # Density curves of each term and phase
+    densities = {}
+    for term in terms:
+        for phase in COLOR_PHASES:
             if phase in ['residual', 'Total']:
                 continue  # Skip "residual" and handle "Total" separately
+            phase_values = all_data.loc[all_data['Phase'] == phase, term].clip(lower=value_cap[0], upper=value_cap[1])
+            if not phase_values.empty:
+                densities[term, phase] = cached_kde_1d(kde_cache_directory, (term, phase, 'all'),
+                                                       phase_values.values, bw_adjust=0.5)
 
-            phase_data = all_data.loc[all_data['Phase'] == phase].copy()
-            phase_data.loc[:, term] = phase_data[term].clip(lower=value_cap[0], upper=value_cap[1])
+    fig, axes = plt.subplots(n_rows, n_cols, figsize=(14, 4 * n_rows), sharex=True)
 
-            if not phase_data.empty:
-                sns.kdeplot(data=phase_data, x=term, ax=ax, fill=True, alpha=0.5, color=color, label=phase, bw_adjust=0.5)
+    for idx, (ax, term) in enumerate(zip(axes.flatten(), terms)):
+        for phase, color in COLOR_PHASES.items():
+            if (term, phase) in densities:
+                plot_density(ax, *densities[term, phase], fill=True, alpha=0.5, color=color, label=phase)
 
         ax.tick_params(axis='both', which='major', labelsize=TICK_FONT_SIZE)
         ax.set_ylabel('Density', fontsize=LABEL_FONT_SIZE)
@@ -0,0 +1,268 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    phase_tests.py                                     :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/25 09:02:17 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/25 09:02:17 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Batched statistical tests of the differences between phases, for all terms.
+
+The long-format energetics are sorted once by phase into a ragged layout: one
+contiguous buffer with the valid (non-NaN) values of every term, grouped by
+term and then by phase, and the offsets of each (term, phase) segment. The
+moment-based (one-way ANOVA, Levene) and rank-based (Kruskal-Wallis, Dunn)
+statistics of all terms are then computed at once from segment sums, with the
+same definitions as scipy.stats and scikit_posthocs:
+
+- Levene uses the median of each group (scipy's default center);
+- Kruskal-Wallis and Dunn use average ranks with the usual tie corrections;
+- Dunn p-values are Bonferroni adjusted.
+
+Shapiro-Wilk has no closed form, so it runs on the contiguous slices, and the
+Tukey HSD post-hoc tests run in a process pool.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import chi2, f, norm, shapiro
+from statsmodels.stats.multicomp import pairwise_tukeyhsd
+
+PhaseLayout = namedtuple('PhaseLayout', ['terms', 'groups', 'values', 'offsets'])
+
+def build_phase_layout(data, terms, groups, group_column='phase'):
+    """
+    Ragged layout of the values of terms, grouped by group_column.
+
+    Parameters:
+    - data: Long-format DataFrame with group_column and the terms.
+    - terms: Terms to include.
+    - groups: Groups in the order of the tests (rows of other groups are dropped).
+
+    Returns:
+    - PhaseLayout(terms, groups, values, offsets): values of (term, group) segment
+      s = term_index * len(groups) + group_index are values[offsets[s]:offsets[s + 1]].
+    """
+    terms, groups = list(terms), list(groups)
+    codes = pd.Categorical(data[group_column].astype(object), categories=groups).codes
+    keep = np.flatnonzero(codes >= 0)
+    order = keep[np.argsort(codes[keep], kind='stable')]
+
+    codes = codes[order].astype(np.int64)
+    values = data[terms].to_numpy(dtype=np.float64)[order]
+    valid = ~np.isnan(values)
+
+    # Term-major buffer: the values of each term, already sorted by group
+    buffer = values.T[valid.T]
+    segments = (np.arange(len(terms))[:, None] * len(groups) + codes[None, :])[valid.T]
+    counts = np.bincount(segments, minlength=len(terms) * len(groups))
+    offsets = np.r_[0, np.cumsum(counts)]
+    return PhaseLayout(terms, groups, buffer, offsets)
+
+def _segment_ids(layout):
+    return np.repeat(np.arange(len(layout.offsets) - 1), np.diff(layout.offsets))
+
+def _shape(layout):
+    return len(layout.terms), len(layout.groups)
+
+def _one_way_anova(values, segments, n_terms, n_groups):
+    # F statistic and p-value of each term from the segment sums
+    counts = np.bincount(segments, minlength=n_terms * n_groups).astype(np.float64)
+    sums = np.bincount(segments, weights=values, minlength=n_terms * n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+        within = np.bincount(segments, weights=(values - means[segments]) ** 2,
+                             minlength=n_terms * n_groups).reshape(n_terms, n_groups).sum(axis=1)
+        counts, sums, means = (a.reshape(n_terms, n_groups) for a in (counts, sums, means))
+        n = counts.sum(axis=1)
+        grand_mean = sums.sum(axis=1) / n
+        between = np.nansum(counts * (means - grand_mean[:, None]) ** 2, axis=1)
+        k = (counts > 0).sum(axis=1)
+        statistic = (between / (k - 1)) / (within / (n - k))
+    return statistic, f.sf(statistic, k - 1, n - k)
+
+def anova_test(layout):
+    """
+    One-way ANOVA (scipy.stats.f_oneway) of each term. Returns arrays (F, p).
+    """
+    return _one_way_anova(layout.values, _segment_ids(layout), *_shape(layout))
+
+def segment_medians(layout):
+    segments = _segment_ids(layout)
+    ordered = layout.values[np.lexsort((layout.values, segments))]
+    starts, counts = layout.offsets[:-1], np.diff(layout.offsets)
+    lower = np.clip(starts + (counts - 1) // 2, 0, max(len(ordered) - 1, 0))
+    upper = np.clip(starts + counts // 2, 0, max(len(ordered) - 1, 0))
+    medians = np.full(len(counts), np.nan)
+    present = counts > 0
+    medians[present] = (ordered[lower[present]] + ordered[upper[present]]) / 2
+    return medians
+
+def levene_test(layout):
+    """
+    Levene test with the median as center (scipy.stats.levene) of each term.
+    Returns arrays (W, p).
+    """
+    segments = _segment_ids(layout)
+    deviations = np.abs(layout.values - segment_medians(layout)[segments])
+    return _one_way_anova(deviations, segments, *_shape(layout))
+
+def _ranks(layout):
+    # Average ranks of the values within each term, and the tie sums of each term
+    n_terms, n_groups = _shape(layout)
+    term_ids = _segment_ids(layout) // n_groups
+    order = np.lexsort((layout.values, term_ids))
+    ordered, ordered_terms = layout.values[order], term_ids[order]
+
+    new_block = np.r_[True, (ordered[1:] != ordered[:-1]) | (ordered_terms[1:] != ordered_terms[:-1])]
+    block_starts = np.flatnonzero(new_block)
+    block_sizes = np.diff(np.r_[block_starts, len(ordered)])
+    block_terms = ordered_terms[block_starts]
+    term_starts = layout.offsets[np.arange(n_terms) * n_groups]
+
+    block_ranks = block_starts + (block_sizes + 1) / 2 - term_starts[block_terms]
+    ranks = np.empty(len(ordered))
+    ranks[order] = np.repeat(block_ranks, block_sizes)
+    ties = np.bincount(block_terms, weights=block_sizes.astype(np.float64) ** 3 - block_sizes,
+                       minlength=n_terms)
+    return ranks, ties
+
+def _rank_sums(layout):
+    n_terms, n_groups = _shape(layout)
+    ranks, ties = _ranks(layout)
+    counts = np.diff(layout.offsets).reshape(n_terms, n_groups).astype(np.float64)
+    sums = np.bincount(_segment_ids(layout), weights=ranks, minlength=n_terms * n_groups)
+    return sums.reshape(n_terms, n_groups), counts, ties
+
+def kruskal_test(layout):
+    """
+    Kruskal-Wallis H test (scipy.stats.kruskal) of each term. Returns arrays (H, p).
+    """
+    rank_sums, counts, ties = _rank_sums(layout)
+    n = counts.sum(axis=1)
+    k = (counts > 0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        statistic = 12 / (n * (n + 1)) * np.nansum(rank_sums ** 2 / counts, axis=1) - 3 * (n + 1)
+        statistic /= 1 - ties / (n ** 3 - n)
+    return statistic, chi2.sf(statistic, k - 1)
+
+def dunn_tests(layout, terms=None):
+    """
+    Dunn's post-hoc test with Bonferroni adjustment (scikit_posthocs.posthoc_dunn
+    of the groups as a list) of each term (or only of terms).
+
+    Returns:
+    - Dictionary {term: DataFrame of p-values}, labelled 1..n as posthoc_dunn
+      labels the groups of a list (empty groups are left out).
+    """
+    rank_sums, counts, ties = _rank_sums(layout)
+    results = {}
+    for t, term in enumerate(layout.terms):
+        if terms is not None and term not in terms:
+            continue
+        present = np.flatnonzero(counts[t] > 0)
+        n_i, mean_ranks = counts[t, present], rank_sums[t, present] / counts[t, present]
+        n = n_i.sum()
+        upper = np.triu_indices(len(present), 1)
+        variance = (n * (n + 1) / 12 - ties[t] / (12 * (n - 1))) * (1 / n_i[upper[0]] + 1 / n_i[upper[1]])
+        z = np.abs(mean_ranks[upper[0]] - mean_ranks[upper[1]]) / np.sqrt(variance)
+        p_values = np.zeros((len(present), len(present)))
+        p_values[upper] = np.minimum(2 * norm.sf(z) * len(upper[0]), 1)
+        p_values += p_values.T
+        np.fill_diagonal(p_values, 1)
+        labels = present + 1
+        results[term] = pd.DataFrame(p_values, index=labels, columns=labels)
+    return results
+
+def shapiro_tests(layout):
+    """
+    Shapiro-Wilk test of each (term, group). Returns {term: {group: (W, p)}}.
+    """
+    results = {}
+    for t, term in enumerate(layout.terms):
+        results[term] = {}
+        for g, group in enumerate(layout.groups):
+            segment = t * len(layout.groups) + g
+            values = layout.values[layout.offsets[segment]:layout.offsets[segment + 1]]
+            results[term][group] = tuple(shapiro(values)) if len(values) >= 3 else (np.nan, np.nan)
+    return results
+
+def _tukey(args):
+    values, groups = args
+    return pairwise_tukeyhsd(endog=values, groups=groups, alpha=0.05).summary()
+
+def tukey_tests(data, terms, group_column='phase', processes=None):
+    """
+    Tukey HSD tests between all groups of data, one term per task of a process pool.
+
+    Returns:
+    - Dictionary {term: summary table}.
+    """
+    if not terms:
+        return {}
+    tasks = []
+    for term in terms:
+        valid = data[[group_column, term]].dropna()
+        tasks.append((valid[term].to_numpy(), valid[group_column].astype(object).to_numpy()))
+    n_workers = min(processes or os.cpu_count() or 1, len(tasks))
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            summaries = list(executor.map(_tukey, tasks))
+    else:
+        summaries = [_tukey(task) for task in tasks]
+    return dict(zip(terms, summaries))
+
+def phase_tests(data, terms, groups, group_column='phase', alpha=0.05, processes=None):
+    """
+    Runs the tests of statistics_phases for all terms at once: normality of each
+    group, homogeneity of variances, then ANOVA (normal groups with homogeneous
+    variances) or Kruskal-Wallis and, if significant, Tukey HSD or Dunn.
+
+    Parameters:
+    - data: Long-format DataFrame with group_column and the terms.
+    - terms: Terms to test.
+    - groups: Groups compared (e.g., statistics_phases.PHASE_ORDER).
+    - alpha: Significance level.
+    - processes: Worker processes of the Tukey tests (default: CPUs).
+
+    Returns:
+    - List with one result dictionary per term, as statistics_phases writes them.
+    """
+    layout = build_phase_layout(data, terms, groups, group_column)
+    normality = shapiro_tests(layout)
+    homogeneity_stat, homogeneity_p = levene_test(layout)
+    anova_stat, anova_p = anova_test(layout)
+    kruskal_stat, kruskal_p = kruskal_test(layout)
+
+    results, tukey_terms, dunn_terms = [], [], []
+    for t, term in enumerate(layout.terms):
+        use_anova = (all(p > alpha for _, p in normality[term].values()) and homogeneity_p[t] > alpha)
+        statistic, p_value = (anova_stat[t], anova_p[t]) if use_anova else (kruskal_stat[t], kruskal_p[t])
+        results.append({
+            'Term': term,
+            'Kruskal-Wallis Statistic': statistic,
+            'Kruskal-Wallis p-value': p_value,
+            'Normality Results': normality[term],
+            'Homogeneity Statistic': homogeneity_stat[t],
+            'Homogeneity p-value': homogeneity_p[t],
+        })
+        if p_value < alpha:
+            (tukey_terms if use_anova else dunn_terms).append(term)
+
+    post_hoc = {term: {'tukey': summary} for term, summary in
+                tukey_tests(data, tukey_terms, group_column, processes).items()}
+    if dunn_terms:
+        post_hoc.update({term: {'dunn': table} for term, table in dunn_tests(layout, dunn_terms).items()})
+    for result in results:
+        if result['Term'] in post_hoc:
+            result['Post-hoc Results'] = post_hoc[result['Term']]
+    return results
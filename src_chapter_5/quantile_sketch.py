@@ -0,0 +1,114 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    quantile_sketch.py                                 :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/24 09:41:05 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/24 09:41:05 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Mergeable quantile sketches with relative accuracy (as in DDSketch).
+
+Each value x is counted in a logarithmic bucket of width gamma = (1 + a) / (1 - a)
+(a = RELATIVE_ACCURACY), so any quantile is recovered with a relative error
+below a. Values with |x| < MIN_VALUE share the zero bucket. Bucket keys are
+signed and ordered like the values they hold:
+
+    key = sign(x) * (ceil(log_gamma(|x|)) - MIN_INDEX + 1),  key = 0 for ~zero.
+
+A sketch is a table of (group, key, count) rows; sketches of many groups are
+built in one vectorized pass, merged by adding the counts of equal (group, key)
+and queried for all groups at once.
+"""
+
+import numpy as np
+import pandas as pd
+
+RELATIVE_ACCURACY = 0.01
+MIN_VALUE = 1e-9
+
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = np.log(GAMMA)
+MIN_INDEX = int(np.floor(np.log(MIN_VALUE) / LOG_GAMMA))
+
+def bucket_keys(values):
+    """
+    Signed bucket key of each value (NaN values must be dropped before).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(values)
+    nonzero = magnitude >= MIN_VALUE
+    index = np.ceil(np.log(np.where(nonzero, magnitude, 1.)) / LOG_GAMMA).astype(np.int64)
+    return np.where(nonzero, np.sign(values).astype(np.int64) * (index - MIN_INDEX + 1), 0)
+
+def bucket_values(keys):
+    """
+    Representative value of each bucket (relative error below RELATIVE_ACCURACY).
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    index = np.abs(keys) + MIN_INDEX - 1
+    return np.sign(keys) * 2 * np.power(GAMMA, index.astype(np.float64)) / (GAMMA + 1)
+
+def build_sketch(values, groups=None):
+    """
+    Sketches of the values, one per group code.
+
+    Parameters:
+    - values: 1-D array of values; NaN values are ignored.
+    - groups: Integer group code of each value (a single group 0 if None).
+
+    Returns:
+    - DataFrame with 'group', 'key' and 'count', sorted by group and key.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    groups = np.zeros(len(values), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    valid = ~np.isnan(values)
+    return _count(groups[valid], bucket_keys(values[valid]), None)
+
+def _count(groups, keys, counts):
+    table = pd.DataFrame({'group': groups, 'key': keys,
+                          'count': np.ones(len(groups), dtype=np.int64) if counts is None else counts})
+    table = table.groupby(['group', 'key'], sort=True, as_index=False)['count'].sum()
+    return table.astype({'group': np.int64, 'key': np.int64, 'count': np.int64})
+
+def merge_sketches(*sketches):
+    """
+    Merges sketches of the same groups (e.g., built on different chunks or
+    workers) by adding their bucket counts.
+    """
+    merged = pd.concat(sketches, ignore_index=True)
+    return _count(merged['group'].values, merged['key'].values, merged['count'].values)
+
+def sketch_quantiles(sketch, quantiles):
+    """
+    Quantiles of every group of a sketch.
+
+    Parameters:
+    - sketch: Table with 'group', 'key' and 'count' (other columns are ignored).
+    - quantiles: Sequence of quantiles in [0, 1].
+
+    Returns:
+    - DataFrame indexed by group with one column per quantile.
+    """
+    sketch = sketch.sort_values(['group', 'key'])
+    groups = sketch['group'].values
+    counts = sketch['count'].values
+    cumulative = np.cumsum(counts)
+
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    ends = np.r_[starts[1:], len(groups)]
+    before = np.r_[0, cumulative][starts]
+    totals = cumulative[ends - 1] - before
+
+    result = {}
+    for q in quantiles:
+        # Same rank as DDSketch: first bucket whose cumulative count exceeds q * (n - 1)
+        rank = before + q * (totals - 1)
+        position = np.searchsorted(cumulative, rank, side='right')
+        position = np.minimum(position, ends - 1)
+        result[q] = bucket_values(sketch['key'].values[position])
+    return pd.DataFrame(result, index=pd.Index(groups[starts], name='group'))
@@ -0,0 +1,287 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    resampling.py                                      :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/26 10:31:48 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/26 10:31:48 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Bootstrap confidence intervals and permutation p-values.
+
+Resamples are drawn as index matrices (one row of indices per resample) and the
+statistic of all columns (e.g., all LEC terms) is computed for a whole chunk of
+rows at once. Chunks are sized so that the resampled data fits in memory_budget
+bytes.
+
+The resamples are split into batches of BATCH_SIZE, each with its own random
+generator spawned from a single seed (numpy SeedSequence). Results therefore
+only depend on the seed, not on the number of worker processes running the
+batches. Permutation tests stop early once the confidence interval of every
+p-value is narrower than tolerance or excludes alpha.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import norm
+
+DEFAULT_SEED = 42
+BATCH_SIZE = 1000
+BATCHES_PER_CHECK = 8
+MEMORY_BUDGET = 256 * 2 ** 20
+
+# Data shared by the batches of a call, set once per worker process
+_worker_data = {}
+
+def _init_worker(data):
+    _worker_data.clear()
+    _worker_data.update(data)
+
+def _chunk_rows(bytes_per_resample, memory_budget):
+    return int(max(1, memory_budget // max(bytes_per_resample, 1)))
+
+def _as_matrix(data):
+    if isinstance(data, pd.DataFrame):
+        return data.to_numpy(dtype=np.float64), list(data.columns)
+    values = np.asarray(data, dtype=np.float64)
+    if values.ndim == 1:
+        return values[:, None], [0]
+    return values, list(range(values.shape[1]))
+
+def mean_statistic(samples):
+    return np.nanmean(samples, axis=1)
+
+def median_statistic(samples):
+    return np.nanmedian(samples, axis=1)
+
+def slope_statistic(samples):
+    # Least-squares slope of column 1 (y) on column 0 (x)
+    x, y = samples[..., 0], samples[..., 1]
+    x = x - x.mean(axis=1, keepdims=True)
+    y = y - y.mean(axis=1, keepdims=True)
+    return ((x * y).sum(axis=1) / (x ** 2).sum(axis=1))[:, None]
+
+STATISTICS = {'mean': mean_statistic, 'median': median_statistic, 'slope': slope_statistic}
+
+def _bootstrap_batch(args):
+    seed, size, memory_budget = args
+    values, statistic = _worker_data['values'], _worker_data['statistic']
+    n = len(values)
+    rng = np.random.default_rng(seed)
+    rows = _chunk_rows(n * 8 * (values.shape[1] + 1), memory_budget)
+    results = []
+    for start in range(0, size, rows):
+        indices = rng.integers(0, n, size=(min(rows, size - start), n))
+        results.append(statistic(values[indices]))
+    return np.concatenate(results)
+
+def _permutation_batch(args):
+    seed, size, memory_budget = args
+    data = _worker_data
+    n = len(data['values'])
+    rng = np.random.default_rng(seed)
+    rows = _chunk_rows(n * 8 * (data['values'].shape[1] + 3), memory_budget)
+    hits = np.zeros(len(data['observed']), dtype=np.int64)
+    for start in range(0, size, rows):
+        permutations = rng.permuted(np.tile(np.arange(n), (min(rows, size - start), 1)), axis=1)
+        permuted = _permuted_statistic(data, permutations)
+        hits += (permuted >= data['observed'] * (1 - 1e-12)).sum(axis=0)
+    return hits
+
+def _group_statistic(values, codes, counts):
+    # Sum over groups of n_g * mean_g ** 2: the between-groups sum of squares
+    # up to a constant that permutations do not change
+    codes = np.atleast_2d(codes)
+    statistic = 0
+    for g, count in enumerate(counts):
+        sums = (codes == g).astype(np.float64) @ values
+        statistic = statistic + sums ** 2 / count
+    return statistic
+
+def _permuted_statistic(data, permutations):
+    if data['kind'] == 'groups':
+        return _group_statistic(data['values'], data['codes'][permutations], data['counts'])
+    # Slope: y permuted against the centered x
+    return np.abs(data['values'][:, 0][permutations] @ data['x'])[:, None]
+
+def _seeds(seed, n_resamples):
+    n_batches = -(-n_resamples // BATCH_SIZE)
+    sizes = [min(BATCH_SIZE, n_resamples - b * BATCH_SIZE) for b in range(n_batches)]
+    return list(zip(np.random.SeedSequence(seed).spawn(n_batches), sizes))
+
+def _run_batches(batch, data, tasks, processes, memory_budget, done=None):
+    """
+    Runs the (seed, size) tasks of batch with the shared data, in rounds of
+    BATCHES_PER_CHECK batches, until all ran or done(results) is True.
+    """
+    n_workers = min(processes or os.cpu_count() or 1, len(tasks))
+    executor = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                   initargs=(data,)) if n_workers > 1 else None
+    if executor is None:
+        _init_worker(data)
+    results = []
+    try:
+        for start in range(0, len(tasks), BATCHES_PER_CHECK):
+            round_tasks = [(seed, size, memory_budget) for seed, size in tasks[start:start + BATCHES_PER_CHECK]]
+            results += list(executor.map(batch, round_tasks) if executor else map(batch, round_tasks))
+            if done is not None and done(results):
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        _worker_data.clear()
+    return results
+
+def bootstrap(data, statistic='mean', n_resamples=10000, confidence=0.95, seed=DEFAULT_SEED,
+              processes=None, memory_budget=MEMORY_BUDGET):
+    """
+    Percentile bootstrap confidence intervals of a statistic of each column.
+
+    Parameters:
+    - data: DataFrame (one column per variable, e.g., LEC term) or array.
+    - statistic: 'mean', 'median', 'slope' (columns x, y) or a function of the
+      resampled data of shape (resamples, n, columns) returning (resamples, outputs).
+    - n_resamples: Number of bootstrap resamples.
+    - confidence: Confidence level of the intervals.
+    - seed: Seed of the random generators.
+    - processes: Worker processes (default: CPUs).
+    - memory_budget: Bytes of resampled data held at once per process.
+
+    Returns:
+    - DataFrame with 'estimate', 'std_error', 'ci_low' and 'ci_high' per output.
+    """
+    values, columns = _as_matrix(data)
+    statistic = STATISTICS.get(statistic, statistic)
+    estimate = statistic(values[None])[0]
+    if statistic is slope_statistic:
+        columns = ['slope']
+
+    data = {'values': values, 'statistic': statistic}
+    distribution = np.concatenate(_run_batches(_bootstrap_batch, data, _seeds(seed, n_resamples),
+                                               processes, memory_budget))
+    tail = (1 - confidence) / 2 * 100
+    return pd.DataFrame({
+        'estimate': estimate,
+        'std_error': np.nanstd(distribution, axis=0, ddof=1),
+        'ci_low': np.nanpercentile(distribution, tail, axis=0),
+        'ci_high': np.nanpercentile(distribution, 100 - tail, axis=0),
+    }, index=pd.Index(columns))
+
+def _p_value_table(hits, n_done, observed, columns, confidence):
+    p_value = (hits + 1) / (n_done + 1)
+    half_width = norm.ppf(0.5 + confidence / 2) * np.sqrt(p_value * (1 - p_value) / n_done)
+    return pd.DataFrame({
+        'statistic': observed,
+        'p_value': p_value,
+        'p_ci_low': np.clip(p_value - half_width, 0, 1),
+        'p_ci_high': np.clip(p_value + half_width, 0, 1),
+        'n_resamples': n_done,
+    }, index=pd.Index(columns))
+
+def _permutation_test(data, columns, n_resamples, alpha, tolerance, confidence, seed, processes, memory_budget):
+    tasks = _seeds(seed, n_resamples)
+    z = norm.ppf(0.5 + confidence / 2)
+
+    def done(results):
+        n_done = sum(size for _, size in tasks[:len(results)])
+        p_value = (np.sum(results, axis=0) + 1) / (n_done + 1)
+        half_width = z * np.sqrt(p_value * (1 - p_value) / n_done)
+        settled = (half_width < tolerance) | (np.abs(p_value - alpha) > half_width)
+        return bool(np.all(settled))
+
+    results = _run_batches(_permutation_batch, data, tasks, processes, memory_budget,
+                           done if tolerance else None)
+    n_done = sum(size for _, size in tasks[:len(results)])
+    return _p_value_table(np.sum(results, axis=0), n_done, data['observed'], columns, confidence)
+
+def permutation_test(data, groups, n_resamples=10000, alpha=0.05, tolerance=0.005, confidence=0.95,
+                     seed=DEFAULT_SEED, processes=None, memory_budget=MEMORY_BUDGET):
+    """
+    Permutation test of the differences between the group means of each column
+    (the between-groups sum of squares, as one-way ANOVA, or the difference of
+    the means for two groups).
+
+    Parameters:
+    - data: DataFrame (one column per variable) or array.
+    - groups: Group label of each row.
+    - n_resamples: Maximum number of permutations.
+    - alpha: Significance level used for early stopping.
+    - tolerance: Stop when the confidence interval of every p-value is narrower
+      than tolerance or excludes alpha (None: always run n_resamples).
+    - confidence: Confidence level of the p-value intervals.
+    - seed, processes, memory_budget: As in bootstrap.
+
+    Returns:
+    - DataFrame with 'statistic', 'p_value', 'p_ci_low', 'p_ci_high' and
+      'n_resamples' per column.
+    """
+    values, columns = _as_matrix(data)
+    groups = np.asarray(groups)
+
+    # Columns with the same missing values are tested together on their valid rows
+    valid = ~np.isnan(values)
+    patterns = pd.Series([column.tobytes() for column in valid.T])
+    tables = []
+    for _, positions in patterns.groupby(patterns, sort=False).groups.items():
+        positions = list(positions)
+        rows = valid[:, positions[0]]
+        codes, labels = pd.factorize(groups[rows])
+        counts = np.bincount(codes).astype(np.float64)
+        block = values[rows][:, positions]
+        block = block - block.mean(axis=0)
+        data = {'kind': 'groups', 'values': block, 'codes': codes, 'counts': counts,
+                'observed': _group_statistic(block, codes, counts)[0]}
+        tables.append(_permutation_test(data, [columns[p] for p in positions], n_resamples, alpha,
+                                        tolerance, confidence, seed, processes, memory_budget))
+    return pd.concat(tables).loc[columns]
+
+def permutation_slope_test(x, y, n_resamples=10000, alpha=0.05, tolerance=0.005, confidence=0.95,
+                           seed=DEFAULT_SEED, processes=None, memory_budget=MEMORY_BUDGET):
+    """
+    Two-sided permutation test of the least-squares slope of y on x (e.g., a
+    trend), permuting y. Parameters and result as in permutation_test.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x = x[valid] - x[valid].mean()
+    y = y[valid] - y[valid].mean()
+    data = {'kind': 'slope', 'values': y[:, None], 'x': x, 'observed': np.abs([y @ x])}
+    table = _permutation_test(data, ['slope'], n_resamples, alpha, tolerance, confidence,
+                              seed, processes, memory_budget)
+    table['statistic'] = (y @ x) / (x @ x)
+    return table
+
+def bootstrap_slope(x, y, **kwargs):
+    """
+    Bootstrap confidence interval of the least-squares slope of y on x, resampling
+    the (x, y) pairs. Keyword arguments as in bootstrap.
+    """
+    pairs = np.column_stack([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)])
+    pairs = pairs[~np.isnan(pairs).any(axis=1)]
+    return bootstrap(pairs, statistic='slope', **kwargs)
+
+def group_bootstrap(data, groups, order=None, **kwargs):
+    """
+    Bootstrap confidence intervals of the mean of each column within each group
+    (e.g., the phase means of all LEC terms). Keyword arguments as in bootstrap.
+
+    Returns:
+    - DataFrame indexed by (group, column).
+    """
+    groups = pd.Series(np.asarray(groups))
+    order = pd.unique(groups) if order is None else order
+    tables = {}
+    for group in order:
+        rows = (groups == group).values
+        if rows.any():
+            tables[group] = bootstrap(data[rows] if isinstance(data, pd.DataFrame) else np.asarray(data)[rows],
+                                      **kwargs)
+    return pd.concat(tables, names=['group', 'term'])
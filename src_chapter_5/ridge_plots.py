@@ -14,13 +14,16 @@ import os
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
-from tqdm import tqdm
+from energetics_store import read_life_cycles
+from streaming_stats import frame_chunks, stream_statistics, summarize
+from binned_kde import cached_kde_1d, plot_density
 import numpy as np
 from matplotlib.ticker import AutoMinorLocator, MaxNLocator
 
 PATH = '/Users/danilocoutodesouza/Documents/Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
 base_path = f'{PATH}/csv_database_energy_by_periods'
 output_directory = f'../figures_chapter_5/ridge_plots/'
+kde_cache_directory = f'{base_path}_kde_cache'
 
 COLOR_PHASES = {
     'incipient': '#87b3e3',
@@ -48,31 +51,15 @@ TICK_FONT_SIZE = 12
 TITLE_FONT_SIZE = 16
 LEGEND_FONT_SIZE = 12
 
-def read_life_cycles(base_path):
-    systems_energetics = {}
-    for filename in tqdm(os.listdir(base_path), desc="Reading CSV files"):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(base_path, filename)
-            system_id = filename.split('_')[0]
-            try:
-                df = pd.read_csv(file_path)
-                systems_energetics[system_id] = df
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-    return systems_energetics
-
 def compute_group_caps(systems_energetics, terms_prefix, special_case=None):
-    all_values = []
-    for df in systems_energetics.values():
-        relevant_cols = [col for col in df.columns if col.startswith(tuple(terms_prefix))]
-        all_values.extend(df[relevant_cols].values.flatten())
-    all_values = pd.Series(all_values).dropna()
+    first = next(iter(systems_energetics.values()))
+    relevant_cols = [col for col in first.columns if col.startswith(tuple(terms_prefix))]
+    stats = stream_statistics(frame_chunks(systems_energetics.values()), {col: 'group' for col in relevant_cols})
+    q2, q8 = summarize(stats, quantiles=(0.2, 0.8)).loc['group', ['q0.2', 'q0.8']]
     if special_case == 'Energy Terms':
         min_cap = 0
-        max_cap = all_values.quantile(0.8)
+        max_cap = q8
     else:
-        q2 = all_values.quantile(0.2)
-        q8 = all_values.quantile(0.8)
         highest_cap = np.amax(np.abs([q2, q8]))
         min_cap, max_cap = -highest_cap, highest_cap
     return min_cap, max_cap
@@ -93,9 +80,13 @@ def plot_ridge_group_facet(systems_energetics, group_name, terms_prefix, output_
         sns.set_theme(style="white", rc={"axes.facecolor": (0, 0, 0, 0), 'axes.linewidth': 2})
         palette = [COLOR_PHASES[phase] for phase in all_data['Phase'].unique()]
         order = ['incipient', 'intensification', 'mature', 'decay', 'intensification 2', 'mature 2', 'decay 2']
+        densities = {phase: cached_kde_1d(kde_cache_directory, (term, phase, 'all'), values['Value'].values)
+                     for phase, values in phase_data_melted.groupby('Phase')}
+        def phase_density(data, color, label, fill=False, **kwargs):
+            plot_density(plt.gca(), *densities[label], fill=fill, color=color, **kwargs)
         g = sns.FacetGrid(phase_data_melted, row="Phase", hue="Phase", aspect=9, height=1.2, palette=palette, row_order=order)
-        g.map_dataframe(sns.kdeplot, x="Value", fill=True, alpha=1)
-        g.map_dataframe(sns.kdeplot, x="Value", color='black')
+        g.map_dataframe(phase_density, fill=True, alpha=1)
+        g.map_dataframe(phase_density, color='black')
         def label(x, color, label):
             ax = plt.gca()
             ax.text(0, .2, PHASE_MAPPING[label], color='black', fontsize=24, ha="left", va="center", transform=ax.transAxes)
@@ -12,11 +12,9 @@
 
 import os
 import pandas as pd
-import numpy as np
-from scipy.stats import f_oneway, kruskal, shapiro, levene
-from statsmodels.stats.multicomp import pairwise_tukeyhsd
-import scikit_posthocs as sp
-from tqdm import tqdm
+from energetics_store import load_energetics, term_columns
+from phase_tests import phase_tests
+from resampling import group_bootstrap, permutation_test
 
 PATH = '/Users/danilocoutodesouza/Documents/Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
 base_path = f'{PATH}/csv_database_energy_by_periods'
@@ -24,6 +22,13 @@ output_directory = f'../results_chapter_5/statistics_phases/'
 
 PHASE_ORDER = ['Total', 'incipient', 'intensification', 'mature', 'decay', 'intensification 2', 'mature 2', 'decay 2']
 
+# Dimensions of the systems table (energetics_cube.systems_table) analyzed separately
+SUBSET_DIMENSIONS = ['region', 'season']
+
+# Bootstrap confidence intervals of the phase means and permutation p-values
+RESAMPLING = True
+N_RESAMPLES = 10000
+
 groups = {
     'Energy Terms': ['A', 'K'],
     'Conversion Terms': ['C'],
@@ -32,88 +37,15 @@ groups = {
     'Budgets': ['∂']
 }
 
-def read_life_cycles(base_path):
-    """
-    Reads all CSV files in the specified directory and collects DataFrame for each system.
-    """
-    systems_energetics = {}
-
-    for filename in tqdm(os.listdir(base_path), desc="Reading CSV files"):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(base_path, filename)
-            system_id = filename.split('_')[0]
-            try:
-                df = pd.read_csv(file_path)
-                df = df.rename(columns={'Unnamed: 0': 'phase'})
-                df.index = range(1, len(df) + 1)
-                systems_energetics[system_id] = df
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-
-    return systems_energetics
-
-def compute_total_phase(systems_energetics):
+def compute_total_phase(energetics):
     """
     Computes the mean values across all phases for each system to represent the "Total" phase.
     """
-    for system_id, df in systems_energetics.items():
-        mean_values = df.mean(numeric_only=True)
-        mean_values['phase'] = 'Total'
-        systems_energetics[system_id] = pd.concat([df, pd.DataFrame([mean_values])], ignore_index=True)
-    return systems_energetics
-
-def check_normality(data, term):
-    """
-    Checks for normality using the Shapiro-Wilk test.
-    """
-    normality_results = {}
-    for phase in PHASE_ORDER:
-        stat, p_value = shapiro(data[data['phase'] == phase][term].dropna())
-        normality_results[phase] = (stat, p_value)
-    return normality_results
-
-def check_homogeneity_of_variances(data, term):
-    """
-    Checks for homogeneity of variances using Levene's test.
-    """
-    phase_data = [data[data['phase'] == phase][term].dropna() for phase in PHASE_ORDER]
-    stat, p_value = levene(*phase_data)
-    return stat, p_value
-
-def perform_anova_test(data, term):
-    """
-    Performs ANOVA test for the given term across all phases.
-    """
-    phase_data = [data[data['phase'] == phase][term].dropna() for phase in PHASE_ORDER]
-    f_statistic, p_value = f_oneway(*phase_data)
-    return f_statistic, p_value
-
-def perform_kruskal_test(data, term):
-    """
-    Performs Kruskal-Wallis H test for the given term across all phases.
-    """
-    phase_data = [data[data['phase'] == phase][term].dropna() for phase in PHASE_ORDER]
-    h_statistic, p_value = kruskal(*phase_data)
-    return h_statistic, p_value
-
-def perform_post_hoc_tests(data, term, test_type):
-    """
-    Performs post-hoc tests if ANOVA/Kruskal-Wallis test is significant.
-    """
-    post_hoc_results = {}
-    all_data = data[['phase', term]].dropna()
-    
-    if test_type == 'ANOVA':
-        # Tukey HSD for ANOVA
-        tukey = pairwise_tukeyhsd(endog=all_data[term], groups=all_data['phase'], alpha=0.05)
-        post_hoc_results['tukey'] = tukey.summary()
-    else:
-        # Dunn's Test for Kruskal-Wallis
-        phase_data = [data[data['phase'] == phase][term].dropna() for phase in PHASE_ORDER]
-        dunn = sp.posthoc_dunn(phase_data, p_adjust='bonferroni')
-        post_hoc_results['dunn'] = dunn
-
-    return post_hoc_results
+    terms = term_columns(energetics)
+    total = energetics.groupby('system_id', sort=False)[terms].mean().reset_index()
+    total['phase'] = 'Total'
+    energetics = energetics.assign(phase=energetics['phase'].astype(object))
+    return pd.concat([energetics, total], ignore_index=True)
 
 def generate_latex_table(results):
     """
@@ -156,131 +88,105 @@ def generate_latex_table(results):
     
     return latex_table
 
-def analyze_statistics(systems_energetics, terms, output_directory):
+def write_results(results, output_directory):
     """
-    Analyzes the statistics for the specified terms and saves the results to CSV files.
+    Saves the results to CSV and the LaTeX table.
     """
-    all_data = pd.concat(systems_energetics.values(), ignore_index=True)
-    results = []
-
-    for term in terms:
-        print(f"Analyzing {term}...")
-
-        # Check assumptions
-        normality_results = check_normality(all_data, term)
-        homogeneity_stat, homogeneity_p_value = check_homogeneity_of_variances(all_data, term)
-
-        # Determine test to use based on assumptions
-        if all(p_value > 0.05 for _, p_value in normality_results.values()) and homogeneity_p_value > 0.05:
-            test_type = 'ANOVA'
-            f_statistic, p_value = perform_anova_test(all_data, term)
-        else:
-            test_type = 'Kruskal-Wallis'
-            f_statistic, p_value = perform_kruskal_test(all_data, term)
-
-        result = {
-            'Term': term,
-            'Kruskal-Wallis Statistic': f_statistic,
-            'Kruskal-Wallis p-value': p_value,
-            'Normality Results': normality_results,
-            'Homogeneity Statistic': homogeneity_stat,
-            'Homogeneity p-value': homogeneity_p_value
-        }
-
-        if p_value < 0.05:
-            post_hoc_results = perform_post_hoc_tests(all_data, term, test_type)
-            result['Post-hoc Results'] = post_hoc_results
-
-        results.append(result)
-
-    # Convert results to DataFrame
     results_df = pd.DataFrame(results)
     os.makedirs(output_directory, exist_ok=True)
     results_df.to_csv(os.path.join(output_directory, 'statistical_analysis_results.csv'), index=False)
 
-    # Generate LaTeX table
     latex_table = generate_latex_table(results)
     with open(os.path.join(output_directory, 'statistical_analysis_results.tex'), 'w') as f:
         f.write(latex_table)
 
     print(f"Saved statistical analysis results in {output_directory}")
 
-def analyze_all_groups(systems_energetics, groups, output_directory):
+def analyze_statistics(energetics, terms, output_directory):
     """
-    Analyzes the statistics for all groups and their respective terms.
+    Analyzes the statistics for the specified terms and saves the results to CSV files.
     """
-    all_data = pd.concat(systems_energetics.values(), ignore_index=True)
+    print(f"Analyzing {len(terms)} terms...")
+    results = phase_tests(energetics, terms, PHASE_ORDER)
+    write_results(results, output_directory)
+    return results
 
+def analyze_all_groups(energetics, groups, output_directory):
+    """
+    Analyzes the statistics for all groups and their respective terms.
+    """
     # Preprocess budget terms to remove "(finite diff.)"
-    all_data.columns = [col.replace(" (finite diff.)", "") for col in all_data.columns]
+    energetics = energetics.rename(columns=lambda col: col.replace(" (finite diff.)", ""))
 
-    results = []
+    group_terms = {}
+    for group_name, terms_prefix in groups.items():
+        for term in term_columns(energetics):
+            if any(term.startswith(prefix) for prefix in terms_prefix):
+                group_terms.setdefault(term, group_name)
 
+    # All terms are tested at once, then listed by group as before
+    tested = {result['Term']: result for result in phase_tests(energetics, list(group_terms), PHASE_ORDER)}
+
+    results = []
     for group_name, terms_prefix in groups.items():
         print(f"Analyzing group: {group_name}...")
-        
-        terms = [col for col in all_data.columns if any(col.startswith(prefix) for prefix in terms_prefix)]
-        
+        terms = [col for col in term_columns(energetics) if any(col.startswith(prefix) for prefix in terms_prefix)]
         for term in terms:
-            print(f"  Analyzing {term}...")
-
-            # Check assumptions
-            normality_results = check_normality(all_data, term)
-            homogeneity_stat, homogeneity_p_value = check_homogeneity_of_variances(all_data, term)
-
-            # Determine test to use based on assumptions
-            if all(p_value > 0.05 for _, p_value in normality_results.values()) and homogeneity_p_value > 0.05:
-                test_type = 'ANOVA'
-                f_statistic, p_value = perform_anova_test(all_data, term)
-            else:
-                test_type = 'Kruskal-Wallis'
-                f_statistic, p_value = perform_kruskal_test(all_data, term)
+            result = {key: value for key, value in tested[term].items() if key != 'Term'}
+            results.append({'Term': term, 'Group': group_name, **result})
 
-            result = {
-                'Term': term,
-                'Group': group_name,
-                'Kruskal-Wallis Statistic': f_statistic,
-                'Kruskal-Wallis p-value': p_value,
-                'Normality Results': normality_results,
-                'Homogeneity Statistic': homogeneity_stat,
-                'Homogeneity p-value': homogeneity_p_value
-            }
+    write_results(results, output_directory)
+    return results
 
-            if p_value < 0.05:
-                post_hoc_results = perform_post_hoc_tests(all_data, term, test_type)
-                result['Post-hoc Results'] = post_hoc_results
-
-            results.append(result)
-
-    # Convert results to DataFrame
-    results_df = pd.DataFrame(results)
-    os.makedirs(output_directory, exist_ok=True)
-    results_df.to_csv(os.path.join(output_directory, 'statistical_analysis_results.csv'), index=False)
+def resampling_statistics(energetics, output_directory, n_resamples=N_RESAMPLES):
+    """
+    Bootstrap confidence intervals of the mean of each term in each phase and
+    permutation p-values of the differences between phases, saved to CSV files.
+    """
+    energetics = energetics.rename(columns=lambda col: col.replace(" (finite diff.)", ""))
+    energetics = energetics[energetics['phase'].isin(PHASE_ORDER)]
+    terms = term_columns(energetics)
 
-    # Generate LaTeX table
-    latex_table = generate_latex_table(results)
-    with open(os.path.join(output_directory, 'statistical_analysis_results.tex'), 'w') as f:
-        f.write(latex_table)
+    print(f"Bootstrapping phase means ({n_resamples} resamples)...")
+    means = group_bootstrap(energetics[terms], energetics['phase'].values, order=PHASE_ORDER,
+                            n_resamples=n_resamples)
+    means.index.names = ['Phase', 'Term']
 
-    print(f"Saved statistical analysis results in {output_directory}")
+    # 'Total' repeats the values of the other phases, so it is left out of the test
+    print(f"Permutation tests between phases ({n_resamples} permutations at most)...")
+    phases = energetics[energetics['phase'] != 'Total']
+    tests = permutation_test(phases[terms], phases['phase'].values, n_resamples=n_resamples)
+    tests.index.name = 'Term'
 
-    # Convert results to DataFrame
-    results_df = pd.DataFrame(results)
     os.makedirs(output_directory, exist_ok=True)
-    results_df.to_csv(os.path.join(output_directory, 'statistical_analysis_results.csv'), index=False)
-
-    # Generate LaTeX table
-    latex_table = generate_latex_table(results)
-    with open(os.path.join(output_directory, 'statistical_analysis_results.tex'), 'w') as f:
-        f.write(latex_table)
+    means.to_csv(os.path.join(output_directory, 'resampling_phase_means.csv'))
+    tests.to_csv(os.path.join(output_directory, 'resampling_phase_tests.csv'))
+    print(f"Saved resampling results in {output_directory}")
+    return means, tests
 
-    print(f"Saved statistical analysis results in {output_directory}")
+def analyze_subsets(energetics, systems, dimension, groups, output_directory):
+    """
+    Runs analyze_all_groups for the systems of each value of a dimension of the
+    systems table (e.g., each genesis region), in <output_directory>/<dimension>_<value>.
+    """
+    labels = energetics['system_id'].map(systems[dimension])
+    for value in pd.unique(labels.dropna()):
+        print(f"Analyzing {dimension} {value}...")
+        subset_directory = os.path.join(output_directory, f'{dimension}_{value}')
+        analyze_all_groups(energetics[(labels == value).values], groups, subset_directory)
 
 if __name__ == "__main__":
     os.makedirs(output_directory, exist_ok=True)
 
-    systems_energetics = read_life_cycles(base_path)
-    systems_energetics = compute_total_phase(systems_energetics)
+    energetics = load_energetics(base_path)
+    energetics = compute_total_phase(energetics)
 
-    analyze_all_groups(systems_energetics, groups, output_directory)
+    analyze_all_groups(energetics, groups, output_directory)
+    if RESAMPLING:
+        resampling_statistics(energetics, output_directory)
 
+    if SUBSET_DIMENSIONS:
+        from energetics_cube import systems_table
+        systems = systems_table(energetics)
+        for dimension in SUBSET_DIMENSIONS:
+            analyze_subsets(energetics, systems, dimension, groups, output_directory)
@@ -0,0 +1,295 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    streaming_correlation.py                           :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/29 10:05:41 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/29 10:05:41 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Out-of-core correlations between pairs of variables of the track files.
+
+Only the needed columns of the CSV files are read, a group of files at a time,
+and every chunk only updates fixed-size accumulators, so memory does not grow
+with the number of files. Two passes are made over the files:
+
+1. co-moments of each pair (count, means, sums of squared deviations and
+   cross-products, merged with Chan's formula), giving the Pearson coefficient
+   and the regression line, plus the quantile sketch of each variable;
+2. two 2-D histograms of each pair: one with bins of equal frequency (edges
+   from the sketches), whose mid-ranks give the Spearman coefficient with
+   values tied within a bin, and the linear binning of binned_kde (grid from
+   the pass 1 moments), whose FFT convolution gives the joint and marginal
+   densities.
+
+The passes split the files between worker processes, whose accumulators are
+merged as they finish.
+"""
+
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+from binned_kde import (bin_1d, bin_2d, density_from_bins_1d, density_from_bins_2d, kde_grid_1d,
+                        kde_grid_2d)
+from quantile_sketch import sketch_quantiles
+from streaming_stats import chunk_statistics, merge_statistics
+
+FILES_PER_CHUNK = 50
+RANK_BINS = 512
+
+PairCorrelation = namedtuple('PairCorrelation', [
+    'x', 'y', 'count', 'pearson', 'spearman', 'slope', 'intercept', 'minimum', 'maximum',
+    'joint', 'x_marginal', 'y_marginal'])
+
+def read_columns(file_path, columns, scales=None):
+    """
+    Reads only columns of a CSV file (missing columns are all NaN), as float64,
+    with each column in scales multiplied by its factor.
+    """
+    data = pd.read_csv(file_path, usecols=lambda col: col in columns)
+    data = data.reindex(columns=columns).apply(pd.to_numeric, errors='coerce').astype(np.float64)
+    for col, scale in (scales or {}).items():
+        data[col] *= scale
+    return data
+
+def file_chunks(file_paths, columns, scales=None, files_per_chunk=FILES_PER_CHUNK):
+    """
+    Yields the columns of groups of files_per_chunk files as DataFrames.
+    """
+    for i in range(0, len(file_paths), files_per_chunk):
+        yield pd.concat([read_columns(path, columns, scales) for path in file_paths[i:i + files_per_chunk]],
+                        ignore_index=True)
+
+def _pair_values(chunk, pair):
+    values = chunk[list(pair)].to_numpy(dtype=np.float64)
+    return values[~np.isnan(values).any(axis=1)]
+
+def pair_comoments(chunk, pairs):
+    """
+    Co-moments of the complete rows of each pair of a chunk.
+
+    Returns:
+    - DataFrame indexed by pair with 'count', 'mean_x', 'mean_y', 'm2_x', 'm2_y',
+      'c_xy', 'min_x', 'max_x', 'min_y' and 'max_y'.
+    """
+    rows = []
+    for pair in pairs:
+        values = _pair_values(chunk, pair)
+        if len(values):
+            mean = values.mean(axis=0)
+            deviations = values - mean
+            rows.append([len(values), *mean, *(deviations ** 2).sum(axis=0), deviations.prod(axis=1).sum(),
+                         values[:, 0].min(), values[:, 0].max(), values[:, 1].min(), values[:, 1].max()])
+        else:
+            rows.append([0, 0., 0., 0., 0., 0., np.inf, -np.inf, np.inf, -np.inf])
+    return pd.DataFrame(rows, index=pd.MultiIndex.from_tuples(pairs, names=['x', 'y']),
+                        columns=['count', 'mean_x', 'mean_y', 'm2_x', 'm2_y', 'c_xy',
+                                 'min_x', 'max_x', 'min_y', 'max_y'])
+
+def merge_comoments(a, b):
+    """
+    Merges the co-moments of two sets of rows (Chan's formula).
+    """
+    n = a['count'] + b['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = (b['count'] / n).fillna(0)
+    delta_x, delta_y = b['mean_x'] - a['mean_x'], b['mean_y'] - a['mean_y']
+    correction = a['count'] * weight
+    return pd.DataFrame({
+        'count': n,
+        'mean_x': a['mean_x'] + delta_x * weight,
+        'mean_y': a['mean_y'] + delta_y * weight,
+        'm2_x': a['m2_x'] + b['m2_x'] + delta_x ** 2 * correction,
+        'm2_y': a['m2_y'] + b['m2_y'] + delta_y ** 2 * correction,
+        'c_xy': a['c_xy'] + b['c_xy'] + delta_x * delta_y * correction,
+        'min_x': np.minimum(a['min_x'], b['min_x']), 'max_x': np.maximum(a['max_x'], b['max_x']),
+        'min_y': np.minimum(a['min_y'], b['min_y']), 'max_y': np.maximum(a['max_y'], b['max_y']),
+    })
+
+def rank_edges(sketch_table, n_bins=RANK_BINS):
+    """
+    Interior edges of n_bins bins of (about) equal frequency from a sketch.
+    """
+    quantiles = np.linspace(0, 1, n_bins + 1)[1:-1]
+    return np.unique(sketch_quantiles(sketch_table, quantiles).iloc[0].to_numpy())
+
+def spearman_from_histogram(counts):
+    """
+    Spearman coefficient of a 2-D histogram with bins of ordered values: the
+    Pearson coefficient of the mid-ranks of the bins, weighted by the counts.
+    """
+    n = counts.sum()
+    ranks = []
+    for axis in (1, 0):
+        marginal = counts.sum(axis=axis)
+        ranks.append(np.cumsum(marginal) - marginal + (marginal + 1) / 2)
+    rank_x, rank_y = ranks
+    mean = (n + 1) / 2
+    covariance = ((rank_x - mean)[:, None] * (rank_y - mean)[None, :] * counts).sum()
+    var_x = (counts.sum(axis=1) * (rank_x - mean) ** 2).sum()
+    var_y = (counts.sum(axis=0) * (rank_y - mean) ** 2).sum()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return covariance / np.sqrt(var_x * var_y)
+
+def _first_pass(args):
+    file_paths, columns, scales, pairs = args
+    comoments, stats = None, None
+    for chunk in file_chunks(file_paths, columns, scales):
+        current = pair_comoments(chunk, pairs)
+        comoments = current if comoments is None else merge_comoments(comoments, current)
+        if len(chunk):
+            current = chunk_statistics(chunk, {col: col for col in columns})
+            stats = current if stats is None else merge_statistics(stats, current)
+    return comoments, stats
+
+def _second_pass(args):
+    file_paths, columns, scales, pairs, edges, grids = args
+    histograms = {}
+    for chunk in file_chunks(file_paths, columns, scales):
+        for pair in pairs:
+            values = _pair_values(chunk, pair)
+            x_bins = np.searchsorted(edges[pair[0]], values[:, 0], side='right')
+            y_bins = np.searchsorted(edges[pair[1]], values[:, 1], side='right')
+            shape = (len(edges[pair[0]]) + 1, len(edges[pair[1]]) + 1)
+            ranks = np.bincount(x_bins * shape[1] + y_bins, minlength=shape[0] * shape[1]).reshape(shape)
+
+            joint_grid, x_grid, y_grid = grids[pair]
+            current = [ranks, bin_1d(values[:, 0], x_grid), bin_1d(values[:, 1], y_grid)]
+            if joint_grid is not None:
+                current.append(bin_2d(values[:, 0], values[:, 1], joint_grid))
+            histograms[pair] = current if pair not in histograms else \
+                [a + b for a, b in zip(histograms[pair], current)]
+    return histograms
+
+def _run(function, tasks, processes, merge, description):
+    # Merges the results of the tasks as they finish
+    merged = None
+    n_workers = max(1, min(processes or os.cpu_count() or 1, len(tasks)))
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        for result in tqdm(executor.map(function, tasks), total=len(tasks), desc=description):
+            merged = result if merged is None else merge(merged, result)
+    return merged
+
+def _merge_first(a, b):
+    if a[0] is None or b[0] is None:
+        return a if b[0] is None else b
+    stats = [s for s in (a[1], b[1]) if s is not None]
+    return merge_comoments(a[0], b[0]), merge_statistics(*stats) if stats else None
+
+def _merge_second(a, b):
+    return {pair: [x + y for x, y in zip(a[pair], b[pair])] if pair in a else b[pair] for pair in {**a, **b}}
+
+def stream_correlations(file_paths, pairs, scales=None, processes=None, files_per_chunk=FILES_PER_CHUNK,
+                        rank_bins=RANK_BINS):
+    """
+    Pearson and Spearman coefficients, regression lines and binned densities of
+    pairs of variables of CSV files, in two streaming passes.
+
+    Parameters:
+    - file_paths: CSV files (e.g., of results_chapter_5/database_tracks).
+    - pairs: List of (x, y) column pairs; rows where x or y is NaN are dropped.
+    - scales: Dictionary {column: factor} applied when reading (e.g., {'Ke': 1e-6}).
+    - processes: Worker processes (default: CPUs).
+    - files_per_chunk: Files read into memory at a time by each worker.
+    - rank_bins: Bins per variable of the Spearman histograms.
+
+    Returns:
+    - Dictionary {(x, y): PairCorrelation}; joint is (x_support, y_support, density)
+      as binned_kde.kde_2d and the marginals are (support, density).
+    """
+    pairs = [tuple(pair) for pair in pairs]
+    columns = list(dict.fromkeys(col for pair in pairs for col in pair))
+    file_paths = sorted(file_paths)
+    groups = [file_paths[i:i + files_per_chunk] for i in range(0, len(file_paths), files_per_chunk)]
+
+    comoments, stats = _run(_first_pass, [(group, columns, scales, pairs) for group in groups],
+                            processes, _merge_first, 'Moments')
+    edges = {}
+    for k, col in enumerate(stats.keys):
+        table = stats.sketch[stats.sketch['group'] == k]
+        edges[col] = rank_edges(table, rank_bins) if len(table) else np.array([])
+
+    grids = {}
+    for pair in pairs:
+        m = comoments.loc[pair]
+        n = m['count']
+        if n < 3 or m['min_x'] == m['max_x'] or m['min_y'] == m['max_y']:
+            raise ValueError(f'Not enough distinct values to correlate {pair[0]} and {pair[1]}')
+        covariance = np.array([[m['m2_x'], m['c_xy']], [m['c_xy'], m['m2_y']]]) / (n - 1)
+        try:
+            joint_grid = kde_grid_2d(n, covariance, [m['min_x'], m['min_y']], [m['max_x'], m['max_y']])
+        except np.linalg.LinAlgError:
+            joint_grid = None
+        grids[pair] = (joint_grid, kde_grid_1d(n, covariance[0, 0], m['min_x'], m['max_x']),
+                       kde_grid_1d(n, covariance[1, 1], m['min_y'], m['max_y']))
+
+    histograms = _run(_second_pass, [(group, columns, scales, pairs, edges, grids) for group in groups],
+                      processes, _merge_second, 'Histograms')
+
+    results = {}
+    for pair in pairs:
+        m = comoments.loc[pair]
+        joint_grid, x_grid, y_grid = grids[pair]
+        ranks, x_counts, y_counts = histograms[pair][:3]
+        joint = density_from_bins_2d(histograms[pair][3], joint_grid) if joint_grid is not None else \
+            (np.array([]), np.array([]), np.empty((0, 0)))
+        slope = m['c_xy'] / m['m2_x']
+        results[pair] = PairCorrelation(
+            x=pair[0], y=pair[1], count=int(m['count']),
+            pearson=m['c_xy'] / np.sqrt(m['m2_x'] * m['m2_y']),
+            spearman=spearman_from_histogram(ranks),
+            slope=slope, intercept=m['mean_y'] - slope * m['mean_x'],
+            minimum=(m['min_x'], m['min_y']), maximum=(m['max_x'], m['max_y']),
+            joint=joint, x_marginal=density_from_bins_1d(x_counts, x_grid),
+            y_marginal=density_from_bins_1d(y_counts, y_grid))
+    return results
+
+def _files_digest(file_paths, params):
+    digest = hashlib.sha1(repr(sorted(params.items())).encode())
+    for path in sorted(file_paths):
+        status = os.stat(path)
+        digest.update(f'{os.path.basename(path)}:{status.st_size}:{status.st_mtime_ns}'.encode())
+    return digest.hexdigest()[:16]
+
+def cached_correlations(cache_directory, file_paths, pairs, scales=None, **kwargs):
+    """
+    stream_correlations, loaded from cache_directory if it was already computed
+    for the same files (names, sizes and modification times) and parameters.
+    """
+    path = os.path.join(cache_directory, f'correlations_{_files_digest(file_paths, dict(pairs=pairs, scales=scales, **kwargs))}.npz')
+    pairs = [tuple(pair) for pair in pairs]
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            results = {}
+            for p, pair in enumerate(pairs):
+                scalars = cached[f'scalars_{p}']
+                results[pair] = PairCorrelation(
+                    x=pair[0], y=pair[1], count=int(scalars[0]), pearson=scalars[1], spearman=scalars[2],
+                    slope=scalars[3], intercept=scalars[4], minimum=tuple(scalars[5:7]), maximum=tuple(scalars[7:9]),
+                    joint=tuple(cached[f'joint_{p}_{i}'] for i in range(3)),
+                    x_marginal=tuple(cached[f'x_marginal_{p}_{i}'] for i in range(2)),
+                    y_marginal=tuple(cached[f'y_marginal_{p}_{i}'] for i in range(2)))
+            return results
+
+    results = stream_correlations(file_paths, pairs, scales, **kwargs)
+    arrays = {}
+    for p, pair in enumerate(pairs):
+        r = results[pair]
+        arrays[f'scalars_{p}'] = np.array([r.count, r.pearson, r.spearman, r.slope, r.intercept,
+                                           *r.minimum, *r.maximum])
+        for name in ['joint', 'x_marginal', 'y_marginal']:
+            for i, array in enumerate(getattr(r, name)):
+                arrays[f'{name}_{p}_{i}'] = array
+    os.makedirs(cache_directory, exist_ok=True)
+    np.savez(path, **arrays)
+    return results
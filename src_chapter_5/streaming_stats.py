@@ -0,0 +1,181 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    streaming_stats.py                                 :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/06/27 14:12:09 by daniloceano       #+#    #+#              #
+#    Updated: 2024/06/27 14:12:09 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Single-pass, mergeable statistics of the LEC terms.
+
+Values are fed chunk by chunk (batches of the energetics store, or per-system
+DataFrames) and summarized per key (a term, or a group of terms pooled
+together) as:
+
+- moments: count, mean and sum of squared deviations (Welford/Chan), min, max;
+- a quantile sketch (quantile_sketch, relative accuracy RELATIVE_ACCURACY).
+
+Statistics of different chunks or workers are combined with
+merge_statistics, so memory does not grow with the number of values. The
+quantiles are approximate, which suits streaming and exploratory uses (e.g.,
+the axis caps of the PDFs); the published tables (summary_statistics) are
+computed with exact quantiles from the loaded energetics.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from energetics_store import ID_COLUMNS, load_energetics, store_path
+from quantile_sketch import build_sketch, merge_sketches, sketch_quantiles
+
+CHUNK_ROWS = 100_000
+
+# keys: labels of the groups of sketch; moments: DataFrame indexed by keys
+StreamingStats = namedtuple('StreamingStats', ['keys', 'moments', 'sketch'])
+
+def _empty_moments(keys):
+    return pd.DataFrame({'count': 0, 'mean': 0., 'm2': 0., 'min': np.inf, 'max': -np.inf},
+                        index=pd.Index(keys, name='key'))
+
+def chunk_statistics(chunk, column_keys):
+    """
+    Statistics of one chunk.
+
+    Parameters:
+    - chunk: DataFrame with the columns of column_keys.
+    - column_keys: Dictionary {column: key}; columns sharing a key are pooled.
+
+    Returns:
+    - StreamingStats.
+    """
+    keys = list(dict.fromkeys(column_keys.values()))
+    codes = np.array([keys.index(column_keys[col]) for col in column_keys])
+    values = chunk[list(column_keys)].to_numpy(dtype=np.float64)
+    groups = np.broadcast_to(codes, values.shape)
+    valid = ~np.isnan(values)
+    values, groups = values[valid], groups[valid]
+
+    count = np.bincount(groups, minlength=len(keys))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(groups, weights=values, minlength=len(keys)) / count
+    m2 = np.bincount(groups, weights=(values - mean[groups]) ** 2, minlength=len(keys))
+    minimum = np.full(len(keys), np.inf)
+    maximum = np.full(len(keys), -np.inf)
+    np.minimum.at(minimum, groups, values)
+    np.maximum.at(maximum, groups, values)
+
+    moments = pd.DataFrame({'count': count, 'mean': np.nan_to_num(mean), 'm2': m2, 'min': minimum,
+                            'max': maximum}, index=pd.Index(keys, name='key'))
+    return StreamingStats(keys, moments, build_sketch(values, groups))
+
+def merge_statistics(*stats):
+    """
+    Merges statistics of the same keys (Chan's formula for the moments, added
+    bucket counts for the sketches).
+    """
+    keys = stats[0].keys
+    merged = _empty_moments(keys)
+    for other in stats:
+        a, b = merged, other.moments.reindex(keys)
+        n = a['count'] + b['count']
+        delta = b['mean'] - a['mean']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = (b['count'] / n).fillna(0)
+            mean = a['mean'] + delta * weight
+            m2 = a['m2'] + b['m2'] + (delta ** 2 * a['count'] * weight).fillna(0)
+        merged = pd.DataFrame({'count': n, 'mean': mean, 'm2': m2, 'min': np.minimum(a['min'], b['min']),
+                               'max': np.maximum(a['max'], b['max'])})
+    return StreamingStats(keys, merged, merge_sketches(*[s.sketch for s in stats]))
+
+def stream_statistics(chunks, column_keys):
+    """
+    Statistics of an iterable of chunks (DataFrames), merged as they are read.
+    """
+    stats = None
+    for chunk in chunks:
+        if len(chunk):
+            current = chunk_statistics(chunk, column_keys)
+            stats = current if stats is None else merge_statistics(stats, current)
+    if stats is None:
+        keys = list(dict.fromkeys(column_keys.values()))
+        stats = StreamingStats(keys, _empty_moments(keys), build_sketch([]))
+    return stats
+
+def _store_batches(path, columns, row_groups, chunk_rows):
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, row_groups=row_groups, columns=columns):
+        yield batch.to_pandas()
+
+def _stream_row_groups(args):
+    path, column_keys, row_groups, chunk_rows = args
+    return stream_statistics(_store_batches(path, list(column_keys), row_groups, chunk_rows), column_keys)
+
+def energetics_statistics(base_path, column_keys=None, chunk_rows=CHUNK_ROWS, processes=1):
+    """
+    Statistics of the terms of the energetics store, read in batches of chunk_rows.
+
+    Parameters:
+    - base_path: Directory with the energetics by periods CSV files.
+    - column_keys: Dictionary {term: key} (default: every term is its own key).
+    - chunk_rows: Rows per batch.
+    - processes: Worker processes, each reading part of the row groups.
+
+    Returns:
+    - StreamingStats.
+    """
+    # Refreshes the store if the CSV files changed
+    load_energetics(base_path, columns=[])
+    path = store_path(base_path)
+    parquet_file = pq.ParquetFile(path)
+    if column_keys is None:
+        column_keys = {col: col for col in parquet_file.schema_arrow.names if col not in ID_COLUMNS}
+
+    row_groups = list(range(parquet_file.num_row_groups))
+    n_workers = max(1, min(processes or os.cpu_count() or 1, len(row_groups)))
+    tasks = [(path, column_keys, row_groups[i::n_workers], chunk_rows) for i in range(n_workers)]
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            return merge_statistics(*executor.map(_stream_row_groups, tasks))
+    return _stream_row_groups(tasks[0])
+
+def summarize(stats, quantiles=(0.5,)):
+    """
+    Summary of every key: 'count', 'mean', 'std' (sample), 'min', 'max' and
+    one 'q<quantile>' column per quantile (from the sketches).
+    """
+    moments = stats.moments
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(moments['m2'] / (moments['count'] - 1))
+    summary = pd.DataFrame({'count': moments['count'], 'mean': moments['mean'].where(moments['count'] > 0),
+                            'std': std, 'min': moments['min'], 'max': moments['max']})
+    if quantiles:
+        estimates = sketch_quantiles(stats.sketch, quantiles) if len(stats.sketch) else \
+            pd.DataFrame(columns=list(quantiles))
+        estimates.index = pd.Index(np.asarray(stats.keys, dtype=object)[estimates.index.values.astype(int)])
+        for q in quantiles:
+            summary[f'q{q:g}'] = estimates[q].reindex(summary.index)
+    return summary
+
+def frame_chunks(frames, chunk_size=500):
+    """
+    Concatenates an iterable of (e.g., per-system) DataFrames in groups of
+    chunk_size, so they can be fed to stream_statistics.
+    """
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == chunk_size:
+            yield pd.concat(batch, ignore_index=True)
+            batch = []
+    if batch:
+        yield pd.concat(batch, ignore_index=True)
@@ -13,35 +13,17 @@
 import os
 import pandas as pd
 
+from energetics_store import load_energetics
+
 PATH = '/Users/danilocoutodesouza/Documents/Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
 base_path = f'{PATH}/csv_database_energy_by_periods'
 output_directory = f'../results_chapter_5/summary_statistics/'
 
-def read_life_cycles(base_path):
-    """
-    Reads all CSV files in the specified directory and collects DataFrame for each system.
-    """
-    systems_energetics = {}
-
-    for filename in os.listdir(base_path):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(base_path, filename)
-            system_id = filename.split('_')[0]
-            try:
-                df = pd.read_csv(file_path)
-                df = df.rename(columns={'Unnamed: 0': 'phase'})
-                df.index = range(1, len(df) + 1)
-                systems_energetics[system_id] = df
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-
-    return systems_energetics
-
-def compute_summary_statistics(systems_energetics, output_directory):
+def compute_summary_statistics(energetics, output_directory):
     """
     Computes summary statistics for each term in the energetic data and exports the results as a LaTeX table.
     """
-    all_data = pd.concat(systems_energetics.values(), ignore_index=True)
+    all_data = energetics
     terms = [col for col in all_data.columns if col not in ['Unnamed: 0', 'phase', 'system_id']]
 
     summary_stats = []
@@ -92,5 +74,5 @@ def compute_summary_statistics(systems_energetics, output_directory):
     print(f"Summary statistics saved to {os.path.join(output_directory, 'summary_statistics_total.tex')}")
 
 if __name__ == "__main__":
-    systems_energetics = read_life_cycles(base_path)
-    compute_summary_statistics(systems_energetics, output_directory)
\ No newline at end of file
+    energetics = load_energetics(base_path)
+    compute_summary_statistics(energetics, output_directory)
\ No newline at end of file
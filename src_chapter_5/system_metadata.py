@@ -0,0 +1,141 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    system_metadata.py                                 :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/07/04 15:06:31 by daniloceano       #+#    #+#              #
+#    Updated: 2024/07/04 15:06:31 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Per-system metadata of the database tracks.
+
+One row per track_id with the genesis and lysis dates, the duration (hours),
+the genesis position, region ('SAt' outside GENESIS_REGIONS) and season, the
+maximum 'vor 42' and the phase sequence of the system (e.g., 'incipient,
+intensification, mature, decay'), saved next to the database directory as
+<directory>_systems.parquet.
+
+create_database writes it together with the CSV files, so the analyses of
+genesis dates, seasons or durations are groupbys of a small table instead of
+opening every CSV file. If the CSV files changed since (same signature as
+database_store), it is built again from the database store.
+"""
+
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from database_store import DATABASE_DIRECTORY, _source_signature, load_database
+
+sys.path.append('../src_chapter_4')
+from genesis_index import GENESIS_REGIONS, genesis_in_region
+from density_layers import SEASONS, MONTH_TO_SEASON
+
+SOURCE_KEY = b'database_source'
+NO_PHASE = 'No Phase'
+METADATA_COLUMNS = ['genesis_date', 'lysis_date', 'duration', 'genesis_lat', 'genesis_lon', 'region',
+                    'season', 'max_vorticity', 'phase_sequence']
+
+def metadata_path(directory=DATABASE_DIRECTORY):
+    return f'{os.path.normpath(directory)}_systems.parquet'
+
+def _phase_sequences(database):
+    # Phases in the order the rows of each system go through them
+    phases = database[['track_id', 'phase']].dropna()
+    phases = phases[phases['phase'] != NO_PHASE]
+    changes = (phases['phase'] != phases['phase'].shift()) | (phases['track_id'] != phases['track_id'].shift())
+    return phases[changes.values].groupby('track_id', sort=False)['phase'].agg(', '.join)
+
+def build_system_metadata(database, periods=None):
+    """
+    Metadata of each system of the database.
+
+    Parameters:
+    - database: Rows of the database (track_id, date, lon, lat, vor 42 and
+      phase), in the order of each track.
+    - periods: Table of periods (track_id, period, start, end) in file order,
+      as phase_labeller.periods_table. If None, the phase sequences are taken
+      from the 'phase' of the rows.
+
+    Returns:
+    - DataFrame indexed by track_id with METADATA_COLUMNS.
+    """
+    groups = database.groupby('track_id', sort=False)
+    metadata = pd.DataFrame({
+        'genesis_date': groups['date'].first(),
+        'lysis_date': groups['date'].last(),
+        'genesis_lat': groups['lat'].first().astype(np.float32),
+        'genesis_lon': groups['lon'].first().astype(np.float32),
+        'max_vorticity': groups['vor 42'].max().astype(np.float32),
+    })
+    metadata['genesis_date'] = pd.to_datetime(metadata['genesis_date'])
+    metadata['lysis_date'] = pd.to_datetime(metadata['lysis_date'])
+    metadata['duration'] = ((metadata['lysis_date'] - metadata['genesis_date']) / pd.Timedelta(hours=1)).astype(np.float32)
+    metadata['genesis_lon'] = np.where(metadata['genesis_lon'] > 180, metadata['genesis_lon'] - 360,
+                                       metadata['genesis_lon']).astype(np.float32)
+
+    region = pd.Series('SAt', index=metadata.index, dtype=object)
+    for name in GENESIS_REGIONS:
+        region[genesis_in_region(metadata, name, 'genesis_lon', 'genesis_lat').values] = name
+    metadata['region'] = pd.Categorical(region, categories=['SAt', *GENESIS_REGIONS])
+    metadata['season'] = pd.Categorical(np.asarray(SEASONS, dtype=object)[MONTH_TO_SEASON[metadata['genesis_date'].dt.month.values]],
+                                        categories=SEASONS[:-1])
+
+    if periods is not None:
+        sequences = periods.groupby('track_id', sort=False)['period'].agg(', '.join)
+    else:
+        sequences = _phase_sequences(database)
+    metadata['phase_sequence'] = pd.Categorical(sequences.reindex(metadata.index))
+    metadata.index = metadata.index.astype(np.int64)
+    metadata.index.name = 'track_id'
+    return metadata[METADATA_COLUMNS]
+
+def save_system_metadata(metadata, directory=DATABASE_DIRECTORY):
+    """
+    Saves the metadata with the signature of the CSV files of directory.
+    """
+    path = metadata_path(directory)
+    table = pa.Table.from_pandas(metadata)
+    signature = _source_signature(directory) if os.path.isdir(directory) else {}
+    schema_metadata = {**(table.schema.metadata or {}), SOURCE_KEY: json.dumps(signature).encode()}
+    tmp_path = f'{path}.tmp'
+    pq.write_table(table.replace_schema_metadata(schema_metadata), tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Wrote {path}")
+
+def _is_current(directory, path):
+    if not os.path.exists(path):
+        return False
+    if not os.path.isdir(directory):
+        # Metadata shipped without the CSV files
+        return True
+    schema_metadata = pq.read_schema(path).metadata or {}
+    if SOURCE_KEY not in schema_metadata:
+        return False
+    return json.loads(schema_metadata[SOURCE_KEY]) == _source_signature(directory)
+
+def load_system_metadata(directory=DATABASE_DIRECTORY, columns=None):
+    """
+    Metadata of the systems of the database, indexed by track_id, (re)built
+    from the database store if it is missing or the CSV files changed.
+    """
+    path = metadata_path(directory)
+    if not _is_current(directory, path):
+        database = load_database(directory, columns=['track_id', 'date', 'lon', 'lat', 'vor 42', 'phase'])
+        save_system_metadata(build_system_metadata(database), directory)
+    return pd.read_parquet(path, columns=columns)
+
+def main():
+    metadata = load_system_metadata(DATABASE_DIRECTORY)
+    print(metadata.describe(include='all'))
+
+if __name__ == "__main__":
+    main()
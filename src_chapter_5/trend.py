@@ -10,6 +10,7 @@ from matplotlib.colors import BoundaryNorm
 from sklearn.linear_model import LinearRegression
 from statsmodels.tsa.seasonal import seasonal_decompose
 from statsmodels.tsa.arima.model import ARIMA
+from energetics_store import read_life_cycles
 
 PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic'
 base_path = f'{PATH}/csv_database_energy_by_periods'
@@ -28,25 +29,6 @@ def read_csv_file(file_path):
         print(f"Error processing {file_path}: {e}")
         return None
 
-def read_life_cycles(base_path):
-    """
-    Reads all CSV files in the specified directory and collects DataFrame for each system.
-    """
-    systems_energetics = {}
-    file_paths = [os.path.join(base_path, filename) for filename in os.listdir(base_path) if filename.endswith('.csv')]
-
-    with ThreadPoolExecutor() as executor:
-        futures = {executor.submit(read_csv_file, file_path): file_path for file_path in file_paths}
-
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Reading CSV files"):
-            file_path = futures[future]
-            system_id = os.path.basename(file_path).split('_')[0]
-            df = future.result()
-            if df is not None:
-                systems_energetics[system_id] = df
-
-    return systems_energetics
-
 def read_tracks(tracks_dir, relevant_track_ids):
     """
     Reads all track CSV files in the specified directory and filters relevant tracks.
@@ -0,0 +1,117 @@
+# **************************************************************************** #
+#                                                                              #
+#                                                         :::      ::::::::    #
+#    cluster_index.py                                   :+:      :+:    :+:    #
+#                                                     +:+ +:+         +:+      #
+#    By: daniloceano <danilo.oceano@gmail.com>      +#+  +:+       +#+         #
+#                                                 +#+#+#+#+#+   +#+            #
+#    Created: 2024/07/04 10:22:05 by daniloceano       #+#    #+#              #
+#    Updated: 2024/07/04 10:22:05 by daniloceano      ###   ########.fr        #
+#                                                                              #
+# **************************************************************************** #
+
+"""
+Cluster membership index of the systems.
+
+The kmeans_results*.json of every life-cycle configuration in KMEANS_PATH
+(IcItMD, DItMD2, ...) are parsed once into a table with one row per
+(configuration, track_id): its 'cluster' ('Cluster 1', ...), and the
+'genesis_date', 'region' and 'season' of the system, from the system metadata
+written by create_database.
+
+The index is saved as results_chapter_6/cluster_index.parquet and rebuilt when
+a json file or the system metadata is newer. It is loaded with a
+(configuration, track_id) MultiIndex, so the cluster of a system is a hash
+lookup, and cluster_rows() reads the rows of the members of a cluster directly
+from the database store.
+"""
+
+import os
+import sys
+import pandas as pd
+from glob import glob
+
+sys.path.append('../src_chapter_5')
+from database_store import DATABASE_DIRECTORY, load_database
+from system_metadata import load_system_metadata, metadata_path
+
+KMEANS_PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic/results_kmeans/all_systems'
+INDEX_PATH = '../results_chapter_6/cluster_index.parquet'
+INDEX_COLUMNS = ['configuration', 'track_id']
+GENESIS_COLUMNS = ['genesis_date', 'region', 'season']
+
+def _results_files(kmeans_path):
+    # One kmeans_results*.json per configuration directory
+    files = {}
+    for json_path in sorted(glob(os.path.join(kmeans_path, '*', 'kmeans_results*.json'))):
+        files.setdefault(os.path.basename(os.path.dirname(json_path)), json_path)
+    return files
+
+def read_memberships(json_path):
+    """
+    Cluster of each system in a kmeans_results*.json, in the order of the file.
+    """
+    ids_clusters = pd.read_json(json_path).loc['Cyclone IDs']
+    return pd.DataFrame([(int(track_id), cluster) for cluster, ids in ids_clusters.items() for track_id in ids],
+                        columns=['track_id', 'cluster'])
+
+def build_cluster_index(kmeans_path=KMEANS_PATH, directory=DATABASE_DIRECTORY):
+    """
+    Builds the membership table of all configurations of kmeans_path.
+
+    Returns:
+    - DataFrame with 'configuration', 'track_id', 'cluster' and the
+      GENESIS_COLUMNS (missing for systems not in the database).
+    """
+    memberships = [read_memberships(json_path).assign(configuration=configuration)
+                   for configuration, json_path in _results_files(kmeans_path).items()]
+    if not memberships:
+        raise FileNotFoundError(f"No kmeans_results*.json in the directories of {kmeans_path}")
+    index = pd.concat(memberships, ignore_index=True)
+    index = index.join(load_system_metadata(directory, columns=GENESIS_COLUMNS), on='track_id')
+    return index[INDEX_COLUMNS + ['cluster', *GENESIS_COLUMNS]]
+
+def _is_current(path, kmeans_path, directory):
+    if not os.path.exists(path):
+        return False
+    # Loading the metadata first refreshes it if the CSV files changed
+    load_system_metadata(directory, columns=[])
+    sources = list(_results_files(kmeans_path).values()) + [metadata_path(directory)]
+    return all(os.path.getmtime(path) >= os.path.getmtime(source) for source in sources)
+
+def load_cluster_index(kmeans_path=KMEANS_PATH, directory=DATABASE_DIRECTORY, path=INDEX_PATH, rebuild=False):
+    """
+    Cluster membership index, indexed by (configuration, track_id), (re)built
+    if it is missing, older than its sources or if rebuild is True.
+    """
+    if rebuild or not _is_current(path, kmeans_path, directory):
+        index = build_cluster_index(kmeans_path, directory)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        index.to_parquet(path, index=False)
+        print(f"Wrote {path}")
+    else:
+        index = pd.read_parquet(path)
+    return index.set_index(INDEX_COLUMNS)
+
+def cluster_members(index, configuration):
+    """
+    Track ids of each cluster of a configuration, as {cluster: array}, in the
+    order of the clusters in the json file.
+    """
+    clusters = index.loc[configuration, 'cluster']
+    return {cluster: clusters.index[(clusters == cluster).values].to_numpy()
+            for cluster in pd.unique(clusters)}
+
+def cluster_rows(index, configuration, cluster, columns=None, directory=DATABASE_DIRECTORY):
+    """
+    Rows of the database store of the systems in a cluster of a configuration.
+    """
+    members = cluster_members(index, configuration)[cluster]
+    return load_database(directory, columns=columns, track_ids=members)
+
+def main():
+    index = load_cluster_index(rebuild=True)
+    print(index.groupby(['configuration', 'cluster']).size())
+
+if __name__ == "__main__":
+    main()
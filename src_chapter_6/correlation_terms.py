@@ -1,59 +1,44 @@
 import os
-import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.ticker as tkr
 import numpy as np
 import glob
-from concurrent.futures import ProcessPoolExecutor
-from tqdm import tqdm
-from scipy import stats
+
+import sys
+sys.path.append('../src_chapter_5')
+from binned_kde import iso_proportion_levels, plot_density
+from streaming_correlation import cached_correlations
 
 # Define the directory containing the CSV files
 directory_path = '../results_chapter_5/database_tracks/'
+cache_directory = '../results_chapter_5/database_tracks_correlation_cache'
 
-# Function to read and process each CSV file
-def process_file(file_path):
-    data = pd.read_csv(file_path)
-    ca_values = pd.to_numeric(data['Ca'], errors='coerce').dropna().values if 'Ca' in data.columns else []
-    ce_values = pd.to_numeric(data['Ce'], errors='coerce').dropna().values if 'Ce' in data.columns else []
-    ke_values = pd.to_numeric(data['Ke'], errors='coerce').dropna().values if 'Ke' in data.columns else []
-    vor42_values = pd.to_numeric(data['vor 42'], errors='coerce').dropna().values if 'vor 42' in data.columns else []
-    return ca_values, ce_values, ke_values, vor42_values
-
-# Function to parallelize file processing
-def parallel_file_processing(file_paths):
-    with ProcessPoolExecutor() as executor:
-        results = list(tqdm(executor.map(process_file, file_paths), total=len(file_paths)))
-    return results
-
-# Function to merge processed data
-def merge_processed_data(results):
-    Ca_values, Ce_values, Ke_values, Vor42_values = [], [], [], []
-    for ca_values, ce_values, ke_values, vor42_values in results:
-        Ca_values.extend(ca_values)
-        Ce_values.extend(ce_values)
-        Ke_values.extend(ke_values)
-        Vor42_values.extend(vor42_values)
-    return (np.array(Ca_values), np.array(Ce_values), np.array(Ke_values) / 1e6, np.array(Vor42_values))
-
-# Function to calculate Pearson correlation
-def calculate_pearson_correlation(dataframe):
-    return dataframe.corr().iloc[0, 1]
+# Pairs correlated and scale factors of the columns read
+PAIRS = [('Ca', 'Ce'), ('Ke', 'vor 42')]
+SCALES = {'Ke': 1e-6}
 
 # Function to create and save joint plots
-def create_jointplot(x, y, data, x_label, y_label, xlim, ylim, filename, regression=True, density_label='Density'):
-    pr = lambda a, b: stats.pearsonr(a, b)[0]
+def create_jointplot(result, x_label, y_label, xlim, ylim, filename, regression=True, density_label='Density'):
     formatter = tkr.ScalarFormatter(useMathText=True)
     formatter.set_scientific(True)
     formatter.set_powerlimits((-2, 2))
 
-    g = sns.jointplot(x=x, y=y, data=data, kind='kde', fill=True, cmap="rainbow", space=1, cbar=True,
-                      n_levels=10, cbar_kws={"format": formatter, "label": density_label}, 
-                      stat_func=pr, annot_kws={'stat':'pearsonr'})
+    x_support, y_support, density = result.joint
+    g = sns.JointGrid(space=1)
+    contours = g.ax_joint.contourf(x_support, y_support, density, levels=iso_proportion_levels(density, levels=10),
+                                   cmap=sns.color_palette("rainbow", as_cmap=True))
+    g.figure.colorbar(contours, ax=g.ax_joint, format=formatter, label=density_label)
+    plot_density(g.ax_marg_x, *result.x_marginal, fill=True, color='C0')
+    plot_density(g.ax_marg_y, *result.y_marginal, fill=True, color='C0', vertical=True)
+    g.ax_marg_x.yaxis.offsetText.set_visible(False)
+    g.ax_marg_y.xaxis.offsetText.set_visible(False)
 
     if regression:
-        sns.regplot(x=x, y=y, data=data, ax=g.ax_joint, scatter=False, color='r', label=f'r = {calculate_pearson_correlation(data):.2f}')
+        # Least-squares line from the streamed co-moments
+        line_x = np.array(xlim)
+        g.ax_joint.plot(line_x, result.intercept + result.slope * line_x, color='r',
+                        label=f'r = {result.pearson:.2f}, ρ = {result.spearman:.2f}')
         g.ax_joint.legend(loc='best')
 
     g.ax_joint.set_xlim(xlim)
@@ -69,25 +54,22 @@ def main():
     # Fetch CSV files
     csv_files = glob.glob(os.path.join(directory_path, '*.csv'))
 
-    # Process files in parallel
-    results = parallel_file_processing(csv_files)
-
-    # Merge processed data
-    Ca_values, Ce_values, Ke_values, Vor42_values = merge_processed_data(results)
-
-    # Create DataFrames with the combined data
-    combined_data_ca_ce = pd.DataFrame({'Ca': Ca_values, 'Ce': Ce_values})
-    combined_data_ke_vor42 = pd.DataFrame({'Ke': Ke_values, 'vor42': Vor42_values})
+    # Stream the needed columns of all files (cached between runs)
+    results = cached_correlations(cache_directory, csv_files, PAIRS, scales=SCALES)
+    for result in results.values():
+        print(f"{result.x} vs {result.y}: n = {result.count}, Pearson = {result.pearson:.3f}, Spearman = {result.spearman:.3f}")
 
     # Create and save joint plots
-    create_jointplot('Ca', 'Ce', combined_data_ca_ce, 'Ca (W$^{-2}$)', 'Ce (W$^{-2}$)', 
-                     [combined_data_ca_ce['Ca'].min() * 0.6, combined_data_ca_ce['Ca'].max() * 0.6], 
-                     [combined_data_ca_ce['Ce'].min() * 0.6, combined_data_ca_ce['Ce'].max() * 0.6], 
+    ca_ce = results[('Ca', 'Ce')]
+    create_jointplot(ca_ce, 'Ca (W$^{-2}$)', 'Ce (W$^{-2}$)',
+                     [ca_ce.minimum[0] * 0.6, ca_ce.maximum[0] * 0.6],
+                     [ca_ce.minimum[1] * 0.6, ca_ce.maximum[1] * 0.6],
                      '../figures_chapter_6/correlation_ca_ce')
 
-    create_jointplot('Ke', 'vor42', combined_data_ke_vor42, 'Eddy Kinetic Energy ($10^6$ J m$^{-2}$)', 'Relative Vorticity ($10^{-5}$ s$^{-1}$)', 
-                     [0, combined_data_ke_vor42['Ke'].max() * 0.5], 
-                     [combined_data_ke_vor42['vor42'].min(), combined_data_ke_vor42['vor42'].max() * 0.8], 
+    ke_vor42 = results[('Ke', 'vor 42')]
+    create_jointplot(ke_vor42, 'Eddy Kinetic Energy ($10^6$ J m$^{-2}$)', 'Relative Vorticity ($10^{-5}$ s$^{-1}$)',
+                     [0, ke_vor42.maximum[0] * 0.5],
+                     [ke_vor42.minimum[1], ke_vor42.maximum[1] * 0.8],
                      '../figures_chapter_6/correlation_ke_vor42')
 
 if __name__ == '__main__':
@@ -1,9 +1,5 @@
-import os
 import pandas as pd
 import numpy as np
-from glob import glob
-from concurrent.futures import ProcessPoolExecutor
-from tqdm import tqdm
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
@@ -11,31 +7,17 @@ import statsmodels.api as sm
 from statsmodels.tsa.seasonal import STL
 from statannotations.Annotator import Annotator
 
+import sys
+sys.path.append('../src_chapter_5')
+from resampling import bootstrap_slope, permutation_slope_test
+from cluster_index import load_cluster_index
+
 PHASES = ['incipient', 'intensification', 'mature', 'decay']
 TERMS = ['Ck', 'Ca', 'Ke', 'Ge', 'BAe', 'BKe']
 REGIONS = ['SE-BR', 'LA-PLATA', 'ARG']
+CONFIGURATION = 'IcItMD'
 
-def read_patterns(results_path, PHASES, TERMS):
-    patterns_json = glob(f'{results_path}/kmeans_results*.json')
-    results = pd.read_json(patterns_json[0])
-    clusters_center = results.loc['Cluster Center']
-    patterns_energetics = []
-    for i in range(len(clusters_center)):
-        cluster_center = np.array(clusters_center.iloc[i])
-        cluster_array = np.array(cluster_center).reshape(len(TERMS), len(PHASES))
-        df = pd.DataFrame(cluster_array, columns=PHASES, index=TERMS).T
-        df['Ke'] = df['Ke'] / 1e6  # Adjust the magnitude of Ke
-        patterns_energetics.append(df)
-    return patterns_energetics, clusters_center, results
-
-def process_file(file_path):
-    data = pd.read_csv(file_path)
-    return pd.to_datetime(data['date'].loc[0])
-
-def parallel_file_processing(file_paths):
-    with ProcessPoolExecutor() as executor:
-        results = list(tqdm(executor.map(process_file, file_paths), total=len(file_paths)))
-    return results
+N_RESAMPLES = 10000
 
 def plot_interannual_variability(genesis_clusters):
     interannual_data = []
@@ -85,6 +67,14 @@ def plot_interannual_variability(genesis_clusters):
         # Print the summary of the model
         print(f'Trend analysis for {cluster}:')
         print(model.summary())
+
+        # Resampling-based interval and p-value of the slope
+        time_steps = np.arange(len(trend))
+        slope_interval = bootstrap_slope(time_steps, y, n_resamples=N_RESAMPLES).loc['slope']
+        slope_test = permutation_slope_test(time_steps, y, n_resamples=N_RESAMPLES).loc['slope']
+        print(f"Bootstrap slope: {slope_interval['estimate']:.4f} "
+              f"[{slope_interval['ci_low']:.4f}, {slope_interval['ci_high']:.4f}], "
+              f"permutation p-value: {slope_test['p_value']:.4f} ({int(slope_test['n_resamples'])} permutations)")
         
         # Plot the trend line
         cluster_data['Trend'] = model.predict(X)
@@ -99,21 +89,9 @@ def plot_interannual_variability(genesis_clusters):
         plt.show()
 
 def main():
-    patterns_clusters_path = "../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic/results_kmeans/all_systems/IcItMD"
-    patterns_energetics, clusters_center, results = read_patterns(patterns_clusters_path, PHASES, TERMS)
-    ids_clusters = results.loc['Cyclone IDs']
-    
-    # Fetch CSV files with LPS data
-    directory_path = '../results_chapter_5/database_tracks/'
-    csv_files = glob(os.path.join(directory_path, '*.csv'))
-
-    # Filter csv files for ids in ids_clusters
-    csv_files_clusters = {}
-    genesis_clusters = {}
-    for cluster in ids_clusters.index:
-        csv_files_clusters[cluster] = [file for file in csv_files if int(file.split('/')[-1].split('.')[0].split('_')[-1]) in ids_clusters.loc[cluster]]
-        # Process files in parallel
-        genesis_clusters[cluster] = parallel_file_processing(csv_files_clusters[cluster])
+    # Genesis date of the systems of each cluster, from the cluster index
+    index = load_cluster_index().loc[CONFIGURATION].dropna(subset=['genesis_date'])
+    genesis_clusters = {cluster: list(dates) for cluster, dates in index.groupby('cluster', sort=False)['genesis_date']}
     
     # Plot the interannual variability of each cluster
     plot_interannual_variability(genesis_clusters)
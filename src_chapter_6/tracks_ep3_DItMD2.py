@@ -11,57 +11,30 @@
 # **************************************************************************** #
 
 import os
-import json
+import sys
 import matplotlib.pyplot as plt
-import matplotlib.ticker as mticker
 import numpy as np
 import pandas as pd
 import cartopy.crs as ccrs
-import cartopy.feature as cfeature
 import matplotlib.patches as mpatches
-from glob import glob
-from cartopy.mpl.ticker import LongitudeFormatter, LatitudeFormatter
 import matplotlib.colors as colors
 from scipy.ndimage import gaussian_filter
 
+from cluster_index import cluster_rows, load_cluster_index
+
+sys.path.append('../src_chapter_4')
+from basemap import basemap, draw_basemap
+
 # Configuration constants
 datacrs = ccrs.PlateCarree()
 proj = ccrs.AlbersEqualArea(central_longitude=-30, central_latitude=-35, standard_parallels=(-20.0, -60.0))
-CSV_PATH = '../results_chapter_5/database_tracks'
-KMEANS_PATH = '../../Programs_and_scripts/energetic_patterns_cyclones_south_atlantic/results_kmeans/all_systems/DItMD2'
+CONFIGURATION = 'DItMD2'
+CLUSTER = 'Cluster 3'
 OUTPUT_DIRECTORY = '../figures_chapter_6'
 LINE_STYLES = {'default': 'solid'}
 COLOR_PHASES = {'incipient': 'blue', 'mature': 'green', 'decay': 'red'}
 PHASES = ['incipient', 'mature']
-
-def gridlines(ax):
-    gl = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed', alpha=0.6, color='#383838', linewidth=0.5)
-    gl.xlocator = mticker.FixedLocator(np.arange(-180, 181, 10))
-    gl.ylocator = mticker.FixedLocator(np.arange(-90, 91, 10))
-    gl.xformatter = LongitudeFormatter()
-    gl.yformatter = LatitudeFormatter()
-    gl.xlabel_style = {'size': 14, 'color': '#383838'}
-    gl.ylabel_style = {'size': 14, 'color': '#383838'}
-    gl.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl.bottom_labels = False
-    gl.right_labels = False
-    gl.top_labels = False
-    gl.left_labels = False
-
-    gl2 = ax.gridlines(draw_labels=True, zorder=2, linestyle='dashed', alpha=0, color='#383838')
-    gl2.xlocator = mticker.FixedLocator(np.arange(-180, 181, 20))
-    gl2.ylocator = mticker.FixedLocator(np.arange(-90, 91, 20))
-    gl2.xformatter = LongitudeFormatter()
-    gl2.yformatter = LatitudeFormatter()
-    gl2.xlabel_style = {'size': 14, 'color': '#383838'}
-    gl2.ylabel_style = {'size': 14, 'color': '#383838'}
-    gl2.xlabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.ylabel_style = {'rotation': 0, 'ha': 'center', 'fontsize': 12}
-    gl2.bottom_labels = False
-    gl2.right_labels = False
-    gl2.top_labels = True
-    gl2.left_labels = True
+BORDER_STYLE = {'linestyle': '-', 'linewidth': 1.2, 'edgecolor': 'k', 'alpha': 0.8}
 
 def plot_density_contours(ax, latitudes, longitudes, color):
     """
@@ -95,46 +68,23 @@ def plot_complete_track(df, track_id, ax):
     longitudes = track_data['lon'].values
 
     ax.plot(longitudes, latitudes, linestyle='-', linewidth=2, transform=datacrs, alpha=0.8)
-    gridlines(ax)
-
-def get_cyclone_ids_by_cluster(results_path):
-    json_path = glob(f'{results_path}/kmeans_results*.json')[0]
-    with open(json_path, 'r') as file:
-        cluster_data = json.load(file)
-    
-    cluster_cyclones = {cluster: data['Cyclone IDs'] for cluster, data in cluster_data.items()}
-    return cluster_cyclones
 
 def main():
     os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
 
-    # Read the list of systems to be analyzed
-    selected_systems = get_cyclone_ids_by_cluster(KMEANS_PATH)['Cluster 3']
+    # Rows of the systems of the cluster, from the cluster index and the database store
+    index = load_cluster_index()
+    df = cluster_rows(index, CONFIGURATION, CLUSTER, columns=['track_id', 'lat', 'lon'])
 
-    # Get track files and select for the selected systems
-    track_files = glob(f'{CSV_PATH}/*.csv')
-    track_files = [f for f in track_files if int(os.path.basename(f).split('.')[0].split('_')[-1]) in selected_systems]
+    # Convert longitude to -180 to 180
+    df['lon'] = np.where(df['lon'] > 180, df['lon'] - 360, df['lon'])
 
     # Plot complete tracks for each track_id
     fig, ax = plt.subplots(figsize=(10, 10), subplot_kw={'projection': proj})
-    ax.set_extent([-70, -10, -20, -60], crs=datacrs)
-    for track_file in track_files:
-        # Get track_id
-        track_id = int(os.path.basename(track_file).split('.')[0].split('_')[-1])
-
-        # Read the CSV file
-        df = pd.read_csv(track_file)
-
-        # Select only the selected systems
-        df = df[df['track_id'].isin(selected_systems)]
-
-        # Convert longitude to -180 to 180
-        df['lon'] = np.where(df['lon'] > 180, df['lon'] - 360, df['lon'])
+    draw_basemap(ax, basemap(proj, [-70, -10, -20, -60], features=('coastlines', 'borders', 'states', 'land')),
+                 borders=BORDER_STYLE, states=BORDER_STYLE, land={'color': 'gray', 'alpha': 0.3})
+    for track_id in pd.unique(df['track_id']):
         plot_complete_track(df, track_id, ax)
-    ax.coastlines()
-    ax.add_feature(cfeature.BORDERS, linestyle='-', linewidth=1.2, edgecolor='k', alpha=0.8)
-    ax.add_feature(cfeature.STATES, linestyle='-', linewidth=1.2, edgecolor='k', alpha=0.8)
-    ax.add_feature(cfeature.LAND, color='gray', alpha=0.3)
 
     ax.set_title('Complete tracks for Cluster 3 - Life Cycle: DItMD2', fontsize=16)
 